@@ -0,0 +1,323 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+"""
+Benchmark harness for apply, validate and report stages.
+
+Runs without root: fake sudo, iptables, iptables-restore, iptables-save and
+hping3 executables with configurable latency are put first on PATH. Each stage
+runs in its own child process so its peak RSS can be measured.
+
+Usage:
+    python -m benchmarks.bench --sizes 10 1000 100000 --output bench_results.json
+    python -m benchmarks.bench --compare bench_results.json --output new_results.json
+"""
+import argparse
+import contextlib
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import stat
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+from src.firewall_manager import FirewallManager
+from src.report_generator import ReportGenerator
+from src.rule_validator import RuleValidator
+
+FAKE_EXECUTABLES = {
+    "sudo": 'exec "$@"\n',
+    "iptables": 'sleep "$FAKE_LATENCY"\n',
+    "iptables-restore": 'cat > /dev/null\nsleep "$FAKE_LATENCY"\n',
+    "iptables-save": 'sleep "$FAKE_LATENCY"\necho "*filter"\necho "COMMIT"\n',
+    # Reply with a SYN-ACK for even ports, stay silent for odd ones
+    "hping3": (
+        'sleep "$FAKE_LATENCY"\n'
+        'while [ $# -gt 0 ]; do\n'
+        '  case "$1" in -p|-s) port="$2"; shift;; esac\n'
+        '  shift\n'
+        'done\n'
+        'if [ $((port % 2)) -eq 0 ]; then echo "flags=SA"; fi\n'
+    )
+}
+
+STAGES = ["load", "apply_per_rule", "apply_batch", "validate_dry_run", "validate_hping3",
+          "report", "report_paginated"]
+# Stages that spawn a subprocess per rule
+SUBPROCESS_STAGES = {"apply_per_rule", "validate_hping3"}
+
+
+def generate_rules(count: int, path: str, seed: int = 0) -> None:
+    """
+    Write a rules file with a reproducible mix of directions, protocols and actions.
+    :param count: Number of rules.
+    :param path: Output path.
+    :param seed: Random seed.
+    """
+    rng = random.Random(seed)
+    with open(path, "w") as file:
+        file.write("[\n")
+        for rule_id in range(1, count + 1):
+            rule = {
+                "rule_id": rule_id,
+                "direction": rng.choice(["incoming", "outgoing"]),
+                "protocol": rng.choice(["tcp", "udp"]),
+                "port": rng.randint(1, 65535),
+                "action": rng.choice(["allow", "block"])
+            }
+            file.write(("," if rule_id > 1 else "") + json.dumps(rule) + "\n")
+        file.write("]\n")
+
+
+def install_fake_executables(directory: str, latency: float) -> None:
+    """
+    Create the fake executables and put them first on PATH.
+    :param directory: Directory to create them in.
+    :param latency: Seconds each fake command sleeps.
+    """
+    for name, body in FAKE_EXECUTABLES.items():
+        path = os.path.join(directory, name)
+        with open(path, "w") as file:
+            file.write("#!/bin/sh\n" + body)
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    os.environ["PATH"] = directory + os.pathsep + os.environ["PATH"]
+    os.environ["FAKE_LATENCY"] = str(latency)
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """
+    Nearest-rank percentile.
+    :param values: Samples.
+    :param fraction: Percentile as a fraction, e.g. 0.99.
+    :return: The percentile, or None for no samples.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(fraction * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+def _timed_items(iterator) -> List[float]:
+    """
+    Consume an iterator, recording the time taken to produce each item.
+    :return: Per-item latencies in seconds.
+    """
+    latencies = []
+    start = time.perf_counter()
+    for _ in iterator:
+        now = time.perf_counter()
+        latencies.append(now - start)
+        start = now
+    return latencies
+
+
+def _run_stage(stage: str, rule_file: str, max_probes: int) -> Dict:
+    """
+    Run one stage and time it. Executed in a child process.
+    :return: Number of items, elapsed seconds and per-item latencies.
+    """
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if stage == "load":
+            start = time.perf_counter()
+            manager = FirewallManager(rule_file)
+            return {"items": len(manager.rules), "elapsed": time.perf_counter() - start, "latencies": []}
+
+        if stage == "apply_per_rule":
+            manager = FirewallManager(rule_file)
+            apply_rule = manager.apply_rule
+            latencies = []
+
+            def timed_apply_rule(rule):
+                began = time.perf_counter()
+                apply_rule(rule)
+                latencies.append(time.perf_counter() - began)
+
+            manager.apply_rule = timed_apply_rule
+            start = time.perf_counter()
+            manager.apply_all_rules()
+            return {"items": len(manager.rules), "elapsed": time.perf_counter() - start, "latencies": latencies}
+
+        if stage == "apply_batch":
+            manager = FirewallManager(rule_file)
+            start = time.perf_counter()
+            manager.apply_all_rules(batch=True)
+            return {"items": len(manager.rules), "elapsed": time.perf_counter() - start, "latencies": []}
+
+        if stage in ("validate_dry_run", "validate_hping3"):
+            validator = RuleValidator(rule_file, max_in_flight=max_probes, dry_run=stage == "validate_dry_run")
+            start = time.perf_counter()
+            latencies = _timed_items(validator.iter_validate_rules())
+            return {"items": len(latencies), "elapsed": time.perf_counter() - start, "latencies": latencies}
+
+        # Report stages render dry-run results; producing them is not timed
+        results = RuleValidator(rule_file, dry_run=True).validate_rules()
+        start = time.perf_counter()
+        if stage == "report":
+            ReportGenerator.generate_html_report(results, "reports/benchmark_report.html")
+        else:
+            ReportGenerator.generate_paginated_report(iter(results), "reports/benchmark_report.html")
+        return {"items": len(results), "elapsed": time.perf_counter() - start, "latencies": []}
+
+
+def _stage_worker(stage: str, rule_file: str, max_probes: int, connection) -> None:
+    """
+    Child process entry point: run a stage and send back its measurements.
+    """
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    measurement = _run_stage(stage, rule_file, max_probes)
+    measurement["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    measurement["rss_growth_kb"] = measurement["peak_rss_kb"] - baseline
+    connection.send(measurement)
+    connection.close()
+
+
+def run_stage(stage: str, rules: int, rule_file: str, max_probes: int) -> Dict:
+    """
+    Run a stage in a fresh child process and summarize it.
+    :return: Benchmark record for the stage.
+    """
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_stage_worker, args=(stage, rule_file, max_probes, sender))
+    process.start()
+    sender.close()
+    try:
+        measurement = receiver.recv()
+    except EOFError:
+        process.join()
+        raise Exception(f"Benchmark stage {stage} failed with exit code {process.exitcode}")
+    process.join()
+
+    latencies = measurement["latencies"] or [measurement["elapsed"]]
+    return {
+        "stage": stage,
+        "rules": rules,
+        "items": measurement["items"],
+        "elapsed_s": measurement["elapsed"],
+        "throughput_per_s": measurement["items"] / measurement["elapsed"] if measurement["elapsed"] else None,
+        "latency_unit": "item" if measurement["latencies"] else "run",
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "peak_rss_kb": measurement["peak_rss_kb"],
+        "rss_growth_kb": measurement["rss_growth_kb"]
+    }
+
+
+def compare(previous: Dict, current: Dict, threshold: float) -> List[str]:
+    """
+    Find stages whose throughput dropped by more than threshold.
+    :param previous: Earlier benchmark output.
+    :param current: New benchmark output.
+    :param threshold: Allowed relative drop, e.g. 0.1 for 10%.
+    :return: Human-readable regression descriptions.
+    """
+    before = {(r["stage"], r["rules"]): r for r in previous["results"] if r.get("throughput_per_s")}
+    regressions = []
+    for record in current["results"]:
+        old = before.get((record["stage"], record["rules"]))
+        if old is None or not record.get("throughput_per_s"):
+            continue
+        change = record["throughput_per_s"] / old["throughput_per_s"] - 1
+        if change < -threshold:
+            regressions.append(f"{record['stage']} ({record['rules']} rules): throughput "
+                               f"{old['throughput_per_s']:.1f}/s -> {record['throughput_per_s']:.1f}/s "
+                               f"({change:+.1%})")
+    return regressions
+
+
+def print_table(records: List[Dict], header: bool = True) -> None:
+    """
+    Print benchmark records as a table.
+    """
+    if header:
+        print(f"{'stage':<18} {'rules':>7} {'items/s':>12} {'p50 ms':>10} {'p99 ms':>10} {'peak RSS MB':>12}")
+    for r in records:
+        if r.get("skipped"):
+            print(f"{r['stage']:<18} {r['rules']:>7} {'skipped':>12}")
+            continue
+        print(f"{r['stage']:<18} {r['rules']:>7} {r['throughput_per_s']:>12.1f} {r['p50_ms']:>10.3f} "
+              f"{r['p99_ms']:>10.3f} {r['peak_rss_kb'] / 1024:>12.1f}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark apply, validate and report stages")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 100000],
+                        help="Rule set sizes to generate.")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES, help="Stages to run.")
+    parser.add_argument("--latency", type=float, default=0.001,
+                        help="Seconds each fake iptables/hping3 call sleeps.")
+    parser.add_argument("--max-probes", type=int, default=1, help="Concurrent probes for validate_hping3.")
+    parser.add_argument("--max-subprocess-rules", type=int, default=1000,
+                        help="Skip per-rule subprocess stages for larger rule sets.")
+    parser.add_argument("--output", default="bench_results.json", help="Where to save the results as JSON.")
+    parser.add_argument("--compare", help="Earlier results JSON to check for regressions.")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Relative throughput drop reported as a regression.")
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output)
+    previous = None
+    if args.compare:
+        with open(args.compare) as file:
+            previous = json.load(file)
+
+    records = []
+    with tempfile.TemporaryDirectory() as workdir:
+        bin_dir = os.path.join(workdir, "bin")
+        os.makedirs(bin_dir)
+        install_fake_executables(bin_dir, args.latency)
+        os.makedirs(os.path.join(workdir, "reports"))
+        os.chdir(workdir)  # logs/ and reports/ are written relative to the working directory
+        print_table([])
+
+        for size in args.sizes:
+            rule_file = os.path.join(workdir, f"rules_{size}.json")
+            generate_rules(size, rule_file)
+            for stage in args.stages:
+                if stage in SUBPROCESS_STAGES and size > args.max_subprocess_rules:
+                    records.append({"stage": stage, "rules": size, "skipped": True})
+                else:
+                    records.append(run_stage(stage, size, rule_file, args.max_probes))
+                print_table(records[-1:], header=False)
+
+    current = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "latency_s": args.latency,
+            "max_probes": args.max_probes
+        },
+        "results": records
+    }
+    with open(output, "w") as file:
+        json.dump(current, file, indent=2)
+    print(f"\nResults saved: {output}")
+
+    if previous is not None:
+        regressions = compare(previous, current, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
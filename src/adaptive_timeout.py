@@ -0,0 +1,85 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import math
+import threading
+from bisect import bisect_left, insort
+from collections import deque
+from typing import Dict, Hashable
+
+
+class AdaptiveTimeout:
+    """Per-target probe deadlines learned from observed reply round-trip times."""
+
+    def __init__(self, factor: float = 4.0, min_timeout: float = 0.01, max_timeout: float = 1.0,
+                 retries: int = 1, window: int = 1000, min_samples: int = 10):
+        """
+        Initialize AdaptiveTimeout.
+        :param factor: Deadline as a multiple of the p99 round-trip time.
+        :param min_timeout: Lower bound for a deadline in seconds.
+        :param max_timeout: Upper bound in seconds, also used until enough replies are seen.
+        :param retries: Extra attempts for a probe that met only silence. Each
+                        retry doubles the deadline; none follows a wait of max_timeout.
+        :param window: Number of recent round-trip times kept per target.
+        :param min_samples: Replies needed before deadlines are learned.
+        """
+        if retries < 0:
+            raise ValueError("retries must not be negative")
+        self.factor = factor
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.retries = retries
+        self.window = window
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        # target -> (samples in arrival order, the same samples sorted)
+        self._samples: Dict[Hashable, tuple] = {}
+
+    def record(self, target: Hashable, rtt: float) -> None:
+        """
+        Add the round-trip time of a reply.
+        :param target: Whatever identifies the path probed, e.g. an address.
+        :param rtt: Seconds from sending the probe to its reply.
+        """
+        with self._lock:
+            recent, ordered = self._samples.setdefault(target, (deque(), []))
+            recent.append(rtt)
+            insort(ordered, rtt)
+            if len(recent) > self.window:
+                del ordered[bisect_left(ordered, recent.popleft())]
+
+    def percentile(self, target: Hashable, fraction: float) -> float:
+        """
+        Nearest-rank percentile of the recorded round-trip times.
+        :return: Seconds, or None before any reply was seen.
+        """
+        with self._lock:
+            ordered = self._samples.get(target, (None, []))[1]
+            if not ordered:
+                return None
+            return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+    def deadline(self, target: Hashable, attempt: int = 0) -> float:
+        """
+        Seconds to wait for a reply before treating a probe as silent.
+        :param target: Path being probed.
+        :param attempt: 0 for the first try, 1 for the first retry and so on.
+        :return: Deadline in seconds.
+        """
+        with self._lock:
+            count = len(self._samples.get(target, (None, []))[1])
+        if count < self.min_samples:
+            return self.max_timeout
+        deadline = max(self.percentile(target, 0.99) * self.factor, self.min_timeout)
+        return min(deadline * 2 ** attempt, self.max_timeout)
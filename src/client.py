@@ -0,0 +1,111 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import argparse
+import json
+import socket
+import sys
+from typing import Dict, Optional
+
+# Kept free of heavy imports so a client call costs little more than interpreter startup.
+DEFAULT_SOCKET = "run/firewall_tester.sock"
+
+
+def request(command: str, options: Optional[Dict] = None, socket_path: str = DEFAULT_SOCKET,
+            timeout: Optional[float] = None) -> Dict:
+    """
+    Send one request to a running validation daemon.
+    :param command: 'validate', 'apply', 'report', 'status' or 'shutdown'.
+    :param options: Keyword options for the command.
+    :param socket_path: Unix socket the daemon listens on.
+    :param timeout: Seconds to wait for the response; None waits indefinitely.
+    :return: The command's result.
+    """
+    message = json.dumps({"command": command, "options": options or {}}).encode() + b"\n"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            raise Exception(f"No daemon listening on {socket_path}: {e}")
+        sock.sendall(message)
+        with sock.makefile("rb") as reader:
+            line = reader.readline()
+    if not line:
+        raise Exception("Daemon closed the connection without a response")
+    response = json.loads(line)
+    if not response["ok"]:
+        raise Exception(response["error"])
+    return response["result"]
+
+
+def main(argv=None) -> int:
+    """
+    Command-line client for the validation daemon.
+    :return: Exit code: 0 on success, 1 if any rule failed validation, 2 on errors.
+    """
+    parser = argparse.ArgumentParser(description="Client for the Automated Firewall Rule Tester daemon")
+    parser.add_argument("command", choices=["validate", "apply", "report", "status", "shutdown"])
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket the daemon listens on.")
+    parser.add_argument("--dry-run", action="store_true", help="validate: evaluate the compiled policy only.")
+    parser.add_argument("--probe-backend", choices=["hping3", "raw"], default="hping3",
+                        help="validate: traffic probe backend.")
+    parser.add_argument("--max-probes", type=int, default=1, help="validate: concurrent probes.")
+    parser.add_argument("--plan-probes", action="store_true", help="validate: one probe per port class.")
+    parser.add_argument("--namespaces", type=int, default=0, help="validate: network namespace shards.")
+    parser.add_argument("--attribute-hits", action="store_true",
+                        help="validate: report the kernel rule each probe matched.")
+    parser.add_argument("--report", action="store_true", help="validate: also write the HTML report.")
+    parser.add_argument("--page-size", type=int, default=0, help="validate/report: results per report page.")
+    parser.add_argument("--batch", action="store_true", help="apply: load all rules in one transaction.")
+    parser.add_argument("--reconcile", action="store_true", help="apply: apply only the difference.")
+    parser.add_argument("--optimize", action="store_true", help="apply: load a verdict-equivalent smaller list.")
+    parser.add_argument("--reorder-by-hits", action="store_true", help="apply: reorder by packet counters.")
+    parser.add_argument("--firewall-backend", choices=["iptables", "nftables"], default="iptables",
+                        help="apply: firewall backend.")
+    parser.add_argument("--json", action="store_true", help="Print the raw JSON result.")
+    args = parser.parse_args(argv)
+
+    options = {
+        "validate": {"dry_run": args.dry_run, "probe_backend": args.probe_backend,
+                     "max_probes": args.max_probes, "plan_probes": args.plan_probes,
+                     "namespaces": args.namespaces, "report": args.report, "page_size": args.page_size,
+                     "attribute_hits": args.attribute_hits},
+        "apply": {"batch": args.batch, "reconcile": args.reconcile, "optimize": args.optimize,
+                  "reorder_by_hits": args.reorder_by_hits, "firewall_backend": args.firewall_backend},
+        "report": {"page_size": args.page_size},
+    }.get(args.command, {})
+
+    try:
+        result = request(args.command, options, args.socket)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    elif args.command == "validate":
+        for item in result["results"]:
+            if item["status"] != "pass":
+                print(f"Rule {item['rule_id']}: {item['status']} "
+                      f"(expected {item['expected_action']}, observed {item['observed_action']})")
+        print(f"Passed: {result['passed']}, Failed: {result['failed']}")
+    else:
+        for key, value in result.items():
+            print(f"{key}: {value}")
+    return 1 if args.command == "validate" and result["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Optional
+from src import metrics
+from src.adaptive_timeout import AdaptiveTimeout
+from src.client import DEFAULT_SOCKET
+from src.firewall_manager import FirewallManager
+from src.logger import setup_logger
+from src.packet_capture import PacketCapture
+from src.probe_cache import ProbeCache
+from src.report_generator import ReportGenerator
+from src.rule_validator import RuleValidator
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Answer newline-delimited JSON requests until the client disconnects."""
+
+    def handle(self):
+        for line in self.rfile:
+            response = self.server.daemon.handle_message(line)
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class _Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class ValidationDaemon:
+    """Class to serve validate/apply/report requests from warm, reused state."""
+
+    def __init__(self, rule_file: str, socket_path: str = DEFAULT_SOCKET,
+                 report_file: str = "reports/validation_report.html", cache: Optional[ProbeCache] = None,
+                 timing: Optional[AdaptiveTimeout] = None, capture: Optional[PacketCapture] = None):
+        """
+        Initialize ValidationDaemon.
+        :param rule_file: Path to the JSON file with firewall rules. It is parsed
+                          again only when it changes.
+        :param socket_path: Unix socket to listen on; only its owner may connect.
+        :param report_file: Path of the HTML report written on request.
+        :param cache: Probe result cache shared by every request.
+        :param timing: Adaptive probe deadlines shared by every request, so RTT
+                       statistics carry over between requests.
+        :param capture: Packet capture shared by every request, attaching per-probe
+                        evidence to results. Not used for namespace sandboxes.
+        """
+        self.rule_file = rule_file
+        self.socket_path = socket_path
+        self.report_file = report_file
+        self.cache = cache
+        self.timing = timing
+        self.capture = capture
+        self.server = None
+        self.started = time.monotonic()
+        self.requests = 0
+        self.last_results = None
+        self.last_findings = []
+        self._lock = threading.Lock()
+        self._firewall_lock = threading.Lock()
+        self._report_lock = threading.Lock()
+        self._idle_validators = defaultdict(list)
+        self.logger = setup_logger("ValidationDaemon", "logs/validation.log")
+
+    def bind(self) -> None:
+        """
+        Listen on the Unix socket, replacing a stale socket file left by a
+        daemon that did not shut down cleanly.
+        """
+        directory = os.path.dirname(self.socket_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.socket_path):
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                try:
+                    probe.connect(self.socket_path)
+                except ConnectionRefusedError:
+                    os.unlink(self.socket_path)
+                else:
+                    raise Exception(f"A daemon is already listening on {self.socket_path}")
+        self.server = _Server(self.socket_path, _RequestHandler)
+        self.server.daemon = self
+        os.chmod(self.socket_path, 0o600)
+        self.logger.info(f"Listening on {self.socket_path}")
+
+    def serve_forever(self) -> None:
+        """
+        Serve requests until shut down, then remove the socket.
+        """
+        if self.server is None:
+            self.bind()
+        try:
+            self.server.serve_forever()
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """
+        Stop listening and remove the socket file.
+        """
+        if self.server is not None:
+            self.server.server_close()
+            self.server = None
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def handle_message(self, line: bytes) -> Dict:
+        """
+        Decode one request line and run it.
+        :param line: JSON object with 'command' and optional 'options'.
+        :return: {'ok': True, 'result': ...} or {'ok': False, 'error': ...}.
+        """
+        try:
+            message = json.loads(line)
+            return {"ok": True, "result": self.handle(message["command"], message.get("options", {}))}
+        except Exception as e:
+            self.logger.error(f"Request failed: {e}")
+            return {"ok": False, "error": str(e)}
+
+    def handle(self, command: str, options: Dict) -> Dict:
+        """
+        Run one command.
+        :param command: 'validate', 'apply', 'report', 'status' or 'shutdown'.
+        :param options: Keyword arguments for the command.
+        :return: The command's result.
+        """
+        handlers = {"validate": self.validate, "apply": self.apply, "report": self.report,
+                    "status": self.status, "shutdown": self.shutdown}
+        if command not in handlers:
+            raise ValueError(f"Unknown command: {command}")
+        with self._lock:
+            self.requests += 1
+        metrics.increment("daemon_requests")
+        with metrics.span(f"daemon.{command}"):
+            return handlers[command](**options)
+
+    def validate(self, dry_run: bool = False, probe_backend: str = "hping3", max_probes: int = 1,
+                 plan_probes: bool = False, namespaces: int = 0, report: bool = False,
+                 page_size: int = 0, attribute_hits: bool = False) -> Dict:
+        """
+        Validate the rules with a validator kept from an earlier request with the
+        same options, so parsed rules, the compiled policy and probe sockets are reused.
+        Concurrent requests each get their own validator.
+        :return: Results, analysis findings and pass/fail counts.
+        """
+        key = (dry_run, probe_backend, max_probes, plan_probes, namespaces, attribute_hits)
+        with self._lock:
+            idle = self._idle_validators[key]
+            validator = idle.pop() if idle else None
+        if validator is None:
+            validator = RuleValidator(self.rule_file, max_in_flight=max_probes, probe_backend=probe_backend,
+                                      dry_run=dry_run, cache=self.cache, namespaces=namespaces,
+                                      plan_probes=plan_probes, timing=self.timing,
+                                      capture=None if namespaces else self.capture,
+                                      attribute_hits=attribute_hits)
+        try:
+            results = validator.validate_rules()
+            findings = list(validator.findings)
+        finally:
+            with self._lock:
+                self._idle_validators[key].append(validator)
+
+        with self._lock:
+            self.last_results, self.last_findings = results, findings
+        if report:
+            self._write_report(results, findings, page_size)
+        failed = sum(1 for result in results if result["status"] != "pass")
+        return {"results": results, "findings": findings, "passed": len(results) - failed, "failed": failed}
+
+    def apply(self, batch: bool = False, reconcile: bool = False, optimize: bool = False,
+              reorder_by_hits: bool = False, firewall_backend: str = "iptables") -> Dict:
+        """
+        Load the rules into the firewall. Requests are applied one at a time.
+        :return: Number of rules loaded, per-phase timings and optimizer statistics.
+        """
+        with self._firewall_lock:
+            manager = FirewallManager(self.rule_file, backend=firewall_backend)
+            stats = manager.optimize_rules(use_counters=reorder_by_hits) if optimize else None
+            timings = manager.reconcile_rules() if reconcile else manager.apply_all_rules(batch=batch)
+        return {"rules": len(manager.rules), "timings": timings, "optimized": stats}
+
+    def report(self, page_size: int = 0) -> Dict:
+        """
+        Write the HTML report for the most recent validation.
+        :return: Path of the report.
+        """
+        with self._lock:
+            results, findings = self.last_results, self.last_findings
+        if results is None:
+            raise Exception("No validation has been run yet")
+        return {"report": self._write_report(results, findings, page_size)}
+
+    def status(self) -> Dict:
+        """
+        Describe the running daemon.
+        :return: Process id, uptime, request count and number of warm validators.
+        """
+        with self._lock:
+            return {"pid": os.getpid(), "uptime": round(time.monotonic() - self.started, 3),
+                    "requests": self.requests, "rule_file": self.rule_file,
+                    "validators": sum(len(idle) for idle in self._idle_validators.values())}
+
+    def shutdown(self) -> Dict:
+        """
+        Stop serving once the current requests are answered.
+        """
+        threading.Thread(target=self.server.shutdown, daemon=True).start()
+        return {"stopping": True}
+
+    def _write_report(self, results, findings, page_size: int) -> str:
+        """
+        Render the report; concurrent requests take turns writing the file.
+        :return: Path of the report.
+        """
+        directory = os.path.dirname(self.report_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._report_lock:
+            if page_size:
+                ReportGenerator.generate_paginated_report(iter(results), self.report_file, page_size, findings)
+            else:
+                ReportGenerator.generate_html_report(results, self.report_file, findings)
+        return self.report_file
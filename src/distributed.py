@@ -0,0 +1,392 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Sequence, Tuple
+from src import metrics
+from src.adaptive_timeout import AdaptiveTimeout
+from src.logger import setup_logger
+from src.packet_capture import PacketCapture
+from src.rule_analyzer import RuleAnalyzer
+from src.rule_compiler import CompiledPolicy
+from src.rule_loader import RuleLoader
+from src.rule_validator import RuleValidator
+from src.traffic_simulator import LOCAL_ADDRESS, TrafficSimulator
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    """
+    Split a HOST:PORT string.
+    :return: (host, port); the host defaults to all interfaces.
+    """
+    host, _, port = address.rpartition(":")
+    if not port.isdigit():
+        raise ValueError(f"Expected HOST:PORT, got {address!r}")
+    return host or "0.0.0.0", int(port)
+
+
+def _send(sock: socket.socket, message: Dict) -> None:
+    sock.sendall(json.dumps(message).encode() + b"\n")
+
+
+class _WorkerHandler(socketserver.StreamRequestHandler):
+    """Feed shards to one connected worker until none are left."""
+
+    def handle(self):
+        self.server.coordinator.serve_worker(self.connection, self.rfile)
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class Coordinator:
+    """Class to split a rule file into shards and validate them on worker agents."""
+
+    def __init__(self, rule_file: str, address: Tuple[str, int] = ("127.0.0.1", 0), shard_size: int = 100,
+                 dry_run: bool = False, max_attempts: int = 3, shard_timeout: float = 600.0):
+        """
+        Initialize Coordinator.
+        :param rule_file: Path to the JSON file with firewall rules.
+        :param address: (host, port) workers connect to; port 0 picks a free port.
+                        The protocol is unauthenticated, so listen on a trusted network only.
+        :param shard_size: Number of rules handed to a worker at a time.
+        :param dry_run: Have workers take observed actions from the compiled policy.
+        :param max_attempts: Give up once a shard has been lost this many times.
+        :param shard_timeout: Seconds a worker may take for one shard before it is
+                              disconnected and the shard is retried elsewhere.
+        """
+        if shard_size < 1:
+            raise ValueError("shard_size must be at least 1")
+        self.rule_file = rule_file
+        self.address = address
+        self.shard_size = shard_size
+        self.dry_run = dry_run
+        self.max_attempts = max_attempts
+        self.shard_timeout = shard_timeout
+        self.findings = []
+        self.server = None
+        self.workers = {}  # name -> number of shards completed
+        self._shards = []
+        self._pending = deque()
+        self._running = {}  # shard -> [started, copies]
+        self._results = {}
+        self._attempts = {}
+        self._durations = []
+        self._connections = set()
+        self._error = None
+        self._condition = threading.Condition()
+        self.logger = setup_logger("Coordinator", "logs/validation.log")
+
+    def bind(self) -> Tuple[str, int]:
+        """
+        Listen for workers.
+        :return: The (host, port) actually bound.
+        """
+        self.server = _Server(self.address, _WorkerHandler)
+        self.server.coordinator = self
+        self.address = self.server.server_address[:2]
+        self.logger.info(f"Listening for workers on {self.address[0]}:{self.address[1]}")
+        return self.address
+
+    def prepare(self) -> int:
+        """
+        Load, analyze and compile the rules, and split them into shards. Policy
+        actions are computed here over the whole policy, so shards are independent.
+        :return: Number of shards.
+        """
+        loader = RuleLoader(self.rule_file)
+        with metrics.span("rules.load"):
+            rules = loader.load()
+        for error in loader.errors:
+            self.logger.error(f"Skipping invalid rule at line {error['line']}: {error['message']}")
+        with metrics.span("rules.analyze"):
+            self.findings = RuleAnalyzer(rules).analyze()
+        for finding in self.findings:
+            self.logger.warning(f"Rule {finding['rule_id']} is {finding['type']} "
+                                f"(related rules: {finding['related_rule_ids']})")
+        with metrics.span("rules.compile"):
+            policy_actions = CompiledPolicy(rules, source=LOCAL_ADDRESS,
+                                            destination=LOCAL_ADDRESS).evaluate_rules(rules)
+        self._shards = [(rules[start:start + self.shard_size], policy_actions[start:start + self.shard_size])
+                        for start in range(0, len(rules), self.shard_size)]
+        with self._condition:
+            self._pending = deque(range(len(self._shards)))
+            self._running, self._results, self._durations, self._error = {}, {}, [], None
+            self._attempts = {shard: 0 for shard in self._pending}
+        return len(self._shards)
+
+    def spawn_local_workers(self, count: int, args: Sequence[str] = ()) -> List[subprocess.Popen]:
+        """
+        Start worker processes on this machine.
+        :param args: Extra command-line options for the workers, e.g. probe settings.
+        :return: The worker processes.
+        """
+        host, port = self.address
+        host = "127.0.0.1" if host in ("0.0.0.0", "") else host
+        return [subprocess.Popen([sys.executable, "-m", "src.main", "--worker", f"{host}:{port}",
+                                  "--worker-name", f"local-{index}", *args])
+                for index in range(count)]
+
+    def run(self, local_workers: int = 0, worker_args: Sequence[str] = (),
+            timeout: Optional[float] = None) -> List[Dict]:
+        """
+        Validate every shard on the connected workers.
+        :param local_workers: Also start this many worker processes on this machine.
+        :param worker_args: Extra command-line options for the local workers.
+        :param timeout: Give up after this many seconds; None waits for workers indefinitely.
+        :return: Validation results in rule order.
+        """
+        if self.server is None:
+            self.bind()
+        count = self.prepare()
+        self.logger.info(f"Validating {sum(len(rules) for rules, _ in self._shards)} rules in {count} shards")
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        processes = self.spawn_local_workers(local_workers, worker_args) if local_workers else []
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            with metrics.span("distributed.run"), self._condition:
+                while len(self._results) < count and self._error is None:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        raise Exception(f"Timed out with {count - len(self._results)} of {count} shards unfinished")
+                    if processes and not self._connections and all(p.poll() is not None for p in processes):
+                        raise Exception("All local workers exited before validation finished")
+                    self._condition.wait(1.0)
+                if self._error is not None:
+                    raise Exception(self._error)
+            # Keep serving until local workers have connected and been told to stop
+            for process in processes:
+                try:
+                    process.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    pass
+        finally:
+            self.close()
+            for process in processes:
+                if process.poll() is None:
+                    process.terminate()
+                    process.wait()
+        return [result for shard in range(count) for result in self._results[shard]]
+
+    def close(self) -> None:
+        """
+        Stop accepting workers and disconnect the ones still busy, such as
+        stragglers whose shards were finished elsewhere.
+        """
+        if self.server is None:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.server = None
+        with self._condition:
+            if self._error is None and len(self._results) < len(self._shards):
+                self._error = "Coordinator stopped"
+            self._condition.notify_all()
+            connections = list(self._connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def serve_worker(self, connection: socket.socket, reader) -> None:
+        """
+        Hand shards to one worker, one at a time, until none are left or the
+        worker fails. A failed shard goes back to the queue.
+        :param connection: Socket of the worker.
+        :param reader: Buffered reader over the socket.
+        """
+        connection.settimeout(self.shard_timeout)
+        with self._condition:
+            self._connections.add(connection)
+            self._condition.notify_all()
+        try:
+            line = reader.readline()
+            if not line:
+                return
+            peer = "%s:%s" % connection.getpeername()[:2]
+            name = json.loads(line).get("worker") or peer
+            self.logger.info(f"Worker {name} connected from {peer}")
+            while True:
+                shard = self._next_shard()
+                if shard is None:
+                    _send(connection, {"type": "done"})
+                    return
+                rules, policy_actions = self._shards[shard]
+                started = time.monotonic()
+                try:
+                    _send(connection, {"type": "shard", "shard": shard, "dry_run": self.dry_run,
+                                       "rules": rules, "policy_actions": policy_actions})
+                    line = reader.readline()
+                    if not line:
+                        raise ConnectionError("worker disconnected")
+                    reply = json.loads(line)
+                    if "error" in reply:
+                        raise Exception(reply["error"])
+                    if reply.get("shard") != shard or len(reply["results"]) != len(rules):
+                        raise Exception("worker returned results for the wrong shard")
+                except Exception as e:
+                    self._fail(shard, name, e)
+                    return
+                self._complete(shard, name, reply["results"], time.monotonic() - started)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Worker connection failed: {e}")
+        finally:
+            with self._condition:
+                self._connections.discard(connection)
+                self._condition.notify_all()
+
+    def _next_shard(self) -> Optional[int]:
+        """
+        Take the next queued shard. Once the queue is empty, an idle worker takes
+        a copy of a shard that has run for twice the average shard time on
+        another worker; whichever copy finishes first is kept.
+        :return: Shard index, or None when every shard is finished.
+        """
+        with self._condition:
+            while True:
+                if self._error is not None or len(self._results) == len(self._shards):
+                    return None
+                if self._pending:
+                    shard = self._pending.popleft()
+                    self._running[shard] = [time.monotonic(), 1]
+                    metrics.increment("shards_dispatched")
+                    return shard
+                wait = None
+                if self._durations:
+                    threshold = 2 * sum(self._durations) / len(self._durations)
+                    now = time.monotonic()
+                    stragglers = sorted((started, shard) for shard, (started, copies) in self._running.items()
+                                        if copies == 1)
+                    if stragglers:
+                        started, shard = stragglers[0]
+                        if now - started >= threshold:
+                            self._running[shard][1] += 1
+                            metrics.increment("shards_stolen")
+                            self.logger.info(f"Stealing slow shard {shard}")
+                            return shard
+                        wait = started + threshold - now
+                self._condition.wait(wait)
+
+    def _complete(self, shard: int, worker: str, results: List[Dict], duration: float) -> None:
+        with self._condition:
+            self.workers[worker] = self.workers.get(worker, 0) + 1
+            self._durations.append(duration)
+            if shard not in self._results:
+                self._results[shard] = results
+                self._running.pop(shard, None)
+            self._condition.notify_all()
+
+    def _fail(self, shard: int, worker: str, error: Exception) -> None:
+        self.logger.warning(f"Worker {worker} failed shard {shard}: {error}")
+        with self._condition:
+            if shard in self._results:
+                return
+            self._running[shard][1] -= 1
+            if self._running[shard][1] == 0:
+                del self._running[shard]
+                self._attempts[shard] += 1
+                if self._attempts[shard] >= self.max_attempts:
+                    self._error = f"Shard {shard} failed {self._attempts[shard]} times; last error: {error}"
+                else:
+                    self._pending.appendleft(shard)
+                    metrics.increment("shards_retried")
+            self._condition.notify_all()
+
+
+class Worker:
+    """Class to validate shards handed out by a coordinator with a local TrafficSimulator."""
+
+    def __init__(self, address: Tuple[str, int], name: Optional[str] = None, probe_backend: str = "hping3",
+                 max_in_flight: int = 1, timing: Optional[AdaptiveTimeout] = None,
+                 capture: Optional[PacketCapture] = None, connect_timeout: float = 30.0):
+        """
+        Initialize Worker.
+        :param address: (host, port) of the coordinator.
+        :param name: Name the coordinator logs this worker under; defaults to host name and pid.
+        :param probe_backend: TrafficSimulator backend ('hping3' or 'raw').
+        :param max_in_flight: Maximum number of traffic probes running concurrently.
+        :param timing: Adaptive probe deadlines shared by every shard.
+        :param capture: Capture probe traffic and attach per-probe evidence to results.
+        :param connect_timeout: Seconds to keep retrying while the coordinator is not up yet.
+        """
+        self.address = address
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.probe_backend = probe_backend
+        self.max_in_flight = max_in_flight
+        self.timing = timing
+        self.capture = capture
+        self.connect_timeout = connect_timeout
+        self._simulator = None
+        self.logger = setup_logger("Worker", "logs/validation.log")
+
+    def run(self) -> int:
+        """
+        Validate shards until the coordinator has no more.
+        :return: Number of shards validated.
+        """
+        shards = 0
+        try:
+            with self._connect() as sock, sock.makefile("rb") as reader:
+                _send(sock, {"worker": self.name})
+                for line in reader:
+                    message = json.loads(line)
+                    if message["type"] == "done":
+                        break
+                    try:
+                        results = self._validate(message)
+                        reply = {"shard": message["shard"], "results": results}
+                    except Exception as e:
+                        self.logger.error(f"Shard {message['shard']} failed: {e}")
+                        reply = {"shard": message["shard"], "error": str(e)}
+                    _send(sock, reply)
+                    shards += 1
+        finally:
+            if self._simulator is not None:
+                self._simulator.close()
+                self._simulator = None
+        self.logger.info(f"Validated {shards} shards")
+        return shards
+
+    def _connect(self) -> socket.socket:
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                return socket.create_connection(self.address)
+            except OSError as e:
+                if time.monotonic() >= deadline:
+                    raise Exception(f"Cannot reach coordinator at {self.address[0]}:{self.address[1]}: {e}")
+                time.sleep(0.2)
+
+    def _validate(self, message: Dict) -> List[Dict]:
+        """
+        Validate the shard in a coordinator message. Probing shards share one simulator.
+        :return: Validation results in rule order.
+        """
+        if not message["dry_run"] and self._simulator is None:
+            self._simulator = TrafficSimulator(backend=self.probe_backend, timing=self.timing, capture=self.capture)
+        validator = RuleValidator.from_rules(message["rules"], message["policy_actions"], simulator=self._simulator,
+                                             max_in_flight=self.max_in_flight, probe_backend=self.probe_backend,
+                                             dry_run=message["dry_run"], timing=self.timing, capture=self.capture)
+        return validator.validate_rules()
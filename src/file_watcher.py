@@ -0,0 +1,129 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import ctypes
+import os
+import select
+import struct
+import time
+from typing import Optional
+
+# inotify(7) event masks
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class FileWatcher:
+    """Class to wait for a file to change, using inotify where available."""
+
+    def __init__(self, path: str, debounce: float = 0.05, poll_interval: float = 0.5):
+        """
+        Start watching a file. Its directory is watched, so saves that replace
+        the file by renaming a temporary file over it are seen too.
+        :param path: File to watch.
+        :param debounce: Quiet period that ends a burst of events from one save.
+        :param poll_interval: Seconds between checks when inotify is unavailable.
+        """
+        self.path = path
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self._name = os.path.basename(path).encode()
+        self._stamp = self._stat()
+        self._fd = self._inotify(os.path.dirname(os.path.abspath(path)))
+
+    @staticmethod
+    def _inotify(directory: str) -> Optional[int]:
+        """
+        Open an inotify descriptor watching a directory for finished writes and renames.
+        :return: File descriptor, or None if inotify is not available.
+        """
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        if libc.inotify_add_watch(fd, directory.encode(), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            os.close(fd)
+            return None
+        return fd
+
+    def _stat(self):
+        """
+        Identify the file's current version for polling.
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _read_events(self) -> bool:
+        """
+        Read pending inotify events.
+        :return: True if any of them is for the watched file.
+        """
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return False
+        matched = False
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            matched = matched or data[offset:offset + length].rstrip(b"\0") == self._name
+            offset += length
+        return matched
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until the file changes.
+        :param timeout: Seconds to wait; None waits indefinitely.
+        :return: True if the file changed, False on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if self._fd is None:
+                time.sleep(self.poll_interval if remaining is None else min(self.poll_interval, remaining))
+                stamp = self._stat()
+                changed = stamp != self._stamp
+                self._stamp = stamp
+            else:
+                ready, _, _ = select.select([self._fd], [], [], remaining)
+                changed = bool(ready) and self._read_events()
+            if changed:
+                # Let multi-step saves finish, then swallow the rest of the burst
+                while self._fd is not None and select.select([self._fd], [], [], self.debounce)[0]:
+                    self._read_events()
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+
+    def close(self) -> None:
+        """
+        Stop watching.
+        """
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -13,18 +13,42 @@
 # You should have received a copy of the GNU General Public License
 # along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
 import subprocess
+import hashlib
 import json
-from typing import List, Dict
+import re
+import time
+from collections import defaultdict, deque
+from difflib import SequenceMatcher
+from typing import List, Dict, Optional, Tuple
+from src import metrics
+from src.nftables_backend import NFT_CHAINS, TABLE, build_ruleset, build_statement
+from src.rule_loader import RuleLoader
+from src.rule_optimizer import RuleOptimizer
+from src.rule_model import format_port, iptables_port, port_bounds, rule_networks
+
+CHAINS = {"incoming": "INPUT", "outgoing": "OUTPUT"}
+# Chains of the tester's own, jumped to first from CHAINS, for runs that must leave other rules alone
+TESTER_CHAINS = {"incoming": "firewall_tester_input", "outgoing": "firewall_tester_output"}
+FIREWALL_BACKENDS = ("iptables", "nftables")
+# 'counter packets 3 bytes 180' statements in 'nft list' output
+NFT_COUNTER = re.compile(r"counter packets \d+ bytes \d+")
 
 class FirewallManager:
     """Class to manage firewall rules using iptables."""
 
-    def __init__(self, rule_file: str):
+    def __init__(self, rule_file: str, netns: Optional[str] = None, backend: str = "iptables"):
         """
         Initialize FirewallManager with the path to a JSON file containing rules.
         :param rule_file: Path to the JSON file with firewall rules.
+        :param netns: Manage the firewall of this network namespace instead of the host's.
+        :param backend: 'iptables' for INPUT/OUTPUT chain rules, or 'nftables' to load
+                        the rules as port verdict maps into a table of their own.
         """
+        if backend not in FIREWALL_BACKENDS:
+            raise ValueError(f"Unsupported firewall backend: {backend}")
         self.rule_file = rule_file
+        self.netns = netns
+        self.backend = backend
         self.rules = self._load_rules()
 
     def _load_rules(self) -> List[Dict]:
@@ -32,50 +56,414 @@ class FirewallManager:
         Load firewall rules from the JSON file.
         :return: List of rules.
         """
+        loader = RuleLoader(self.rule_file)
         try:
-            with open(self.rule_file, "r") as file:
-                return json.load(file)
+            with metrics.span("rules.load"):
+                rules = loader.load()
         except (FileNotFoundError, json.JSONDecodeError) as e:
             raise Exception(f"Failed to load rules file: {e}")
+        for error in loader.errors:
+            print(f"Skipping invalid rule at line {error['line']}: {error['message']}")
+        return rules
 
-    def apply_rule(self, rule: Dict) -> None:
+    def build_rule_spec(self, rule: Dict, chains: Dict[str, str] = CHAINS) -> str:
         """
-        Apply a single rule using iptables.
+        Build the iptables rule specification for a single rule.
         :param rule: A dictionary containing the rule details.
+        :param chains: Chain to append to per direction.
+        :return: Rule specification, e.g. '-A INPUT -p tcp --dport 22 -j ACCEPT'.
         """
-        direction = "INPUT" if rule["direction"] == "incoming" else "OUTPUT"
+        direction = chains.get(rule["direction"], chains["outgoing"])
         action = "ACCEPT" if rule["action"] == "allow" else "DROP"
         protocol = rule["protocol"]
-        port = rule["port"]
+        port = iptables_port(rule["port"])
+
+        addresses = ""
+        if rule.get("source"):
+            addresses += f" -s {rule['source']}"
+        if rule.get("destination"):
+            addresses += f" -d {rule['destination']}"
+
+        return f"-A {direction}{addresses} -p {protocol} --dport {port} -j {action}"
+
+    def build_restore_payload(self, flush: bool = True) -> str:
+        """
+        Compile the loaded rules into a single iptables-restore payload.
+        :param flush: Flush the filter table before the rules are appended.
+        :return: Payload for 'iptables-restore --noflush'.
+        """
+        lines = ["*filter"]
+        if flush:
+            lines.append("-F")
+        lines.extend(self.build_rule_spec(rule) for rule in self.rules)
+        lines.append("COMMIT")
+        return "\n".join(lines) + "\n"
+
+    def read_live_rules(self) -> List[Dict]:
+        """
+        Read the active filter table once via iptables-save.
+        :return: List of live rules in the same format as the rules file.
+        """
+        return self.parse_iptables_save(self.save_live_ruleset(self.netns))
+
+    @staticmethod
+    def save_live_ruleset(netns: Optional[str] = None, counters: bool = False) -> str:
+        """
+        Dump the active filter table.
+        :param netns: Network namespace to read from; the host's if omitted.
+        :param counters: Prefix each rule with its [packets:bytes] counters.
+        :return: Output of 'iptables-save -t filter'.
+        """
+        command = "iptables-save -c -t filter" if counters else "iptables-save -t filter"
+        metrics.increment("subprocesses_spawned")
+        try:
+            with metrics.span("iptables.save"):
+                result = subprocess.run(FirewallManager._sudo(command, netns), shell=True,
+                                        check=True, capture_output=True, text=True)
+        except subprocess.CalledProcessError as e:
+            raise Exception(f"Failed to read live rules: {e}")
+        return result.stdout
+
+    @staticmethod
+    def save_nft_table(netns: Optional[str] = None) -> str:
+        """
+        Dump the nftables table the nftables backend applies rules to.
+        :param netns: Network namespace to read from; the host's if omitted.
+        :return: Output of 'nft list table inet firewall_tester', empty if there is no such table.
+        """
+        metrics.increment("subprocesses_spawned")
+        try:
+            with metrics.span("nft.list"):
+                result = subprocess.run(FirewallManager._sudo(f"nft list table {TABLE}", netns), shell=True,
+                                        check=True, capture_output=True, text=True)
+        except subprocess.CalledProcessError:
+            return ""
+        return result.stdout
 
-        cmd = f"sudo iptables -A {direction} -p {protocol} --dport {port} -j {action}"
+    @staticmethod
+    def ruleset_fingerprint(output: str, nft_output: str = "", *context: str) -> str:
+        """
+        Hash iptables-save and nft output, ignoring comments and packet counters
+        so the fingerprint only changes when the rules do.
+        :param output: Output of 'iptables-save'.
+        :param nft_output: Output of save_nft_table().
+        :param context: Other strings the probe results depend on, such as the probe backend and target.
+        :return: SHA-256 hex digest.
+        """
+        digest = hashlib.sha256()
+        for line in output.splitlines():
+            if line.startswith("#"):
+                continue
+            if line.startswith(":"):
+                line = line.split("[", 1)[0].rstrip()
+            digest.update(line.encode() + b"\n")
+        digest.update(b"\0")
+        for line in nft_output.splitlines():
+            digest.update(NFT_COUNTER.sub("counter", line).strip().encode() + b"\n")
+        for item in context:
+            digest.update(b"\0" + item.encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def parse_iptables_save(output: str) -> List[Dict]:
+        """
+        Parse INPUT/OUTPUT rules from iptables-save output.
+        Rules that cannot be expressed in the rule file format are kept
+        with their original specification under the 'raw' key. Counters
+        from 'iptables-save -c' are kept under the 'packets' and 'bytes' keys.
+        :param output: Output of 'iptables-save -t filter'.
+        :return: List of rules in chain order.
+        """
+        directions = {chain: direction for direction, chain in CHAINS.items()}
+        rules = []
+        for line in output.splitlines():
+            tokens = line.split()
+            packets = None
+            if tokens and tokens[0].startswith("["):
+                packets, size = (int(count) for count in tokens[0].strip("[]").split(":"))
+                tokens = tokens[1:]
+            if len(tokens) < 2 or tokens[0] != "-A" or tokens[1] not in directions:
+                continue
+
+            rule = {"rule_id": len(rules) + 1, "direction": directions[tokens[1]]}
+            options = dict(zip(tokens[2::2], tokens[3::2]))
+            known = {"-s", "-d", "-p", "-m", "--dport", "-j"}
+            if (len(tokens) % 2 == 0 and set(options) <= known
+                    and options.get("-m", options.get("-p")) == options.get("-p")
+                    and "--dport" in options and options.get("-j") in ("ACCEPT", "DROP")):
+                if "-s" in options:
+                    rule["source"] = options["-s"]
+                if "-d" in options:
+                    rule["destination"] = options["-d"]
+                rule["protocol"] = options["-p"]
+                rule["port"] = format_port(port_bounds(options["--dport"]))
+                rule["action"] = "allow" if options["-j"] == "ACCEPT" else "block"
+            else:
+                rule["raw"] = " ".join(tokens[2:])
+            if packets is not None:
+                rule["packets"] = packets
+                rule["bytes"] = size
+            rules.append(rule)
+        return rules
+
+    @staticmethod
+    def _rule_key(rule: Dict) -> Tuple:
+        """
+        Build a comparable key for a rule, ignoring its rule_id.
+        :param rule: A dictionary containing the rule details.
+        :return: Tuple identifying the rule within its chain.
+        """
+        if "raw" in rule:
+            return ("raw", rule["raw"])
+        source, destination = rule_networks(rule)
+        return (rule["protocol"], port_bounds(rule["port"]), rule["action"], source, destination)
+
+    def read_hit_counters(self) -> List[int]:
+        """
+        Read every rule's packet counter in one 'iptables-save -c' call and
+        match the live rules to the rules file.
+        :return: Packet count per rule in self.rules; 0 for rules not loaded.
+        """
+        if self.backend != "iptables":
+            raise Exception("Hit counters are only supported by the iptables backend")
+        packets = defaultdict(deque)
+        for rule in self.parse_iptables_save(self.save_live_ruleset(self.netns, counters=True)):
+            packets[(rule["direction"], self._rule_key(rule))].append(rule.get("packets", 0))
+        hits = []
+        for rule in self.rules:
+            queue = packets[(rule["direction"], self._rule_key(rule))]
+            hits.append(queue.popleft() if queue else 0)
+        return hits
+
+    def optimize_rules(self, use_counters: bool = False) -> Dict[str, int]:
+        """
+        Replace the loaded rules with a smaller, verdict-equivalent rule list.
+        :param use_counters: Move frequently hit rules earlier, using the live
+                             packet counters.
+        :return: Rule counts before and after, and what each pass changed.
+        """
+        hits = self.read_hit_counters() if use_counters else None
+        optimizer = RuleOptimizer(self.rules, hits)
+        self.rules = optimizer.optimize()
+        stats = optimizer.stats
+        print(f"Optimized {stats['original']} rules to {stats['optimized']} "
+              f"({stats['removed']} unreachable removed, {stats['merged']} merged, {stats['moved']} moved).")
+        return stats
+
+    def compute_diff(self, live: List[Dict], desired: List[Dict]) -> List[str]:
+        """
+        Compute the minimal insert/delete operations turning live into desired.
+        Operations are ordered so rule positions stay valid when they are
+        applied one after another.
+        :param live: Rules currently loaded in the kernel.
+        :param desired: Rules that should be loaded.
+        :return: List of iptables-restore '-D'/'-I' lines.
+        """
+        operations = []
+        for direction, chain in CHAINS.items():
+            current = [self._rule_key(r) for r in live if r["direction"] == direction]
+            wanted = [r for r in desired if r["direction"] == direction]
+            matcher = SequenceMatcher(None, current, [self._rule_key(r) for r in wanted], autojunk=False)
+
+            # Walk the opcodes backwards so earlier positions are not shifted.
+            for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+                if tag == "equal":
+                    continue
+                for position in range(i2, i1, -1):
+                    operations.append(f"-D {chain} {position}")
+                for offset, rule in enumerate(wanted[j1:j2]):
+                    spec = self.build_rule_spec(rule).split(" ", 2)[2]
+                    operations.append(f"-I {chain} {i1 + offset + 1} {spec}")
+        return operations
+
+    def reconcile_rules(self) -> Dict[str, float]:
+        """
+        Apply only the difference between the live ruleset and the rules file,
+        without flushing the firewall.
+        :return: Per-phase timings in seconds.
+        """
+        if self.backend != "iptables":
+            raise Exception("Reconcile is only supported by the iptables backend")
+        timings = {}
+        start = time.perf_counter()
+        live = self.read_live_rules()
+        timings["read"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        operations = self.compute_diff(live, self.rules)
+        timings["diff"] = time.perf_counter() - start
+
+        if operations:
+            start = time.perf_counter()
+            self._execute_restore("*filter\n" + "\n".join(operations) + "\nCOMMIT\n")
+            timings["commit"] = time.perf_counter() - start
+            metrics.increment("reconcile_operations", len(operations))
+        print(f"Reconciled firewall with {len(operations)} operations.")
+
+        self._report_timings(timings)
+        return timings
+
+    def apply_rule(self, rule: Dict) -> None:
+        """
+        Apply a single rule using iptables.
+        :param rule: A dictionary containing the rule details.
+        """
+        if self.backend == "nftables":
+            cmd = self._sudo(f"nft add rule {TABLE} {NFT_CHAINS[rule['direction']]} {build_statement(rule)}",
+                             self.netns)
+        else:
+            cmd = self._sudo(f"iptables {self.build_rule_spec(rule)}", self.netns)
         self._execute_command(cmd)
+        metrics.increment("rules_applied")
 
-    def apply_all_rules(self) -> None:
+    def apply_all_rules(self, batch: bool = False) -> Dict[str, float]:
         """
         Apply all rules from the JSON file.
+        :param batch: Commit all rules in one iptables-restore transaction
+                      instead of one iptables call per rule. The nftables backend
+                      always replaces its table in one 'nft -f' transaction.
+        :return: Per-phase timings in seconds.
         """
-        for rule in self.rules:
-            print(f"Applying Rule {rule['rule_id']}: {rule}")
-            self.apply_rule(rule)
+        timings = {}
+        if self.backend == "nftables":
+            start = time.perf_counter()
+            ruleset = build_ruleset(self.rules)
+            timings["compile"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            self._execute_nft(ruleset)
+            timings["commit"] = time.perf_counter() - start
+            metrics.increment("rules_applied", len(self.rules))
+            print(f"Applied {len(self.rules)} rules in a single nft transaction.")
+        elif batch:
+            start = time.perf_counter()
+            payload = self.build_restore_payload(flush=False)
+            timings["compile"] = time.perf_counter() - start
 
-    def reset_firewall(self) -> None:
+            start = time.perf_counter()
+            self._execute_restore(payload)
+            timings["commit"] = time.perf_counter() - start
+            metrics.increment("rules_applied", len(self.rules))
+            print(f"Applied {len(self.rules)} rules in a single iptables-restore transaction.")
+        else:
+            start = time.perf_counter()
+            for rule in self.rules:
+                print(f"Applying Rule {rule['rule_id']}: {rule}")
+                self.apply_rule(rule)
+            timings["apply"] = time.perf_counter() - start
+
+        self._report_timings(timings)
+        return timings
+
+    def reset_firewall(self, batch: bool = False) -> None:
         """
         Reset the firewall by flushing all rules.
+        With the nftables backend, only the table this tool loads is removed.
+        :param batch: Flush through iptables-restore instead of 'iptables -F'.
         """
-        self._execute_command("sudo iptables -F")
+        if self.backend == "nftables":
+            self._execute_nft(f"add table {TABLE}\ndelete table {TABLE}\n")
+        elif batch:
+            self._execute_restore("*filter\n-F\nCOMMIT\n")
+        else:
+            self._execute_command(self._sudo("iptables -F", self.netns))
         print("All firewall rules have been reset.")
 
+    def load_tester_chains(self) -> None:
+        """
+        Load the rules into the tester's own chains, jumped to first from INPUT and
+        OUTPUT, in one iptables-restore transaction. Other rules in the filter table
+        are left alone; loading again replaces only the tester chains' contents.
+        """
+        if self.backend != "iptables":
+            raise Exception("Tester chains are only supported by the iptables backend")
+        live = self.save_live_ruleset(self.netns).splitlines()
+        # Under --noflush, declaring a chain creates it or flushes it if it exists
+        lines = ["*filter"] + [f":{chain} - [0:0]" for chain in TESTER_CHAINS.values()]
+        for direction, chain in CHAINS.items():
+            if f"-A {chain} -j {TESTER_CHAINS[direction]}" not in live:
+                lines.append(f"-I {chain} 1 -j {TESTER_CHAINS[direction]}")
+        lines.extend(self.build_rule_spec(rule, TESTER_CHAINS) for rule in self.rules)
+        lines.append("COMMIT")
+        self._execute_restore("\n".join(lines) + "\n")
+        metrics.increment("rules_applied", len(self.rules))
+        print(f"Loaded {len(self.rules)} rules into the tester chains.")
+
+    def remove_tester_chains(self) -> None:
+        """
+        Remove the chains added by load_tester_chains() and the jumps to them.
+        """
+        live = self.save_live_ruleset(self.netns).splitlines()
+        lines = ["*filter"]
+        for direction, chain in CHAINS.items():
+            if f"-A {chain} -j {TESTER_CHAINS[direction]}" in live:
+                lines.append(f"-D {chain} -j {TESTER_CHAINS[direction]}")
+        for chain in TESTER_CHAINS.values():
+            if any(line.startswith(f":{chain} ") for line in live):
+                lines.extend((f"-F {chain}", f"-X {chain}"))
+        if len(lines) > 1:
+            self._execute_restore("\n".join(lines + ["COMMIT"]) + "\n")
+        print("Tester chains have been removed.")
+
     def _execute_command(self, command: str) -> None:
         """
         Execute a shell command and handle errors.
         :param command: Command to execute.
         """
+        metrics.increment("subprocesses_spawned")
         try:
-            subprocess.run(command, shell=True, check=True)
+            with metrics.span("iptables.command"):
+                subprocess.run(command, shell=True, check=True)
         except subprocess.CalledProcessError as e:
             raise Exception(f"Failed to execute command: {e}")
 
+    def _execute_restore(self, payload: str) -> None:
+        """
+        Feed a payload to iptables-restore so it is committed atomically.
+        :param payload: Rules in iptables-save format.
+        """
+        metrics.increment("subprocesses_spawned")
+        try:
+            with metrics.span("iptables.restore"):
+                subprocess.run(self._sudo("iptables-restore --noflush", self.netns), shell=True, check=True,
+                               input=payload, text=True)
+        except subprocess.CalledProcessError as e:
+            raise Exception(f"Failed to execute iptables-restore: {e}")
+
+    def _execute_nft(self, ruleset: str) -> None:
+        """
+        Load an nftables script in one atomic transaction.
+        :param ruleset: Script for 'nft -f'.
+        """
+        metrics.increment("subprocesses_spawned")
+        try:
+            with metrics.span("nft.load"):
+                subprocess.run(self._sudo("nft -f -", self.netns), shell=True, check=True,
+                               input=ruleset, text=True)
+        except subprocess.CalledProcessError as e:
+            raise Exception(f"Failed to execute nft: {e}")
+
+    @staticmethod
+    def _sudo(command: str, netns: Optional[str] = None) -> str:
+        """
+        Prefix a command with sudo, running it inside a network namespace if one is given.
+        :param command: Command to run as root.
+        :param netns: Network namespace name.
+        :return: Shell command.
+        """
+        if netns:
+            return f"sudo ip netns exec {netns} {command}"
+        return f"sudo {command}"
+
+    @staticmethod
+    def _report_timings(timings: Dict[str, float]) -> None:
+        """
+        Print per-phase timings.
+        :param timings: Mapping of phase name to elapsed seconds.
+        """
+        for phase, elapsed in timings.items():
+            print(f"  {phase}: {elapsed * 1000:.2f} ms")
+
 if __name__ == "__main__":
     # Example usage
     manager = FirewallManager("rules/sample_rules.json")
@@ -0,0 +1,146 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import re
+from collections import Counter, defaultdict, deque
+from typing import Dict, List, Optional
+from src import metrics
+from src.firewall_manager import CHAINS, FirewallManager
+from src.logger import setup_logger
+from src.rule_compiler import NO_MATCH, CompiledPolicy
+from src.rule_model import port_bounds
+
+# ':INPUT ACCEPT [packets:bytes]' lines carry the chain policy's counters
+POLICY_LINE = re.compile(r"^:(\S+) (\S+) \[(\d+):(\d+)\]")
+
+
+class HitAttribution:
+    """Class to attribute probes to the kernel rules they matched from chain counter deltas."""
+
+    def __init__(self, rules: List[Dict], netns: Optional[str] = None, address: str = "127.0.0.1"):
+        """
+        Initialize HitAttribution.
+        :param rules: Rules from the rules file, used to name the kernel rules that matched.
+        :param netns: Read the counters of this network namespace instead of the host's.
+        :param address: Source and destination address of the probes.
+        """
+        self.rules = rules
+        self.netns = netns
+        self.address = address
+        self._before = None
+        self.logger = setup_logger("HitAttribution", "logs/validation.log")
+
+    def snapshot(self) -> Dict:
+        """
+        Read every rule and chain policy counter in one 'iptables-save -c' call.
+        :return: {'rules': live rules in chain order with packets and bytes,
+                  'policies': {direction: (target, packets, bytes)}}.
+        """
+        with metrics.span("attribution.snapshot"):
+            output = FirewallManager.save_live_ruleset(self.netns, counters=True)
+        directions = {chain: direction for direction, chain in CHAINS.items()}
+        policies = {}
+        for line in output.splitlines():
+            match = POLICY_LINE.match(line)
+            if match and match.group(1) in directions:
+                policies[directions[match.group(1)]] = (match.group(2), int(match.group(3)), int(match.group(4)))
+        return {"rules": FirewallManager.parse_iptables_save(output), "policies": policies}
+
+    def begin(self) -> None:
+        """
+        Snapshot the counters before a validation batch.
+        """
+        self._before = self.snapshot()
+
+    def attribute(self, results: List[Dict]) -> List[Dict]:
+        """
+        Snapshot the counters after a validation batch and add a 'matched_rule'
+        entry to every result: the chain position of the first live rule the
+        probe's flow matches (or the chain policy), the rules file rule it
+        corresponds to, and the packets and bytes that entry counted during
+        the batch. Counters include any other traffic during the batch, so
+        'probes' says how many of the batch's probes were attributed there.
+        :param results: Validation results, updated in place.
+        :return: The same results.
+        """
+        if self._before is None:
+            raise Exception("Counters were not snapshotted before the batch")
+        before, after = self._before, self.snapshot()
+        self._before = None
+        if ([(rule["direction"], FirewallManager._rule_key(rule)) for rule in before["rules"]]
+                != [(rule["direction"], FirewallManager._rule_key(rule)) for rule in after["rules"]]):
+            self.logger.warning("The ruleset changed during validation; probes were not attributed")
+            return results
+
+        entries = self._rule_entries(before["rules"], after["rules"])
+        policies = {}
+        for direction, chain in CHAINS.items():
+            target, packets, size = after["policies"].get(direction, ("ACCEPT", 0, 0))
+            _, old_packets, old_size = before["policies"].get(direction, (target, 0, 0))
+            policies[direction] = {"chain": chain, "position": None, "rule_id": None,
+                                   "action": "allow" if target == "ACCEPT" else "block",
+                                   "packets": packets - old_packets, "bytes": size - old_size, "probes": 0}
+
+        # Raw rules cannot be evaluated offline; only structured rules take part in matching
+        structured = [index for index, rule in enumerate(after["rules"]) if "raw" not in rule]
+        policy = CompiledPolicy([after["rules"][index] for index in structured], source=self.address,
+                                destination=self.address)
+        matches = policy.match([result["protocol"] for result in results],
+                               [port_bounds(result["port"])[0] for result in results],
+                               [result["direction"] for result in results]) if results else []
+
+        matched = []
+        for result, match in zip(results, matches):
+            entry = policies[result["direction"]] if match == NO_MATCH else entries[structured[match]]
+            entry["probes"] += 1
+            matched.append(entry)
+        for result, entry in zip(results, matched):
+            result["matched_rule"] = dict(entry, summary=self._summary(entry))
+            result["matched_rule"].pop("raw", None)
+            if any(other["raw"] and other["packets"] and other["chain"] == entry["chain"]
+                   and (entry["position"] is None or other["position"] < entry["position"]) for other in entries):
+                # A rule we cannot evaluate counted packets ahead of the predicted match
+                result["matched_rule"]["ambiguous"] = True
+        metrics.increment("probes_attributed", len(results))
+        return results
+
+    def _rule_entries(self, before: List[Dict], after: List[Dict]) -> List[Dict]:
+        """
+        Compute each live rule's chain position and counter deltas, and name it
+        after the rules file rule it was loaded from, matched in order.
+        """
+        rule_ids = defaultdict(deque)
+        for rule in self.rules:
+            rule_ids[(rule["direction"], FirewallManager._rule_key(rule))].append(rule["rule_id"])
+        positions = Counter()
+        entries = []
+        for old, rule in zip(before, after):
+            positions[rule["direction"]] += 1
+            queue = rule_ids[(rule["direction"], FirewallManager._rule_key(rule))]
+            entries.append({"chain": CHAINS[rule["direction"]], "position": positions[rule["direction"]],
+                            "rule_id": queue.popleft() if queue and "raw" not in rule else None,
+                            "action": rule.get("action"), "raw": "raw" in rule,
+                            "packets": rule.get("packets", 0) - old.get("packets", 0),
+                            "bytes": rule.get("bytes", 0) - old.get("bytes", 0), "probes": 0})
+        return entries
+
+    @staticmethod
+    def _summary(entry: Dict) -> str:
+        """
+        Describe a matched rule for the report, e.g. 'INPUT #3 (rule 5): 2 packets, 120 bytes for 2 probes'.
+        """
+        where = f"{entry['chain']} policy" if entry["position"] is None else f"{entry['chain']} #{entry['position']}"
+        if entry["rule_id"] is not None:
+            where += f" (rule {entry['rule_id']})"
+        return f"{where}: {entry['packets']} packets, {entry['bytes']} bytes for {entry['probes']} probes"
@@ -0,0 +1,374 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import heapq
+import math
+import time
+from collections import deque
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from src import metrics
+from src.firewall_manager import FirewallManager
+from src.probe_engine import PROBE_IDS, SOURCE_PORTS, RawProbeEngine
+from src.rule_model import port_bounds
+
+# Filler rules must not match the replies to raw probes, which go to SOURCE_PORTS
+FILLER_PORTS = range(1, SOURCE_PORTS.start)
+# TEST-NET-1 (RFC 5737) is never routed, so filler rules restricted to it match no real packet
+FILLER_SOURCE = "192.0.2.0/24"
+
+
+class LatencyHistogram:
+    """HDR-style histogram of latencies in microseconds with a bounded relative error."""
+
+    def __init__(self, highest: int = 60_000_000, significant_figures: int = 3):
+        """
+        Initialize an empty histogram.
+        :param highest: Largest value tracked, in microseconds; larger values are clamped.
+        :param significant_figures: Decimal digits of precision kept for every value.
+        """
+        if not 1 <= significant_figures <= 5:
+            raise ValueError("significant_figures must be between 1 and 5")
+        sub_bucket_count = 1 << math.ceil(math.log2(2 * 10 ** significant_figures))
+        self.highest = highest
+        self.significant_figures = significant_figures
+        self._half_magnitude = sub_bucket_count.bit_length() - 2
+        self._half_count = sub_bucket_count >> 1
+        self._mask = sub_bucket_count - 1
+        self.counts = np.zeros(self._index(highest) + 1, dtype=np.int64)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, value: int) -> int:
+        """
+        Find the counts slot of a value: linear sub-buckets within power-of-two buckets.
+        """
+        bucket = (value | self._mask).bit_length() - self._half_magnitude - 1
+        return ((bucket + 1) << self._half_magnitude) + (value >> bucket) - self._half_count
+
+    def _upper_bounds(self) -> np.ndarray:
+        """
+        Highest value that lands in each counts slot.
+        """
+        index = np.arange(len(self.counts))
+        bucket = np.maximum(index // self._half_count - 1, 0)
+        lowest = (index - (bucket << self._half_magnitude)) << bucket
+        return lowest + (1 << bucket) - 1
+
+    def record(self, value: float) -> None:
+        """
+        Record one latency.
+        :param value: Latency in microseconds.
+        """
+        value = min(max(int(value), 0), self.highest)
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        """
+        Add another histogram's values to this one.
+        """
+        if len(other.counts) != len(self.counts):
+            raise ValueError("Histograms must have the same range and precision")
+        self.counts += other.counts
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percentile: float) -> Optional[int]:
+        """
+        Value at or below which the given share of latencies fall.
+        :param percentile: Percentile between 0 and 100.
+        :return: Latency in microseconds, or None if nothing was recorded.
+        """
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(percentile / 100 * self.count))
+        slot = int(np.searchsorted(np.cumsum(self.counts), rank))
+        return min(int(self._upper_bounds()[slot]), self.max)
+
+    def summary(self) -> Dict:
+        """
+        Summarize the recorded latencies.
+        :return: count, min, mean, p50, p99, p999 and max, in milliseconds.
+        """
+        def ms(value):
+            return None if value is None else round(value / 1000, 3)
+
+        return {"count": self.count, "min_ms": ms(self.min),
+                "mean_ms": ms(self.total / self.count if self.count else None),
+                "p50_ms": ms(self.percentile(50)), "p99_ms": ms(self.percentile(99)),
+                "p999_ms": ms(self.percentile(99.9)), "max_ms": ms(self.max if self.count else None)}
+
+
+def flows_from_rules(rules: List[Dict], rate: float) -> List[Dict]:
+    """
+    Build one load flow per rule, aimed at the rule's lowest port.
+    :param rate: Packets per second for each rule.
+    :return: Flows, classed by protocol, direction and action.
+    """
+    return [{"name": f"rule {rule['rule_id']}", "class": f"{rule['protocol']}/{rule['direction']}/{rule['action']}",
+             "protocol": rule["protocol"], "port": port_bounds(rule["port"])[0], "rate": rate}
+            for rule in rules]
+
+
+def parse_mix(spec: str, rate: float) -> List[Dict]:
+    """
+    Build load flows from a traffic mix such as 'tcp:80=70,udp:53=20,icmp=10'.
+    :param spec: Comma-separated PROTOCOL[:PORT]=WEIGHT entries.
+    :param rate: Total packets per second, shared out by weight.
+    :return: Flows, classed by protocol.
+    """
+    entries = []
+    for item in spec.split(","):
+        target, _, weight = item.strip().partition("=")
+        protocol, _, port = target.partition(":")
+        if protocol not in ("tcp", "udp", "icmp") or (port and not port.isdigit()):
+            raise ValueError(f"Invalid traffic mix entry: {item!r}")
+        entries.append((protocol, int(port or 0), float(weight or 1)))
+    total = sum(weight for _, _, weight in entries)
+    if total <= 0:
+        raise ValueError("Traffic mix weights must add up to more than zero")
+    return [{"name": protocol if protocol == "icmp" else f"{protocol}:{port}", "class": protocol,
+             "protocol": protocol, "port": port, "rate": rate * weight / total}
+            for protocol, port, weight in entries if weight > 0]
+
+
+def flow_summary(results: List[Dict]) -> List[Dict]:
+    """
+    Drop the histograms from load results, e.g. for printing or JSON.
+    """
+    return [{key: value for key, value in result.items() if key != "histogram"} for result in results]
+
+
+def class_summary(results: List[Dict]) -> List[Dict]:
+    """
+    Combine load results per flow class.
+    :return: One row per class with achieved pps, loss and merged latency percentiles.
+    """
+    classes = {}
+    for result in results:
+        row = classes.get(result["class"])
+        if row is None:
+            row = classes[result["class"]] = {"class": result["class"], "flows": 0, "sent": 0, "replies": 0,
+                                              "rejected": 0, "achieved_pps": 0.0,
+                                              "histogram": LatencyHistogram()}
+        row["flows"] += 1
+        for key in ("sent", "replies", "rejected", "achieved_pps"):
+            row[key] += result[key]
+        row["histogram"].merge(result["histogram"])
+    rows = []
+    for row in classes.values():
+        histogram = row.pop("histogram")
+        row["achieved_pps"] = round(row["achieved_pps"], 1)
+        row["loss"] = round(1 - row["replies"] / row["sent"], 4) if row["sent"] else None
+        row["latency"] = histogram.summary()
+        rows.append(row)
+    return rows
+
+
+def format_table(rows: List[Dict], key: str = "name") -> str:
+    """
+    Render load results as a text table.
+    :param rows: Rows from flow_summary() or class_summary().
+    :param key: Column that names each row.
+    """
+    lines = [f"{key:<24} {'sent':>8} {'pps':>9} {'loss':>7} {'p50 ms':>8} {'p99 ms':>8} {'p999 ms':>8}"]
+    for row in rows:
+        latency = row["latency"]
+        loss = "-" if row["loss"] is None else f"{row['loss']:.1%}"
+        lines.append(f"{str(row[key]):<24} {row['sent']:>8} {row['achieved_pps']:>9.1f} {loss:>7} "
+                     + " ".join(f"{'-' if latency[p] is None else latency[p]:>8}"
+                                for p in ("p50_ms", "p99_ms", "p999_ms")))
+    return "\n".join(lines)
+
+
+class LoadGenerator:
+    """Class to send paced probe traffic and record reply latency per flow."""
+
+    def __init__(self, engine: Optional[RawProbeEngine] = None, timeout: float = 1.0):
+        """
+        Initialize LoadGenerator.
+        :param engine: Raw probe engine to send from; one aimed at 127.0.0.1 by default.
+        :param timeout: Seconds after which an unanswered packet counts as lost.
+        """
+        self.engine = engine if engine is not None else RawProbeEngine(timeout=timeout)
+        self.timeout = timeout
+
+    def close(self) -> None:
+        """
+        Close the probe engine's sockets.
+        """
+        self.engine.close()
+
+    def run(self, flows: List[Dict], duration: float) -> List[Dict]:
+        """
+        Send every flow at its rate for the duration, then wait out the timeout
+        for the last replies. Packets are scheduled against the clock, so a
+        sender that falls behind catches up instead of drifting; packets still
+        unsent at the end of the duration are dropped and show as a lower achieved_pps.
+        :param flows: Dicts with name, class, protocol, port and rate (packets per second).
+        :param duration: Seconds to send for.
+        :return: One result per flow: the flow plus sent, replies, rejected (replies
+                 that were firewall rejections), achieved_pps, loss, a latency
+                 summary and the LatencyHistogram.
+        """
+        if any(flow["rate"] <= 0 for flow in flows):
+            raise ValueError("Every flow needs a rate above zero")
+        for protocol, ids in PROBE_IDS.items():
+            # Each packet holds a source port (or ICMP sequence number) until it is answered or times out
+            outstanding = sum(flow["rate"] for flow in flows if flow["protocol"] == protocol) * self.timeout
+            if outstanding > len(ids):
+                raise ValueError(f"{protocol} flows would keep up to {math.ceil(outstanding)} packets outstanding "
+                                 f"within the {self.timeout}s timeout, but only {len(ids)} probe ids are available")
+        self.engine.start()
+        results = [dict(flow, sent=0, replies=0, rejected=0, histogram=LatencyHistogram()) for flow in flows]
+        outstanding = deque()
+        total_rate = sum(flow["rate"] for flow in flows)
+        start = time.monotonic()
+        end = start + duration
+        # Stagger the first packets so flows do not send in bursts
+        schedule = [(start + index / total_rate, index) for index in range(len(flows))]
+        heapq.heapify(schedule)
+
+        with metrics.span("load.send"):
+            while schedule:
+                due, index = schedule[0]
+                now = time.monotonic()
+                if now >= end:
+                    break
+                if due > now:
+                    self._reap(outstanding, results, now)
+                    time.sleep(min(due - now, 0.001))
+                    continue
+                flow = flows[index]
+                key, pending = self.engine.send_probe(flow["protocol"], flow["port"])
+                outstanding.append((index, key, pending))
+                results[index]["sent"] += 1
+                due += 1 / flow["rate"]
+                if due < end:
+                    heapq.heapreplace(schedule, (due, index))
+                else:
+                    heapq.heappop(schedule)
+            elapsed = max(min(time.monotonic(), end) - start, 1e-9)
+
+        with metrics.span("load.drain"):
+            while outstanding:
+                _, _, pending = outstanding[0]
+                pending.event.wait(max(0.0, pending.sent + self.timeout - time.monotonic()))
+                self._reap(outstanding, results, time.monotonic())
+
+        for result in results:
+            result["achieved_pps"] = round(result["sent"] / elapsed, 1)
+            result["loss"] = round(1 - result["replies"] / result["sent"], 4) if result["sent"] else None
+            result["latency"] = result["histogram"].summary()
+        metrics.increment("probes_sent", sum(result["sent"] for result in results))
+        return results
+
+    def _reap(self, outstanding: deque, results: List[Dict], now: float) -> None:
+        """
+        Record packets from the front of the queue that were answered or timed out.
+        """
+        while outstanding:
+            index, key, pending = outstanding[0]
+            if not pending.event.is_set() and now - pending.sent < self.timeout:
+                return
+            outstanding.popleft()
+            self.engine.release(key, pending)
+            if pending.event.is_set():
+                result = results[index]
+                result["replies"] += 1
+                if pending.verdict == "blocked":
+                    result["rejected"] += 1
+                result["histogram"].record((pending.received - pending.sent) * 1e6)
+
+
+def filler_rules(count: int, flows: List[Dict]) -> List[Dict]:
+    """
+    Build rules that no packet matches, to lengthen the chain the load flows
+    traverse. They use the flows' protocols and real destination ports so every
+    match is evaluated, but only match FILLER_SOURCE, which no traffic comes from,
+    so the rules behind them still decide every packet.
+    :param count: Number of rules.
+    :return: 'block' rules from FILLER_SOURCE on ports no flow uses.
+    """
+    used = {flow["port"] for flow in flows}
+    protocols = sorted({flow["protocol"] for flow in flows} - {"icmp"}) or ["tcp"]
+    ports = [port for port in FILLER_PORTS if port not in used]
+    if count > len(ports) * len(protocols):
+        raise ValueError(f"At most {len(ports) * len(protocols)} filler rules are available")
+    return [{"rule_id": f"filler-{index}", "direction": "incoming", "protocol": protocols[index % len(protocols)],
+             "port": ports[index // len(protocols)], "action": "block", "source": FILLER_SOURCE}
+            for index in range(count)]
+
+
+def sweep(manager: FirewallManager, generator: LoadGenerator, flows: List[Dict], sizes: Sequence[int],
+          duration: float) -> List[Dict]:
+    """
+    Re-run the load test as the chain grows: for each size, that many filler
+    rules are loaded ahead of the manager's rules. With iptables they go into the
+    tester's own chains, which are removed afterwards, so the rest of the filter
+    table is never flushed. With nftables they replace the tester's table, which
+    holds the manager's rules alone afterwards.
+    :param sizes: Numbers of filler rules to test with.
+    :return: One point per size with chain length, per-flow and per-class results.
+    """
+    rules = manager.rules
+    points = []
+    try:
+        for size in sizes:
+            manager.rules = filler_rules(size, flows) + rules
+            if manager.backend == "nftables":
+                manager.apply_all_rules()  # Replaces the tester's table in one transaction
+            else:
+                manager.load_tester_chains()
+            results = generator.run(flows, duration)
+            points.append({"chain_rules": len(manager.rules), "fillers": size,
+                           "flows": flow_summary(results), "classes": class_summary(results)})
+    finally:
+        manager.rules = rules
+        if manager.backend == "nftables":
+            manager.apply_all_rules()
+        else:
+            manager.remove_tester_chains()
+    return points
+
+
+def path_cost(points: List[Dict]) -> Dict[str, Dict[str, float]]:
+    """
+    Fit latency against chain length to estimate what each rule costs a packet.
+    :param points: Output of sweep().
+    :return: Per class, microseconds added per rule at p50 and p99 (least-squares slope).
+    """
+    series = {}
+    for point in points:
+        for row in point["classes"]:
+            if row["latency"]["p50_ms"] is not None:
+                series.setdefault(row["class"], []).append(
+                    (point["chain_rules"], row["latency"]["p50_ms"], row["latency"]["p99_ms"]))
+    costs = {}
+    for name, values in series.items():
+        if len({chain for chain, _, _ in values}) < 2:
+            continue
+        chains, p50, p99 = (np.array(column, dtype=float) for column in zip(*values))
+        costs[name] = {"p50_us_per_rule": round(float(np.polyfit(chains, p50, 1)[0]) * 1000, 4),
+                       "p99_us_per_rule": round(float(np.polyfit(chains, p99, 1)[0]) * 1000, 4)}
+    return costs
@@ -12,28 +12,156 @@
 # 
 # You should have received a copy of the GNU General Public License
 # along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import atexit
+import json
 import logging
 import os
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Tuple
+from src import metrics
 
-def setup_logger(name: str, log_file: str, level=logging.INFO) -> logging.Logger:
+_lock = threading.Lock()
+# One queue and listener thread per log file, shared by every logger writing to it
+_listeners: Dict[str, Tuple[queue.SimpleQueue, QueueListener]] = {}
+_configured: Dict[str, QueueHandler] = {}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formatter that renders each record as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class BatchedFileHandler(RotatingFileHandler):
+    """File handler that flushes every batch_size records instead of after each one."""
+
+    def __init__(self, filename: str, max_bytes: int = 0, backup_count: int = 0, batch_size: int = 100):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count)
+        self.batch_size = batch_size
+        self._unflushed = 0
+
+    def flush(self) -> None:
+        # Called by emit() after every record; only write through once a batch is full
+        self._unflushed += 1
+        if self._unflushed >= self.batch_size:
+            self.force_flush()
+
+    def force_flush(self) -> None:
+        """
+        Write buffered records to disk now.
+        """
+        self._unflushed = 0
+        super().flush()
+
+    def close(self) -> None:
+        self.force_flush()
+        super().close()
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Records stay in-process, so they need not be made picklable here
+        return record
+
+
+class _BatchingQueueListener(QueueListener):
+    """QueueListener that flushes its handlers whenever the queue runs dry."""
+
+    def dequeue(self, block: bool) -> logging.LogRecord:
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            for handler in self.handlers:
+                if isinstance(handler, BatchedFileHandler):
+                    handler.force_flush()
+            return self.queue.get(block)
+
+    def handle(self, record: logging.LogRecord) -> None:
+        # Runs on the listener thread, so this times formatting and disk writes, not the callers
+        with metrics.span("log.write"):
+            super().handle(record)
+        metrics.increment("log_records")
+
+
+def setup_logger(name: str, log_file: str, level=logging.INFO, json_format: bool = False,
+                 max_bytes: int = 0, backup_count: int = 0, batch_size: int = 100) -> logging.Logger:
     """
     Set up a logger with a specific name and log file.
+    Records are put on an in-memory queue and written by a background thread,
+    so logging calls do not block on disk I/O. Calling this again for the same
+    name returns the already configured logger without adding handlers.
     :param name: Name of the logger.
     :param log_file: Path to the log file.
     :param level: Logging level.
+    :param json_format: Write one JSON object per line instead of plain text.
+    :param max_bytes: Rotate the log file once it reaches this size (0 disables rotation).
+    :param backup_count: Number of rotated files to keep.
+    :param batch_size: Number of records written before the file is flushed.
     :return: Configured logger instance.
     """
-    # Ensure the directory for the log file exists
-    log_dir = os.path.dirname(log_file)
-    os.makedirs(log_dir, exist_ok=True)
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
 
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    with _lock:
+        if name in _configured:
+            return logger
 
-    handler = logging.FileHandler(log_file)
-    handler.setFormatter(formatter)
+        path = os.path.abspath(log_file)
+        if path not in _listeners:
+            # Ensure the directory for the log file exists
+            log_dir = os.path.dirname(log_file)
+            if log_dir:
+                os.makedirs(log_dir, exist_ok=True)
 
-    logger = logging.getLogger(name)
-    logger.setLevel(level)
-    logger.addHandler(handler)
+            if json_format:
+                formatter = JsonFormatter()
+            else:
+                formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+
+            handler = BatchedFileHandler(log_file, max_bytes=max_bytes, backup_count=backup_count,
+                                         batch_size=batch_size)
+            handler.setFormatter(formatter)
+
+            log_queue = queue.SimpleQueue()
+            listener = _BatchingQueueListener(log_queue, handler, respect_handler_level=True)
+            listener.start()
+            _listeners[path] = (log_queue, listener)
+
+        queue_handler = _NonBlockingQueueHandler(_listeners[path][0])
+        logger.addHandler(queue_handler)
+        _configured[name] = queue_handler
 
     return logger
+
+
+def shutdown_logging() -> None:
+    """
+    Drain every log queue, flush and close the log files, and detach the
+    queue handlers. Registered to run at interpreter exit.
+    """
+    with _lock:
+        for name, queue_handler in _configured.items():
+            logging.getLogger(name).removeHandler(queue_handler)
+        _configured.clear()
+
+        for _, listener in _listeners.values():
+            listener.stop()
+            for handler in listener.handlers:
+                handler.close()
+        _listeners.clear()
+
+
+atexit.register(shutdown_logging)
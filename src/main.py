@@ -13,9 +13,71 @@
 # You should have received a copy of the GNU General Public License
 # along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
 import argparse
+import json
+import signal
+import time
+from src import metrics
+from src.client import DEFAULT_SOCKET
+from src.daemon import ValidationDaemon
+from src.distributed import Coordinator, Worker, parse_address
+from src.load_generator import (LoadGenerator, class_summary, flow_summary, flows_from_rules, format_table,
+                                parse_mix, path_cost, sweep)
 from src.firewall_manager import FirewallManager
 from src.rule_validator import RuleValidator
 from src.report_generator import ReportGenerator
+from src.probe_cache import ProbeCache
+from src.adaptive_timeout import AdaptiveTimeout
+from src.results_store import ResultsBuilder, ResultsStore
+from src.file_watcher import FileWatcher
+from src.logger import shutdown_logging
+from src.packet_capture import PacketCapture
+from src.policy_diff import confirm_changes, diff_policies, format_change, load_rule_file
+from src.traffic_simulator import TrafficSimulator
+
+def print_result(result: dict) -> dict:
+    """
+    Print a single validation result.
+    :param result: Validation result from RuleValidator.
+    :return: The same result, so the function can be used inside a generator.
+    """
+    print(f"Rule {result['rule_id']}: {result['status']}")
+    print(f"  Protocol: {result['protocol']}, Port: {result['port']}")
+    print(f"  Direction: {result['direction']}")
+    print(f"  Expected: {result['expected_action']}, Observed: {result['observed_action']}")
+    if "matched_rule" in result:
+        print(f"  Matched: {result['matched_rule']['summary']}")
+    return result
+
+def watch_rules(validator: RuleValidator, rules_file: str, report_file: str, page_size: int) -> None:
+    """
+    Validate the rules, then revalidate only changed rules and rewrite only the
+    affected report pages each time the rules file is saved, until interrupted.
+    :param validator: Validator whose observations are kept between runs.
+    :param rules_file: Rules file to watch.
+    :param report_file: Path of the paginated report's index page.
+    :param page_size: Number of results per report page.
+    """
+    previous = None
+    with FileWatcher(rules_file) as watcher:
+        while True:
+            start = time.perf_counter()
+            try:
+                results, probed = validator.revalidate_rules()
+            except Exception as e:
+                # A save can leave the file briefly invalid; wait for the next one
+                print(f"Validation failed: {e}")
+            else:
+                ReportGenerator.generate_paginated_report(results, report_file, page_size, validator.findings,
+                                                          previous_results=previous)
+                previous = results
+                for result in results:
+                    if result["status"] != "pass":
+                        print_result(result)
+                failed = sum(1 for result in results if result["status"] != "pass")
+                print(f"Probed {len(probed)} changed rules in {time.perf_counter() - start:.3f}s: "
+                      f"{len(results) - failed} passed, {failed} failed")
+            print(f"Watching {rules_file} for changes (Ctrl+C to stop)...")
+            watcher.wait()
 
 def main():
     """
@@ -38,52 +100,445 @@ def main():
         action="store_true", 
         help="Validate firewall rules and generate a report."
     )
+    parser.add_argument(
+        "--analyze-rules", 
+        action="store_true", 
+        help="Report shadowed, redundant and overlapping rules without sending traffic."
+    )
     parser.add_argument(
         "--generate-report", 
         action="store_true", 
         help="Generate an HTML report from the last validation."
     )
+    parser.add_argument(
+        "--reconcile", 
+        action="store_true", 
+        help="Apply only the difference between the live ruleset and the rules JSON file."
+    )
+    parser.add_argument(
+        "--optimize", 
+        action="store_true", 
+        help="With --apply-rules or --reconcile, load a smaller, verdict-equivalent rule list."
+    )
+    parser.add_argument(
+        "--reorder-by-hits", 
+        action="store_true", 
+        help="With --optimize, move frequently hit rules earlier using the live packet counters."
+    )
+    parser.add_argument(
+        "--max-probes", 
+        type=int, 
+        default=1, 
+        help="Maximum number of traffic probes to run concurrently during validation."
+    )
+    parser.add_argument(
+        "--probe-backend", 
+        choices=["hping3", "raw"], 
+        default="hping3", 
+        help="Send probes with hping3 or from in-process raw sockets."
+    )
+    parser.add_argument(
+        "--dry-run", 
+        action="store_true", 
+        help="Validate against the compiled rule set offline, without sending traffic."
+    )
+    parser.add_argument(
+        "--cache", 
+        action="store_true", 
+        help="Reuse probe results from earlier runs while the active ruleset is unchanged."
+    )
+    parser.add_argument(
+        "--cache-ttl", 
+        type=float, 
+        default=86400, 
+        help="Seconds a cached probe result stays valid."
+    )
+    parser.add_argument(
+        "--cache-size", 
+        type=int, 
+        default=1000000, 
+        help="Maximum number of cached probe results."
+    )
+    parser.add_argument(
+        "--page-size", 
+        type=int, 
+        default=0, 
+        help="Stream the HTML report into pages of this many results with a summary index page."
+    )
+    parser.add_argument(
+        "--export", 
+        action="append", 
+        default=[], 
+        metavar="PATH", 
+        help="Export validation results to a .csv, .jsonl, .parquet or .feather file. Can be repeated."
+    )
+    parser.add_argument(
+        "--batch", 
+        action="store_true", 
+        help="Apply or reset rules in a single iptables-restore transaction."
+    )
+    parser.add_argument(
+        "--firewall-backend", 
+        choices=["iptables", "nftables"], 
+        default="iptables", 
+        help="Apply and reset rules with iptables chains or nftables verdict maps."
+    )
+    parser.add_argument(
+        "--namespaces", 
+        type=int, 
+        default=0, 
+        help="Validate in this many throwaway network namespaces in parallel instead of on the host."
+    )
+    parser.add_argument(
+        "--plan-probes", 
+        action="store_true", 
+        help="Probe one port per class of ports the rules treat alike instead of one per rule."
+    )
+    parser.add_argument(
+        "--adaptive-timeout", 
+        action="store_true", 
+        help="Learn probe deadlines from reply round-trip times instead of waiting a fixed timeout."
+    )
+    parser.add_argument(
+        "--probe-retries", 
+        type=int, 
+        default=1, 
+        help="Retries for probes that met silence when --adaptive-timeout is set."
+    )
+    parser.add_argument(
+        "--profile", 
+        action="store_true", 
+        help="Print time spent per phase and run counters when finished."
+    )
+    parser.add_argument(
+        "--metrics-file", 
+        metavar="PATH", 
+        help="Write run metrics to a Prometheus textfile (.prom) or JSON (.json) file."
+    )
+    parser.add_argument(
+        "--capture", 
+        action="store_true", 
+        help="Capture probe traffic from an AF_PACKET ring and attach per-probe evidence to results."
+    )
+    parser.add_argument(
+        "--attribute-hits", 
+        action="store_true", 
+        help="With --validate-rules, report the kernel rule each probe matched and its hit counts (iptables only)."
+    )
+    parser.add_argument(
+        "--watch", 
+        action="store_true", 
+        help="With --validate-rules, revalidate only changed rules each time the rules file is saved."
+    )
+    parser.add_argument(
+        "--daemon", 
+        action="store_true", 
+        help="Serve validate/apply/report requests from warm state on a Unix socket (see src/client.py)."
+    )
+    parser.add_argument(
+        "--socket", 
+        default=DEFAULT_SOCKET, 
+        help="Unix socket for --daemon."
+    )
+    parser.add_argument(
+        "--coordinator", 
+        metavar="HOST:PORT", 
+        help="With --validate-rules, listen here and validate shards of the rules on worker agents."
+    )
+    parser.add_argument(
+        "--local-workers", 
+        type=int, 
+        default=0, 
+        help="With --coordinator, also start this many worker processes on this machine."
+    )
+    parser.add_argument(
+        "--shard-size", 
+        type=int, 
+        default=100, 
+        help="Number of rules the coordinator hands a worker at a time."
+    )
+    parser.add_argument(
+        "--worker", 
+        metavar="HOST:PORT", 
+        help="Run as a worker agent, validating shards from the coordinator at this address."
+    )
+    parser.add_argument(
+        "--worker-name", 
+        help="Name the coordinator logs this worker under."
+    )
+    parser.add_argument(
+        "--load-test", 
+        action="store_true", 
+        help="Send sustained probe traffic per rule (or --load-mix) and report pps, loss and latency percentiles."
+    )
+    parser.add_argument(
+        "--load-rate", 
+        type=float, 
+        default=100, 
+        help="Packets per second per rule, or in total with --load-mix."
+    )
+    parser.add_argument(
+        "--load-mix", 
+        metavar="SPEC", 
+        help="Load test a traffic mix instead of the rules, e.g. 'tcp:80=70,udp:53=20,icmp=10'."
+    )
+    parser.add_argument(
+        "--load-duration", 
+        type=float, 
+        default=10, 
+        help="Seconds to send load for, per run."
+    )
+    parser.add_argument(
+        "--sweep", 
+        metavar="SIZES", 
+        help="With --load-test, repeat the run with this many filler rules ahead of the rules, e.g. '0,1000,5000'."
+    )
+    parser.add_argument(
+        "--load-output", 
+        metavar="PATH", 
+        help="Write load test results to a JSON file."
+    )
+    parser.add_argument(
+        "--diff-policies", 
+        nargs=2, 
+        metavar=("OLD", "NEW"), 
+        help="List every port range whose verdict differs between two rules files, without sending traffic."
+    )
+    parser.add_argument(
+        "--confirm", 
+        action="store_true", 
+        help="With --diff-policies, probe only the changed ranges to confirm the live firewall gives the new verdicts."
+    )
+    parser.add_argument(
+        "--diff-output", 
+        metavar="PATH", 
+        help="Write the --diff-policies changes to a JSON file."
+    )
     args = parser.parse_args()
+    start = time.perf_counter()
 
     # File paths
     rules_file = "rules/sample_rules.json"
     log_file = "logs/validation.log"
     report_file = "reports/validation_report.html"
+    cache_file = "cache/probe_cache.sqlite3"
 
     if args.reset_firewall:
         print("Resetting the firewall...")
-        manager = FirewallManager(rules_file)
-        manager.reset_firewall()
+        manager = FirewallManager(rules_file, backend=args.firewall_backend)
+        manager.reset_firewall(batch=args.batch)
         print("Firewall rules have been reset.")
+    elif args.reconcile:
+        print("Reconciling firewall rules...")
+        manager = FirewallManager(rules_file, backend=args.firewall_backend)
+        if args.optimize:
+            manager.optimize_rules(use_counters=args.reorder_by_hits)
+        manager.reconcile_rules()
+        print("Firewall rules reconciled successfully.")
     elif args.apply_rules:
         print("Applying firewall rules...")
-        manager = FirewallManager(rules_file)
-        manager.apply_all_rules()
+        manager = FirewallManager(rules_file, backend=args.firewall_backend)
+        if args.optimize:
+            manager.optimize_rules(use_counters=args.reorder_by_hits)
+        manager.apply_all_rules(batch=args.batch)
         print("Firewall rules applied successfully.")
     elif args.validate_rules:
         print("Validating firewall rules...")
-        validator = RuleValidator(rules_file)
-        validation_results = validator.validate_rules()
+        cache = ProbeCache(cache_file, ttl=args.cache_ttl, max_entries=args.cache_size) if args.cache else None
+        timing = AdaptiveTimeout(retries=args.probe_retries) if args.adaptive_timeout else None
+        # Workers capture on their own hosts when validation is distributed
+        capture = PacketCapture() if args.capture and not args.coordinator else None
+        validator = RuleValidator(rules_file, max_in_flight=args.max_probes,
+                                  probe_backend=args.probe_backend, dry_run=args.dry_run, cache=cache,
+                                  namespaces=args.namespaces, plan_probes=args.plan_probes, timing=timing,
+                                  capture=capture, attribute_hits=args.attribute_hits)
+
+        builder = ResultsBuilder() if args.export and not args.watch else None
+        if args.watch:
+            try:
+                watch_rules(validator, rules_file, report_file, args.page_size or 1000)
+            except KeyboardInterrupt:
+                print("\nStopped watching.")
+        elif args.coordinator:
+            coordinator = Coordinator(rules_file, parse_address(args.coordinator), shard_size=args.shard_size,
+                                      dry_run=args.dry_run)
+            host, port = coordinator.bind()
+            print(f"Coordinator listening on {host}:{port}")
+            worker_args = ["--probe-backend", args.probe_backend, "--max-probes", str(args.max_probes)]
+            if args.adaptive_timeout:
+                worker_args += ["--adaptive-timeout", "--probe-retries", str(args.probe_retries)]
+            if args.capture:
+                worker_args.append("--capture")
+            validation_results = coordinator.run(args.local_workers, worker_args)
+
+            print("\nValidation Summary:")
+            for result in validation_results:
+                print_result(result)
+                if builder is not None:
+                    builder.add(result)
+            for name, shards in sorted(coordinator.workers.items()):
+                print(f"Worker {name}: {shards} shards")
 
-        # Print summary
-        print("\nValidation Summary:")
-        for result in validation_results:
-            print(f"Rule {result['rule_id']}: {result['status']}")
-            print(f"  Protocol: {result['protocol']}, Port: {result['port']}")
-            print(f"  Direction: {result['direction']}")
-            print(f"  Expected: {result['expected_action']}, Observed: {result['observed_action']}")
+            if args.page_size:
+                ReportGenerator.generate_paginated_report(iter(validation_results), report_file, args.page_size,
+                                                          coordinator.findings)
+            else:
+                ReportGenerator.generate_html_report(validation_results, report_file, coordinator.findings)
+        elif args.page_size:
+            # Stream results straight into report pages without keeping them all
+            print("\nValidation Summary:")
+            results = (print_result(result) for result in validator.iter_validate_rules())
+            if builder is not None:
+                results = (builder.add(result) for result in results)
+            ReportGenerator.generate_paginated_report(results, report_file, args.page_size, validator.findings)
+        else:
+            validation_results = validator.validate_rules()
 
-        # Generate HTML report
-        ReportGenerator.generate_html_report(validation_results, report_file)
+            # Print summary
+            print("\nValidation Summary:")
+            for result in validation_results:
+                print_result(result)
+                if builder is not None:
+                    builder.add(result)
+
+            # Generate HTML report
+            ReportGenerator.generate_html_report(validation_results, report_file, validator.findings)
+
+        if builder is not None:
+            store = builder.build()
+            for by in ("protocol", "direction", "port_band"):
+                print(f"\n{store.summary(by).to_string()}")
+            for path in args.export:
+                store.export(path)
+
+        if cache is not None:
+            print(f"\nProbe cache: {cache.hits} hits, {cache.misses} misses")
+            cache.close()
+        if capture is not None:
+            capture.close()
+        validator.simulator.close()
         print(f"\nValidation report generated: {report_file}")
+    elif args.daemon:
+        cache = ProbeCache(cache_file, ttl=args.cache_ttl, max_entries=args.cache_size) if args.cache else None
+        timing = AdaptiveTimeout(retries=args.probe_retries) if args.adaptive_timeout else None
+        capture = PacketCapture() if args.capture else None
+        daemon = ValidationDaemon(rules_file, args.socket, report_file, cache=cache, timing=timing,
+                                  capture=capture)
+        daemon.bind()
+        # Stop cleanly on SIGTERM as well as Ctrl+C
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        print(f"Daemon listening on {args.socket}")
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        if cache is not None:
+            cache.close()
+        if capture is not None:
+            capture.close()
+        print("Daemon stopped.")
+    elif args.worker:
+        timing = AdaptiveTimeout(retries=args.probe_retries) if args.adaptive_timeout else None
+        capture = PacketCapture() if args.capture else None
+        worker = Worker(parse_address(args.worker), name=args.worker_name, probe_backend=args.probe_backend,
+                        max_in_flight=args.max_probes, timing=timing, capture=capture)
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        try:
+            shards = worker.run()
+            print(f"Worker finished after {shards} shards.")
+        except KeyboardInterrupt:
+            print("Worker stopped.")
+        finally:
+            if capture is not None:
+                capture.close()
+    elif args.load_test:
+        print("Running load test...")
+        if args.load_mix:
+            flows = parse_mix(args.load_mix, args.load_rate)
+        else:
+            flows = flows_from_rules(load_rule_file(rules_file), args.load_rate)
+        generator = LoadGenerator()
+        try:
+            if args.sweep:
+                manager = FirewallManager(rules_file, backend=args.firewall_backend)
+                points = sweep(manager, generator, flows, [int(size) for size in args.sweep.split(",")],
+                               args.load_duration)
+                for point in points:
+                    print(f"\nChain of {point['chain_rules']} rules ({point['fillers']} fillers):")
+                    print(format_table(point["classes"], "class"))
+                costs = path_cost(points)
+                print("\nPacket-path cost per rule:")
+                for name, cost in costs.items():
+                    print(f"  {name}: p50 {cost['p50_us_per_rule']} us, p99 {cost['p99_us_per_rule']} us")
+                output = {"sweep": points, "path_cost": costs}
+            else:
+                results = generator.run(flows, args.load_duration)
+                print(f"\n{format_table(flow_summary(results))}")
+                print(f"\n{format_table(class_summary(results), 'class')}")
+                output = {"flows": flow_summary(results), "classes": class_summary(results)}
+        finally:
+            generator.close()
+        if args.load_output:
+            with open(args.load_output, "w") as file:
+                json.dump(output, file, indent=2)
+            print(f"\nLoad test results written: {args.load_output}")
+    elif args.diff_policies:
+        old_file, new_file = args.diff_policies
+        print(f"Comparing {old_file} with {new_file}...")
+        changes = diff_policies(load_rule_file(old_file), load_rule_file(new_file))
+        for change in changes:
+            print(f"  {format_change(change)}")
+        print(f"\n{len(changes)} changed port ranges.")
+        if args.confirm:
+            # Probes run from and to 127.0.0.1, so only changes for that address pair can be confirmed
+            probed = diff_policies(load_rule_file(old_file), load_rule_file(new_file),
+                                   source="127.0.0.1", destination="127.0.0.1")
+            simulator = TrafficSimulator(backend=args.probe_backend)
+            try:
+                confirm_changes(probed, simulator)
+            finally:
+                simulator.close()
+            print("\nLive confirmation:")
+            for change in probed:
+                print(f"  {format_change(change)}")
+            unconfirmed = sum(1 for change in probed if change["status"] != "confirmed")
+            print(f"\n{len(probed) - unconfirmed} confirmed, {unconfirmed} unconfirmed.")
+            changes = {"changes": changes, "confirmed": probed}
+        else:
+            changes = {"changes": changes}
+        if args.diff_output:
+            with open(args.diff_output, "w") as file:
+                json.dump(changes, file, indent=2)
+            print(f"Policy diff written: {args.diff_output}")
+    elif args.analyze_rules:
+        print("Analyzing firewall rules...")
+        validator = RuleValidator(rules_file)
+        findings = validator.analyze_rules()
+        for finding in findings:
+            print(f"Rule {finding['rule_id']}: {finding['type']} "
+                  f"(related rules: {', '.join(str(r) for r in finding['related_rule_ids'])})")
+            print(f"  {finding['detail']}")
+        print(f"\n{len(findings)} findings.")
     elif args.generate_report:
         print("Generating report from the last validation results...")
-        validator = RuleValidator(rules_file)
+        validator = RuleValidator(rules_file, max_in_flight=args.max_probes,
+                                  probe_backend=args.probe_backend, dry_run=args.dry_run)
         validation_results = validator.validate_rules()
-        ReportGenerator.generate_html_report(validation_results, report_file)
+        ReportGenerator.generate_html_report(validation_results, report_file, validator.findings)
         print(f"Report generated: {report_file}")
     else:
         print("No valid option provided. Use --help to see available options.")
+        return
+
+    metrics.record_span("run", time.perf_counter() - start)
+    if args.profile or args.metrics_file:
+        # Drain the log queue so background log writes are included
+        shutdown_logging()
+    if args.profile:
+        print(f"\nProfile:\n{metrics.format_summary()}")
+    if args.metrics_file:
+        metrics.write_metrics(args.metrics_file)
+        print(f"Metrics written: {args.metrics_file}")
 
 if __name__ == "__main__":
     main()
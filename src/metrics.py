@@ -0,0 +1,152 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+PREFIX = "firewall_tester"
+
+_lock = threading.Lock()
+# span name -> [count, total seconds, max seconds]
+_spans: Dict[str, list] = {}
+_counters: Dict[str, float] = {}
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """
+    Time the enclosed block and add it to the named span.
+    :param name: Span name, e.g. 'probe.hping3'.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+
+def record_span(name: str, seconds: float) -> None:
+    """
+    Add one timed occurrence to a span.
+    :param name: Span name.
+    :param seconds: Elapsed time.
+    """
+    with _lock:
+        stats = _spans.get(name)
+        if stats is None:
+            _spans[name] = [1, seconds, seconds]
+        else:
+            stats[0] += 1
+            stats[1] += seconds
+            if seconds > stats[2]:
+                stats[2] = seconds
+
+
+def increment(name: str, amount: float = 1) -> None:
+    """
+    Increase a counter.
+    :param name: Counter name, e.g. 'probes_sent'.
+    :param amount: Amount to add.
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def snapshot() -> Dict:
+    """
+    Copy the current spans and counters.
+    :return: {'spans': {name: {'count', 'total_seconds', 'max_seconds'}}, 'counters': {name: value}}.
+    """
+    with _lock:
+        return {
+            "spans": {name: {"count": count, "total_seconds": total, "max_seconds": longest}
+                      for name, (count, total, longest) in _spans.items()},
+            "counters": dict(_counters)
+        }
+
+
+def reset() -> None:
+    """
+    Discard all recorded spans and counters.
+    """
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+
+
+def format_summary() -> str:
+    """
+    Render spans (slowest total first) and counters as a plain-text table.
+    Spans recorded on several threads add up, so totals can exceed wall time.
+    :return: The table.
+    """
+    data = snapshot()
+    lines = [f"{'span':<24} {'count':>9} {'total ms':>12} {'mean ms':>10} {'max ms':>10}"]
+    for name, stats in sorted(data["spans"].items(), key=lambda item: -item[1]["total_seconds"]):
+        lines.append(f"{name:<24} {stats['count']:>9} {stats['total_seconds'] * 1000:>12.2f} "
+                     f"{stats['total_seconds'] / stats['count'] * 1000:>10.3f} {stats['max_seconds'] * 1000:>10.3f}")
+    if data["counters"]:
+        lines.append("")
+        lines.append(f"{'counter':<24} {'value':>9}")
+        for name, value in sorted(data["counters"].items()):
+            lines.append(f"{name:<24} {value:>9g}")
+    return "\n".join(lines)
+
+
+def format_prometheus() -> str:
+    """
+    Render spans and counters in the Prometheus text exposition format.
+    :return: Metrics text.
+    """
+    data = snapshot()
+    lines = []
+    span_metrics = [
+        ("span_seconds_total", "counter", "Total time spent in each phase.", "total_seconds"),
+        ("span_calls_total", "counter", "Number of times each phase ran.", "count"),
+        ("span_max_seconds", "gauge", "Longest single run of each phase.", "max_seconds")
+    ]
+    for suffix, kind, description, key in span_metrics:
+        lines.append(f"# HELP {PREFIX}_{suffix} {description}")
+        lines.append(f"# TYPE {PREFIX}_{suffix} {kind}")
+        for name, stats in sorted(data["spans"].items()):
+            lines.append(f'{PREFIX}_{suffix}{{span="{name}"}} {stats[key]!r}')
+    for name, value in sorted(data["counters"].items()):
+        lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+        lines.append(f"{PREFIX}_{name}_total {value!r}")
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path: str) -> None:
+    """
+    Write the metrics to a file: JSON for '.json', otherwise the Prometheus
+    text format for the node exporter textfile collector. The file is replaced
+    atomically so a scrape never sees a partial write.
+    :param path: Output path, e.g. '/var/lib/node_exporter/firewall_tester.prom'.
+    """
+    if path.endswith(".json"):
+        content = json.dumps(snapshot(), indent=2) + "\n"
+    else:
+        content = format_prometheus()
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as file:
+        file.write(content)
+    os.replace(temporary, path)
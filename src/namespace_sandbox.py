@@ -0,0 +1,142 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import os
+import subprocess
+from typing import Dict, List, Optional, Tuple
+from src import metrics
+from src.firewall_manager import FirewallManager
+
+SUBNET = "10.200"
+MAX_NAMESPACES = 256
+INTERFACE = "fwt0"
+
+class NamespaceSandbox:
+    """Throwaway network namespaces for probing rules without touching the host firewall."""
+
+    def __init__(self, count: int, prefix: Optional[str] = None):
+        """
+        Initialize NamespaceSandbox.
+        :param count: Number of shards. Each shard is a firewall namespace holding the
+                      rules and a client namespace, linked by a veth pair.
+        :param prefix: Namespace name prefix; unique per process by default so
+                       several validations can run side by side.
+        """
+        if not 1 <= count <= MAX_NAMESPACES:
+            raise ValueError(f"Namespace count must be between 1 and {MAX_NAMESPACES}")
+        self.count = count
+        self.prefix = prefix or f"fwtest-{os.getpid()}"
+        self.shards: List[Dict] = []
+
+    def __enter__(self) -> "NamespaceSandbox":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.destroy()
+
+    def create(self, rule_file: str) -> List[Dict]:
+        """
+        Create the namespaces and load the rules into each firewall namespace.
+        Everything created so far is removed again if a step fails.
+        :param rule_file: Path to the JSON file with firewall rules.
+        :return: Shards with 'firewall' and 'client' namespace names and addresses.
+        """
+        try:
+            manager = FirewallManager(rule_file)
+            for index in range(self.count):
+                shard = self._create_shard(index)
+                manager.netns = shard["firewall"]
+                manager.apply_all_rules(batch=True)
+        except Exception:
+            self.destroy()
+            raise
+        return self.shards
+
+    def destroy(self) -> None:
+        """
+        Delete all namespaces; their veth pairs and rules go with them.
+        """
+        for shard in self.shards:
+            for netns in (shard["firewall"], shard["client"]):
+                subprocess.run(f"sudo ip netns del {netns}", shell=True, stderr=subprocess.DEVNULL)
+        self.shards = []
+
+    @staticmethod
+    def routes(shard: Dict) -> Dict[str, Tuple[str, str]]:
+        """
+        Probe routes for TrafficSimulator: incoming traffic is sent from the client
+        namespace to the firewall namespace, outgoing traffic the other way round.
+        :param shard: Shard returned by create().
+        :return: Mapping of direction to (namespace, target address).
+        """
+        return {
+            "incoming": (shard["client"], shard["firewall_address"]),
+            "outgoing": (shard["firewall"], shard["client_address"])
+        }
+
+    @staticmethod
+    def flow_addresses(index: int) -> Dict[str, Tuple[str, str]]:
+        """
+        Addresses of the probes a shard sends, known before it is created.
+        :param index: Shard number.
+        :return: Mapping of direction to (source, destination) address.
+        """
+        firewall_address, client_address = f"{SUBNET}.{index}.1", f"{SUBNET}.{index}.2"
+        return {
+            "incoming": (client_address, firewall_address),
+            "outgoing": (firewall_address, client_address)
+        }
+
+    def _create_shard(self, index: int) -> Dict:
+        """
+        Create a firewall and a client namespace linked by a veth pair.
+        :param index: Shard number, also used for its /30 subnet.
+        :return: The shard.
+        """
+        client_address, firewall_address = self.flow_addresses(index)["incoming"]
+        shard = {
+            "firewall": f"{self.prefix}-{index}",
+            "client": f"{self.prefix}-{index}-client",
+            "firewall_address": firewall_address,
+            "client_address": client_address
+        }
+        # Register before creating anything so destroy() also cleans up a partial shard
+        self.shards.append(shard)
+
+        firewall, client = shard["firewall"], shard["client"]
+        commands = [
+            f"sudo ip netns add {firewall}",
+            f"sudo ip netns add {client}",
+            f"sudo ip link add {INTERFACE} netns {firewall} type veth peer name {INTERFACE} netns {client}",
+            f"sudo ip -n {firewall} addr add {shard['firewall_address']}/30 dev {INTERFACE}",
+            f"sudo ip -n {client} addr add {shard['client_address']}/30 dev {INTERFACE}"
+        ]
+        for netns in (firewall, client):
+            commands.append(f"sudo ip -n {netns} link set lo up")
+            commands.append(f"sudo ip -n {netns} link set {INTERFACE} up")
+        for command in commands:
+            self._execute_command(command)
+        return shard
+
+    @staticmethod
+    def _execute_command(command: str) -> None:
+        """
+        Execute a shell command and handle errors.
+        :param command: Command to execute.
+        """
+        metrics.increment("subprocesses_spawned")
+        try:
+            subprocess.run(command, shell=True, check=True)
+        except subprocess.CalledProcessError as e:
+            raise Exception(f"Failed to set up network namespace: {e}")
@@ -0,0 +1,119 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+from typing import Dict, List
+from src.policy_diff import DEFAULT, compile_intervals
+from src.rule_model import format_port, iptables_port
+
+TABLE = "inet firewall_tester"
+NFT_CHAINS = {"incoming": "input", "outgoing": "output"}
+VERDICTS = {"allow": "accept", "block": "drop"}
+# Port-keyed verdict maps only make sense for protocols with ports
+MAP_PROTOCOLS = ("tcp", "udp")
+
+
+def build_statement(rule: Dict) -> str:
+    """
+    Build a single nftables rule statement.
+    :param rule: A dictionary containing the rule details.
+    :return: Statement, e.g. 'ip saddr 10.0.0.0/8 tcp dport 22 accept'.
+    """
+    matches = []
+    for key, field in (("source", "saddr"), ("destination", "daddr")):
+        if rule.get(key):
+            family = "ip6" if ":" in rule[key] else "ip"
+            matches.append(f"{family} {field} {rule[key]}")
+    if rule["protocol"] in MAP_PROTOCOLS:
+        matches.append(f"{rule['protocol']} dport {iptables_port(rule['port']).replace(':', '-')}")
+    else:
+        matches.append(f"meta l4proto {rule['protocol']}")
+    return " ".join(matches + [VERDICTS[rule["action"]]])
+
+
+def _verdict_map(rules: List[Dict], direction: str, protocol: str) -> List[str]:
+    """
+    Resolve a run of rules into disjoint port intervals with the verdict of
+    the first rule matching each, merging neighbours with equal verdicts.
+    Only the run's port boundaries are visited, so each run costs time in
+    proportion to its own rules.
+    :return: Map elements, e.g. ['22 : accept', '1000-2000 : drop'].
+    """
+    spans = []
+    for low, high, action, owner in compile_intervals(rules, direction, protocol):
+        if owner == DEFAULT:
+            continue  # No rule matches: fall through to the rest of the chain
+        if spans and spans[-1][2] == action and spans[-1][1] == low - 1:
+            spans[-1][1] = high
+        else:
+            spans.append([low, high, action])
+    return [f"{format_port((low, high))} : {VERDICTS[action]}" for low, high, action in spans]
+
+
+def build_ruleset(rules: List[Dict]) -> str:
+    """
+    Compile rules into an nftables table that replaces the previous one in a
+    single 'nft -f' transaction. Consecutive rules without addresses become one
+    interval verdict map lookup per protocol, so their cost per packet does not
+    grow with the number of ports. Rules with addresses, and ICMP rules, stay
+    as ordered statements between the lookups, which keeps iptables'
+    first-match semantics.
+    :param rules: Rules in the rules file format.
+    :return: Script for 'nft -f'.
+    """
+    maps = []
+    chains = {}
+    for direction, chain in NFT_CHAINS.items():
+        statements = []
+        run = []
+
+        def flush_run():
+            for protocol in MAP_PROTOCOLS:
+                elements = _verdict_map(run, direction, protocol) if any(
+                    rule["protocol"] == protocol for rule in run) else []
+                if elements:
+                    name = f"{chain}_{protocol}_{len(maps) + 1}"
+                    maps.append((name, elements))
+                    statements.append(f"{protocol} dport vmap @{name}")
+            run.clear()
+
+        for rule in rules:
+            if rule["direction"] != direction:
+                continue
+            if rule["protocol"] in MAP_PROTOCOLS and not rule.get("source") and not rule.get("destination"):
+                run.append(rule)
+            else:
+                flush_run()
+                statements.append(build_statement(rule))
+        flush_run()
+        chains[chain] = statements
+
+    lines = [
+        # Create the table first so deleting it cannot fail, then rebuild it
+        f"add table {TABLE}",
+        f"delete table {TABLE}",
+        f"table {TABLE} {{"
+    ]
+    for name, elements in maps:
+        lines.append(f"    map {name} {{")
+        lines.append("        type inet_service : verdict")
+        lines.append("        flags interval")
+        lines.append(f"        elements = {{ {', '.join(elements)} }}")
+        lines.append("    }")
+    for chain, statements in chains.items():
+        lines.append(f"    chain {chain} {{")
+        lines.append(f"        type filter hook {chain} priority 0; policy accept;")
+        lines.extend(f"        {statement}" for statement in statements)
+        lines.append("    }")
+    lines.append("}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,374 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import ctypes
+import mmap
+import select
+import socket
+import struct
+import threading
+from typing import Dict, List, Optional, Tuple
+from src import metrics
+
+# <linux/if_packet.h> and <linux/filter.h>
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_VERSION = 10
+TPACKET_V3 = 2
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+SO_ATTACH_FILTER = 26
+ETH_P_IP = 0x0800
+
+BLOCK_STATUS = struct.Struct("=III")    # tpacket_hdr_v1 block_status, num_pkts, offset_to_first_pkt
+BLOCK_STATUS_OFFSET = 8                 # after tpacket_block_desc version and offset_to_priv
+FRAME_HEADER = struct.Struct("=IIIIIIHH")  # tpacket3_hdr up to tp_net
+FRAME_SIZE = 2048
+
+TCP_FLAG_SYN = 0x02
+TCP_FLAG_RST = 0x04
+TCP_FLAG_ACK = 0x10
+
+
+def build_filter(target: str, snaplen: int) -> List[Tuple[int, int, int, int]]:
+    """
+    Build a classic BPF program accepting TCP, UDP and ICMP packets to or from
+    the target. Offsets are from the IP header, as seen by SOCK_DGRAM packet sockets.
+    :param target: IPv4 address being probed.
+    :param snaplen: Bytes of each accepted packet to capture.
+    :return: List of (code, jt, jf, k) instructions.
+    """
+    address = int.from_bytes(socket.inet_aton(target), "big")
+    return [
+        (0x30, 0, 0, 9),            # ldb [9]           IP protocol
+        (0x15, 2, 0, socket.IPPROTO_ICMP),
+        (0x15, 1, 0, socket.IPPROTO_TCP),
+        (0x15, 0, 5, socket.IPPROTO_UDP),
+        (0x20, 0, 0, 12),           # ld [12]           source address
+        (0x15, 2, 0, address),
+        (0x20, 0, 0, 16),           # ld [16]           destination address
+        (0x15, 0, 1, address),
+        (0x06, 0, 0, snaplen),      # ret #snaplen
+        (0x06, 0, 0, 0),            # ret #0
+    ]
+
+
+class _Watch:
+    """An outstanding probe and the packets captured for it."""
+
+    def __init__(self, protocol: str, keys: List[Tuple], seq: Optional[int]):
+        self.protocol = protocol
+        self.keys = keys
+        self.seq = seq
+        self.packets = 0
+        self.egress = None
+        self.reply = None
+        self.reply_time = None
+        self.seen = threading.Event()
+        self.replied = threading.Event()
+
+
+class PacketCapture:
+    """Class to capture probe traffic from a memory-mapped AF_PACKET ring and match it to probes."""
+
+    def __init__(self, target: str = "127.0.0.1", interface: Optional[str] = None, block_size: int = 1 << 16,
+                 block_count: int = 64, retire_ms: int = 10, snaplen: int = 128):
+        """
+        Initialize PacketCapture. The socket and ring are set up by start().
+        :param target: IPv4 address being probed; only packets to or from it are captured.
+        :param interface: Capture on this interface only; all interfaces if omitted.
+        :param block_size: Size of each ring block in bytes (a multiple of the page size).
+        :param block_count: Number of ring blocks.
+        :param retire_ms: The kernel hands a partly filled block over after this many
+                          milliseconds, bounding how late evidence can arrive.
+        :param snaplen: Bytes captured per packet; headers are all that is needed.
+        """
+        self.target = target
+        self.interface = interface
+        self.block_size = block_size
+        self.block_count = block_count
+        self.retire_ms = retire_ms
+        self.snaplen = snaplen
+        self.settle = 2 * retire_ms / 1000
+        self._target = int.from_bytes(socket.inet_aton(target), "big")
+        self._watches: Dict[Tuple, List[_Watch]] = {}
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()  # Serializes start() and close()
+        self._socket = None
+        self._ring = None
+        self._filter = None
+        self._reader = None
+        self._running = False
+
+    def start(self) -> None:
+        """
+        Open the packet socket, attach the filter, map the ring and start the
+        reader thread. Requires CAP_NET_RAW. Safe to call from several probing
+        threads; only the first starts the capture.
+        """
+        with self._start_lock:
+            if self._running:
+                return
+            try:
+                if self.interface:
+                    sock = socket.socket(socket.AF_PACKET, socket.SOCK_DGRAM, 0)
+                else:
+                    # Binding needs an interface name, so receive on all of them from the start
+                    sock = socket.socket(socket.AF_PACKET, socket.SOCK_DGRAM, socket.htons(ETH_P_IP))
+            except PermissionError as e:
+                raise Exception(f"Packet capture requires root privileges: {e}")
+            try:
+                self._attach_filter(sock)
+                if self.interface:
+                    sock.bind((self.interface, ETH_P_IP))
+                else:
+                    self._drain(sock)
+                sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+                request = struct.pack("=7I", self.block_size, self.block_count, FRAME_SIZE,
+                                      self.block_size * self.block_count // FRAME_SIZE, self.retire_ms, 0, 0)
+                sock.setsockopt(SOL_PACKET, PACKET_RX_RING, request)
+                self._ring = mmap.mmap(sock.fileno(), self.block_size * self.block_count,
+                                       mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            except OSError as e:
+                sock.close()
+                raise Exception(f"Failed to set up packet capture: {e}")
+            self._socket = sock
+            self._running = True
+            self._reader = threading.Thread(target=self._read_loop, name="PacketCaptureReader", daemon=True)
+            self._reader.start()
+
+    def _attach_filter(self, sock: socket.socket) -> None:
+        """
+        Attach the BPF program so the kernel discards unrelated traffic.
+        """
+        program = build_filter(self.target, self.snaplen)
+        self._filter = (ctypes.c_ubyte * (8 * len(program)))(
+            *b"".join(struct.pack("=HBBI", *instruction) for instruction in program))
+        fprog = struct.pack("HL", len(program), ctypes.addressof(self._filter))
+        sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+
+    @staticmethod
+    def _drain(sock: socket.socket) -> None:
+        """
+        Discard packets queued before the filter was attached.
+        """
+        sock.setblocking(False)
+        try:
+            while True:
+                sock.recv(65535)
+        except BlockingIOError:
+            pass
+        sock.setblocking(True)
+
+    def close(self) -> None:
+        """
+        Stop the reader thread, unmap the ring and close the socket.
+        """
+        with self._start_lock:
+            self._close()
+
+    def _close(self) -> None:
+        self._running = False
+        if self._reader is not None:
+            self._reader.join()
+            self._reader = None
+        if self._ring is not None:
+            self._ring.close()
+            self._ring = None
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def watch(self, protocol: str, sport: Optional[int] = None, dport: Optional[int] = None,
+              seq: Optional[int] = None) -> _Watch:
+        """
+        Register a probe before it is sent. Unknown fields match any value, for
+        probes sent by tools that pick them at random.
+        :param protocol: 'tcp', 'udp' or 'icmp'.
+        :param sport: TCP/UDP source port, or ICMP echo identifier.
+        :param dport: TCP/UDP destination port, or ICMP echo sequence number.
+        :param seq: TCP initial sequence number, checked against replies' acknowledgements.
+        :return: Handle to pass to finish().
+        """
+        watch = _Watch(protocol, [(protocol, sport, dport)], seq)
+        with self._lock:
+            for key in watch.keys:
+                self._watches.setdefault(key, []).append(watch)
+        return watch
+
+    def finish(self, watch: _Watch, replied: bool) -> Dict:
+        """
+        Stop matching packets to a probe and summarize what was captured.
+        Captured packets reach the reader in blocks, so wait briefly for any
+        that the prober has already seen.
+        :param watch: Handle returned by watch().
+        :param replied: Whether the prober received a reply.
+        :return: Evidence: whether the probe was seen leaving, the reply type, the
+                 wire round-trip time and the number of packets captured.
+        """
+        if replied:
+            watch.replied.wait(self.settle)
+        elif watch.egress is None:
+            watch.seen.wait(self.settle)
+        with self._lock:
+            for key in watch.keys:
+                watches = self._watches.get(key, [])
+                if watch in watches:
+                    watches.remove(watch)
+                if not watches:
+                    self._watches.pop(key, None)
+
+        rtt = None
+        if watch.egress is not None and watch.reply_time is not None:
+            rtt = round((watch.reply_time - watch.egress) * 1000, 3)
+        evidence = {"egress": watch.egress is not None, "reply": watch.reply, "rtt_ms": rtt,
+                    "packets": watch.packets}
+        evidence["summary"] = self.describe(evidence)
+        return evidence
+
+    @staticmethod
+    def describe(evidence: Dict) -> str:
+        """
+        Describe captured evidence in words.
+        :param evidence: Evidence from finish().
+        :return: One-line summary.
+        """
+        if not evidence["egress"]:
+            return "probe not captured leaving"
+        if evidence["reply"] is None:
+            return "probe sent, no reply captured"
+        if evidence["rtt_ms"] is None:
+            return f"{evidence['reply']} reply captured"
+        return f"{evidence['reply']} reply captured after {evidence['rtt_ms']} ms"
+
+    def _read_loop(self) -> None:
+        """
+        Walk the ring block by block, handing each block back to the kernel once
+        its packets have been matched. Packets are parsed in place in the mapping.
+        """
+        block = 0
+        poller = select.poll()
+        poller.register(self._socket, select.POLLIN | select.POLLERR)
+        while self._running:
+            if self._read_block(self._ring, block * self.block_size):
+                block = (block + 1) % self.block_count
+            else:
+                poller.poll(100)
+
+    def _read_block(self, ring, base: int) -> bool:
+        """
+        Match the packets of one ring block and return it to the kernel.
+        :param ring: The mapped ring.
+        :param base: Offset of the block in the ring.
+        :return: False if the kernel still owns the block.
+        """
+        status, count, first = BLOCK_STATUS.unpack_from(ring, base + BLOCK_STATUS_OFFSET)
+        if not status & TP_STATUS_USER:
+            return False
+        position = base + first
+        for _ in range(count):
+            next_offset, sec, nsec, snaplen, _, _, _, net = FRAME_HEADER.unpack_from(ring, position)
+            self._match(ring, position + net, snaplen, sec + nsec / 1e9)
+            position += next_offset
+        metrics.increment("packets_captured", count)
+        struct.pack_into("=I", ring, base + BLOCK_STATUS_OFFSET, TP_STATUS_KERNEL)
+        return True
+
+    def _find(self, protocol: str, sport: int, dport: int) -> Optional[_Watch]:
+        """
+        Find the watch for a probe flow, preferring exact matches over wildcards.
+        """
+        with self._lock:
+            for key in ((protocol, sport, dport), (protocol, None, dport), (protocol, sport, None),
+                        (protocol, None, None)):
+                watches = self._watches.get(key)
+                if watches:
+                    return watches[0]
+        return None
+
+    def _match(self, ring, offset: int, length: int, timestamp: float) -> None:
+        """
+        Attribute one captured IPv4 packet to the probe it belongs to, as the
+        probe itself or as its reply.
+        """
+        if length < 20:
+            return
+        ihl = (ring[offset] & 0x0F) * 4
+        protocol = ring[offset + 9]
+        l4 = offset + ihl
+        available = length - ihl
+
+        if protocol == socket.IPPROTO_TCP and available >= 14:
+            sport, dport, seq, ack, _, flags = struct.unpack_from("!HHIIBB", ring, l4)
+            if flags & TCP_FLAG_SYN and not flags & TCP_FLAG_ACK:
+                self._request(self._find("tcp", sport, dport), timestamp, seq)
+            elif flags & (TCP_FLAG_RST | TCP_FLAG_ACK):
+                watch = self._find("tcp", dport, sport)
+                if watch is not None and (watch.seq is None or not flags & TCP_FLAG_ACK
+                                          or ack == (watch.seq + 1) & 0xFFFFFFFF):
+                    self._reply(watch, "rst" if flags & TCP_FLAG_RST else "syn-ack", timestamp)
+        elif protocol == socket.IPPROTO_UDP and available >= 8:
+            sport, dport = struct.unpack_from("!HH", ring, l4)
+            watch = self._find("udp", sport, dport)
+            if watch is not None:
+                self._request(watch, timestamp)
+            else:
+                self._reply(self._find("udp", dport, sport), "udp", timestamp)
+        elif protocol == socket.IPPROTO_ICMP and available >= 8:
+            icmp_type, code, _, ident, sequence = struct.unpack_from("!BBHHH", ring, l4)
+            if icmp_type == 8:
+                self._request(self._find("icmp", ident, sequence), timestamp)
+            elif icmp_type == 0:
+                self._reply(self._find("icmp", ident, sequence), "echo", timestamp)
+            elif icmp_type == 3 and available >= 8 + 20 + 4:
+                inner = l4 + 8
+                inner_protocol = {socket.IPPROTO_TCP: "tcp", socket.IPPROTO_UDP: "udp"}.get(ring[inner + 9])
+                if inner_protocol is not None:
+                    inner_l4 = inner + (ring[inner] & 0x0F) * 4
+                    if inner_l4 + 4 <= offset + length:
+                        sport, dport = struct.unpack_from("!HH", ring, inner_l4)
+                        self._reply(self._find(inner_protocol, sport, dport), f"icmp-unreachable/{code}",
+                                    timestamp)
+
+    @staticmethod
+    def _request(watch: Optional[_Watch], timestamp: float, seq: Optional[int] = None) -> None:
+        """
+        Record a captured copy of the probe itself.
+        """
+        if watch is None or (watch.seq is not None and seq is not None and seq != watch.seq):
+            return
+        watch.packets += 1
+        if watch.egress is None:
+            watch.egress = timestamp
+            watch.seen.set()
+
+    @staticmethod
+    def _reply(watch: Optional[_Watch], kind: str, timestamp: float) -> None:
+        """
+        Record the first captured reply to the probe.
+        """
+        if watch is None:
+            return
+        watch.packets += 1
+        if watch.reply is None:
+            watch.reply = kind
+            watch.reply_time = timestamp
+            watch.replied.set()
@@ -0,0 +1,231 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import ipaddress
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from src import metrics
+from src.rule_compiler import DIRECTIONS, PORT_COUNT, PROTOCOLS
+from src.rule_loader import RuleLoader
+from src.rule_model import format_port, port_bounds, representative_addresses, rule_networks
+from src.traffic_simulator import TrafficSimulator
+
+# Deciding rule of ports no rule matches
+DEFAULT = "default"
+
+
+def load_rule_file(path: str) -> List[Dict]:
+    """
+    Load a rules file, reporting rules that fail schema validation.
+    :return: Valid rules in file order.
+    """
+    loader = RuleLoader(path)
+    rules = loader.load()
+    for error in loader.errors:
+        print(f"{path}: skipping invalid rule at line {error['line']}: {error['message']}")
+    return rules
+
+
+def compile_intervals(rules: List[Dict], direction: str, protocol: str, default_action: str = "allow",
+                      source: Optional[str] = None, destination: Optional[str] = None) -> List[Tuple]:
+    """
+    Compile the first-match verdicts of one direction and protocol into sorted,
+    disjoint port intervals covering 0-65535. Only the rules' port boundaries
+    are visited, never individual ports.
+    :param default_action: Verdict for ports no rule matches (the chain policy).
+    :param source: Evaluate flows from this address only, as in CompiledPolicy.
+    :param destination: Same as source, for destination addresses.
+    :return: (low, high, action, deciding rule_id or DEFAULT) tuples in port order.
+    """
+    source = ipaddress.ip_address(source) if source else None
+    destination = ipaddress.ip_address(destination) if destination else None
+    spans = []
+    for rule in rules:
+        if rule["direction"] != direction or rule["protocol"] != protocol:
+            continue
+        if (source or destination) and (rule.get("source") or rule.get("destination")):
+            source_net, destination_net = rule_networks(rule)
+            if (source and source not in source_net) or (destination and destination not in destination_net):
+                continue
+        low, high = port_bounds(rule["port"])
+        spans.append((low, high + 1, rule))
+
+    # Elementary segments between consecutive boundaries; each is decided by one rule
+    bounds = sorted({0, PORT_COUNT}.union(*((low, end) for low, end, _ in spans)))
+    positions = {bound: index for index, bound in enumerate(bounds)}
+    owners = [None] * (len(bounds) - 1)
+    # Next segment without an owner, with path halving, so each segment is assigned once
+    next_free = list(range(len(bounds)))
+
+    def find(index):
+        while next_free[index] != index:
+            next_free[index] = next_free[next_free[index]]
+            index = next_free[index]
+        return index
+
+    for low, end, rule in spans:
+        index, stop = find(positions[low]), positions[end]
+        while index < stop:
+            owners[index] = rule
+            next_free[index] = index + 1
+            index = find(index + 1)
+
+    intervals = []
+    for index, owner in enumerate(owners):
+        if intervals and intervals[-1][3] is owner:
+            intervals[-1][1] = bounds[index + 1] - 1
+        else:
+            intervals.append([bounds[index], bounds[index + 1] - 1, None, owner])
+    return [(low, high, default_action if owner is None else owner["action"],
+             DEFAULT if owner is None else owner["rule_id"]) for low, high, _, owner in intervals]
+
+
+def diff_intervals(old: List[Tuple], new: List[Tuple]) -> List[Dict]:
+    """
+    Sweep two interval lists together in one pass and collect the port ranges
+    whose verdict differs. Adjacent ranges with the same change are joined.
+    :return: Changes with low, high, old and new actions, and the rules deciding them.
+    """
+    changes = []
+    i = j = 0
+    while i < len(old) and j < len(new):
+        (old_low, old_high, old_action, old_rule), (new_low, new_high, new_action, new_rule) = old[i], new[j]
+        low, high = max(old_low, new_low), min(old_high, new_high)
+        if old_action != new_action:
+            last = changes[-1] if changes else None
+            if last and last["high"] == low - 1 and (last["old"], last["new"]) == (old_action, new_action):
+                last["high"] = high
+            else:
+                last = {"low": low, "high": high, "old": old_action, "new": new_action,
+                        "old_rules": [], "new_rules": []}
+                changes.append(last)
+            if old_rule not in last["old_rules"]:
+                last["old_rules"].append(old_rule)
+            if new_rule not in last["new_rules"]:
+                last["new_rules"].append(new_rule)
+        if old_high == high:
+            i += 1
+        if new_high == high:
+            j += 1
+    return changes
+
+
+def _address_classes(rules: List[Dict], field: str) -> List[Tuple[Optional[str], Optional[str]]]:
+    """
+    List the classes of addresses the rules tell apart for a field.
+    :return: (representative address, 'first-last' label) per class; [(None, None)]
+             if no rule matches on the field.
+    """
+    points = representative_addresses(rules, field)
+    if points == [None]:
+        return [(None, None)]
+    addresses = [ipaddress.ip_address(point) for point in points]
+    classes = []
+    for index, first in enumerate(addresses):
+        following = addresses[index + 1] if index + 1 < len(addresses) else None
+        if following is not None and following.version == first.version:
+            last = following - 1
+        else:
+            last = ipaddress.ip_address(2 ** first.max_prefixlen - 1)
+        classes.append((str(first), str(first) if first == last else f"{first}-{last}"))
+    return classes
+
+
+def diff_policies(old_rules: List[Dict], new_rules: List[Dict], default_action: str = "allow",
+                  source: Optional[str] = None, destination: Optional[str] = None) -> List[Dict]:
+    """
+    Find every flow whose verdict differs between two rule lists, over the whole
+    port space of each direction and protocol. Without an address pair, every
+    class of source and destination addresses the rules tell apart is checked;
+    a change that holds for only some classes names them.
+    :param source: Check flows from this address only.
+    :param destination: Check flows to this address only.
+    :return: Changes ordered by direction, protocol and port, each with ports,
+             low, high, old and new actions and deciding rules, plus 'source'
+             and 'destination' address ranges when not every class changes.
+    """
+    if source is None and destination is None:
+        both = old_rules + new_rules
+        sources, destinations = _address_classes(both, "source"), _address_classes(both, "destination")
+    else:
+        sources, destinations = [(source, source)], [(destination, destination)]
+    pairs = [(s, d) for s in sources for d in destinations]
+
+    old_groups, new_groups = defaultdict(list), defaultdict(list)
+    for groups, rules in ((old_groups, old_rules), (new_groups, new_rules)):
+        for rule in rules:
+            groups[(rule["direction"], rule["protocol"])].append(rule)
+
+    covered = {}  # change -> address classes it holds for
+    with metrics.span("policy.diff"):
+        for (pair_source, source_label), (pair_destination, destination_label) in pairs:
+            for direction in DIRECTIONS:
+                for protocol in PROTOCOLS:
+                    old = compile_intervals(old_groups[(direction, protocol)], direction, protocol,
+                                            default_action, pair_source, pair_destination)
+                    new = compile_intervals(new_groups[(direction, protocol)], direction, protocol,
+                                            default_action, pair_source, pair_destination)
+                    for change in diff_intervals(old, new):
+                        key = (DIRECTIONS.index(direction), PROTOCOLS.index(protocol), change["low"],
+                               change["high"], change["old"], change["new"], tuple(change["old_rules"]),
+                               tuple(change["new_rules"]))
+                        covered.setdefault(key, []).append((source_label, destination_label))
+
+    changes = []
+    for key in sorted(covered, key=lambda key: key[:4]):
+        d, p, low, high, old_action, new_action, old_rules_key, new_rules_key = key
+        change = {"direction": DIRECTIONS[d], "protocol": PROTOCOLS[p], "ports": format_port((low, high)),
+                  "low": low, "high": high, "old": old_action, "new": new_action,
+                  "old_rules": list(old_rules_key), "new_rules": list(new_rules_key)}
+        if len(covered[key]) == len(pairs):
+            changes.append(change)
+            continue
+        for source_label, destination_label in covered[key]:
+            changes.append(dict(change, **({"source": source_label} if source_label else {}),
+                                **({"destination": destination_label} if destination_label else {})))
+    return changes
+
+
+def confirm_changes(changes: List[Dict], simulator: TrafficSimulator) -> List[Dict]:
+    """
+    Probe the first and last port of each changed range on the live firewall
+    and check that it already gives the new verdict.
+    :param changes: Output of diff_policies() for the probes' own addresses.
+    :return: The same changes, each with 'observed' ({port: verdict}) and 'status'
+             ('confirmed', or 'unconfirmed' if any probe disagreed with the new verdict).
+    """
+    probes = []
+    for change in changes:
+        for port in sorted({change["low"], change["high"]}):
+            probes.append((change["protocol"], port, change["direction"]))
+    observed = iter(simulator.simulate_batch(probes)) if probes else iter([])
+    for change in changes:
+        change["observed"] = {port: next(observed) for port in sorted({change["low"], change["high"]})}
+        expected = "allowed" if change["new"] == "allow" else "blocked"
+        change["status"] = ("confirmed" if all(verdict == expected for verdict in change["observed"].values())
+                            else "unconfirmed")
+    return changes
+
+
+def format_change(change: Dict) -> str:
+    """
+    Describe a change on one line, e.g. 'incoming tcp 8000:8080: allow -> block (rules 3 -> 7)'.
+    """
+    line = f"{change['direction']} {change['protocol']} {change['ports']}: {change['old']} -> {change['new']}"
+    line += f" (rules {', '.join(map(str, change['old_rules']))} -> {', '.join(map(str, change['new_rules']))})"
+    if "source" in change or "destination" in change:
+        line += f" from {change.get('source') or 'any'} to {change.get('destination') or 'any'}"
+    if "status" in change:
+        line += f" [{change['status']}]"
+    return line
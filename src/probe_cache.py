@@ -0,0 +1,113 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS probe_results (
+    protocol TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    direction TEXT NOT NULL,
+    firewall_state TEXT NOT NULL,
+    result TEXT NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (protocol, port, direction, firewall_state)
+);
+CREATE INDEX IF NOT EXISTS probe_results_created ON probe_results (created);
+"""
+
+
+class ProbeCache:
+    """Class to persist traffic simulation results between validation runs."""
+
+    def __init__(self, path: str = "cache/probe_cache.sqlite3", ttl: float = 86400,
+                 max_entries: int = 1000000, commit_every: int = 1000):
+        """
+        Open (or create) the cache database.
+        :param path: Path to the SQLite database file.
+        :param ttl: Seconds a cached result stays valid.
+        :param max_entries: Maximum number of results kept; the oldest are evicted first.
+        :param commit_every: Number of writes batched into one transaction.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        self._pending_writes = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript(SCHEMA)
+
+    def get(self, protocol: str, port: int, direction: str, firewall_state: str) -> Optional[str]:
+        """
+        Look up a cached result.
+        :param firewall_state: Fingerprint of the active ruleset.
+        :return: The cached result, or None on a miss or expired entry.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT result FROM probe_results WHERE protocol = ? AND port = ? AND direction = ? "
+                "AND firewall_state = ? AND created >= ?",
+                (protocol, port, direction, firewall_state, time.time() - self.ttl)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, protocol: str, port: int, direction: str, firewall_state: str, result: str) -> None:
+        """
+        Store a result, evicting old entries once a batch of writes is committed.
+        :param firewall_state: Fingerprint of the active ruleset.
+        :param result: Result returned by TrafficSimulator.simulate_traffic.
+        """
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO probe_results VALUES (?, ?, ?, ?, ?, ?)",
+                (protocol, port, direction, firewall_state, result, time.time())
+            )
+            self._pending_writes += 1
+            if self._pending_writes >= self.commit_every:
+                self._commit()
+
+    def close(self) -> None:
+        """
+        Commit pending writes, evict old entries and close the database.
+        """
+        with self._lock:
+            self._commit()
+            self._connection.close()
+
+    def _commit(self) -> None:
+        """
+        Drop expired and surplus entries and commit. Caller holds the lock.
+        """
+        self._connection.execute("DELETE FROM probe_results WHERE created < ?", (time.time() - self.ttl,))
+        self._connection.execute(
+            "DELETE FROM probe_results WHERE rowid IN (SELECT rowid FROM probe_results "
+            "ORDER BY created DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+        self._connection.commit()
+        self._pending_writes = 0
@@ -0,0 +1,364 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import os
+import random
+import selectors
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+from src.adaptive_timeout import AdaptiveTimeout
+from src.packet_capture import PacketCapture
+
+TCP_FLAG_SYN = 0x02
+TCP_FLAG_RST = 0x04
+TCP_FLAG_ACK = 0x10
+
+ICMP_ECHO_REPLY = 0
+ICMP_UNREACHABLE = 3
+ICMP_ECHO_REQUEST = 8
+ICMP_PORT_UNREACHABLE = 3
+
+PROTOCOL_NUMBERS = {"icmp": socket.IPPROTO_ICMP, "tcp": socket.IPPROTO_TCP, "udp": socket.IPPROTO_UDP}
+PROTOCOL_NAMES = {number: name for name, number in PROTOCOL_NUMBERS.items()}
+# Raw probes use source ports from Linux's default ephemeral range; ICMP echoes use the sequence number
+SOURCE_PORTS = range(32768, 61000)
+PROBE_IDS = {"tcp": SOURCE_PORTS, "udp": SOURCE_PORTS, "icmp": range(0x10000)}
+
+
+def checksum(data: bytes) -> int:
+    """
+    Compute the Internet checksum (RFC 1071) of a byte string.
+    :param data: Bytes to checksum.
+    :return: 16-bit checksum.
+    """
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+def build_tcp_syn(src: str, dst: str, sport: int, dport: int, seq: int) -> bytes:
+    """
+    Build a TCP SYN segment with a valid checksum.
+    :return: TCP header bytes (the kernel adds the IP header).
+    """
+    header = struct.pack("!HHLLBBHHH", sport, dport, seq, 0, 5 << 4, TCP_FLAG_SYN, 65535, 0, 0)
+    pseudo = struct.pack("!4s4sBBH", socket.inet_aton(src), socket.inet_aton(dst), 0,
+                         socket.IPPROTO_TCP, len(header))
+    return header[:16] + struct.pack("!H", checksum(pseudo + header)) + header[18:]
+
+
+def build_udp(src: str, dst: str, sport: int, dport: int, payload: bytes = b"") -> bytes:
+    """
+    Build a UDP datagram with a valid checksum.
+    :return: UDP header and payload bytes.
+    """
+    length = 8 + len(payload)
+    datagram = struct.pack("!HHHH", sport, dport, length, 0) + payload
+    pseudo = struct.pack("!4s4sBBH", socket.inet_aton(src), socket.inet_aton(dst), 0,
+                         socket.IPPROTO_UDP, length)
+    return datagram[:6] + struct.pack("!H", checksum(pseudo + datagram) or 0xFFFF) + datagram[8:]
+
+
+def build_icmp_echo(ident: int, seq: int, payload: bytes = b"firewall-tester") -> bytes:
+    """
+    Build an ICMP echo request with a valid checksum.
+    :return: ICMP message bytes.
+    """
+    message = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, ident, seq) + payload
+    return message[:2] + struct.pack("!H", checksum(message)) + message[4:]
+
+
+def parse_reply(packet: bytes) -> Optional[Tuple[Tuple, str]]:
+    """
+    Match a received IPv4 packet to the probe it answers.
+    SYN-ACK, RST, UDP replies, echo replies and ICMP port unreachable all
+    prove the probe got through the firewall; other ICMP unreachables
+    (e.g. administratively prohibited) mean it was blocked.
+    :param packet: Raw IPv4 packet including its header.
+    :return: (probe key, verdict) or None if the packet answers no probe.
+    """
+    if len(packet) < 20:
+        return None
+    ihl = (packet[0] & 0x0F) * 4
+    protocol = packet[9]
+    l4 = packet[ihl:]
+
+    if protocol == socket.IPPROTO_TCP and len(l4) >= 14:
+        sport, dport, _, _, _, flags = struct.unpack("!HHLLBB", l4[:14])
+        if flags & TCP_FLAG_RST or (flags & TCP_FLAG_SYN and flags & TCP_FLAG_ACK):
+            return ("tcp", dport, sport), "allowed"
+    elif protocol == socket.IPPROTO_UDP and len(l4) >= 8:
+        sport, dport = struct.unpack("!HH", l4[:4])
+        return ("udp", dport, sport), "allowed"
+    elif protocol == socket.IPPROTO_ICMP and len(l4) >= 8:
+        icmp_type, code = l4[0], l4[1]
+        if icmp_type == ICMP_ECHO_REPLY:
+            ident, seq = struct.unpack("!HH", l4[4:8])
+            return ("icmp", ident, seq), "allowed"
+        if icmp_type == ICMP_UNREACHABLE and len(l4) >= 36:
+            inner = l4[8:]
+            inner_ihl = (inner[0] & 0x0F) * 4
+            inner_protocol = PROTOCOL_NAMES.get(inner[9])
+            if inner_protocol in ("tcp", "udp") and len(inner) >= inner_ihl + 4:
+                sport, dport = struct.unpack("!HH", inner[inner_ihl:inner_ihl + 4])
+                verdict = "allowed" if code == ICMP_PORT_UNREACHABLE else "blocked"
+                return (inner_protocol, sport, dport), verdict
+    return None
+
+
+class _PendingProbe:
+    """A probe that has been sent and is waiting for its reply."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.verdict = "blocked"
+        self.sent = 0.0
+        self.received = None
+
+
+class RawProbeEngine:
+    """Class to send TCP SYN, UDP and ICMP probes from raw sockets in-process."""
+
+    def __init__(self, target: str = "127.0.0.1", timeout: float = 1.0,
+                 timing: Optional[AdaptiveTimeout] = None, capture: Optional[PacketCapture] = None):
+        """
+        Initialize the engine. Sockets are opened by start().
+        :param target: Address to probe.
+        :param timeout: Seconds to wait for a reply before a probe counts as blocked.
+        :param timing: Learn the deadline from reply round-trip times instead, and
+                       resend probes that met silence up to timing.retries times.
+        :param capture: Packet capture that collects evidence for probes that ask for it.
+        """
+        self.target = target
+        self.timeout = timeout
+        self.timing = timing
+        self.capture = capture
+        self.source = self._source_address(target)
+        self._sockets: Dict[str, socket.socket] = {}
+        self._pending: Dict[Tuple, _PendingProbe] = {}
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()  # Serializes start() and close()
+        self._ident = os.getpid() & 0xFFFF
+        # Ids not held by an outstanding probe, handed out oldest-freed first so a
+        # late reply is unlikely to meet a new probe that reuses its id
+        self._free_ids = {protocol: deque(ids) for protocol, ids in PROBE_IDS.items()}
+        for free in self._free_ids.values():
+            free.rotate(random.randrange(len(free)))
+        self._selector = None
+        self._receiver = None
+        self._running = False
+
+    @staticmethod
+    def _source_address(target: str) -> str:
+        """
+        Find the local address the kernel routes to the target from.
+        :param target: Address to probe.
+        :return: Local IPv4 address.
+        """
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.connect((target, 9))
+            return sock.getsockname()[0]
+
+    def start(self) -> None:
+        """
+        Open one raw socket per protocol and start the shared receive loop.
+        Requires CAP_NET_RAW. Safe to call from several threads; only the first starts the engine.
+        """
+        with self._start_lock:
+            if self._running:
+                return
+            try:
+                for name, number in PROTOCOL_NUMBERS.items():
+                    self._sockets[name] = socket.socket(socket.AF_INET, socket.SOCK_RAW, number)
+            except PermissionError as e:
+                self._close()
+                raise Exception(f"Raw probe engine requires root privileges: {e}")
+
+            self._selector = selectors.DefaultSelector()
+            for sock in self._sockets.values():
+                sock.setblocking(False)
+                self._selector.register(sock, selectors.EVENT_READ)
+            self._running = True
+            self._receiver = threading.Thread(target=self._receive_loop, name="RawProbeReceiver", daemon=True)
+            self._receiver.start()
+
+    def close(self) -> None:
+        """
+        Stop the receive loop and close all sockets.
+        """
+        with self._start_lock:
+            self._close()
+
+    def _close(self) -> None:
+        self._running = False
+        if self._receiver is not None:
+            self._receiver.join()
+            self._receiver = None
+        if self._selector is not None:
+            self._selector.close()
+            self._selector = None
+        for sock in self._sockets.values():
+            sock.close()
+        self._sockets.clear()
+
+    def probe(self, protocol: str, port: int, direction: str, evidence: Optional[Dict] = None) -> str:
+        """
+        Send a single probe and wait for its verdict.
+        :param protocol: The protocol to use ('tcp', 'udp', or 'icmp').
+        :param port: The destination port to test.
+        :param direction: The traffic direction ('incoming' or 'outgoing').
+        :param evidence: Filled with the captured evidence for the probe, if capturing.
+        :return: 'allowed' if a reply arrived, 'blocked' otherwise.
+        """
+        return self.probe_batch([(protocol, port, direction)], None if evidence is None else [evidence])[0]
+
+    def probe_batch(self, probes: List[Tuple[str, int, str]], evidence: Optional[List[Dict]] = None) -> List[str]:
+        """
+        Send a batch of probes back to back and collect their verdicts.
+        Both directions target the destination port on the configured address,
+        matching the '--dport' match FirewallManager installs.
+        :param probes: List of (protocol, port, direction) tuples.
+        :param evidence: One dict per probe, filled with the captured evidence for
+                         its last attempt, if capturing.
+        :return: Verdicts in the same order as the probes.
+        """
+        self.start()
+        capture = self.capture if evidence is not None else None
+        if capture is not None:
+            capture.start()
+        watches = {}
+        replied_indices = set()
+        verdicts = ["blocked"] * len(probes)
+        silent = list(range(len(probes)))
+        attempts = 1 + (self.timing.retries if self.timing is not None else 0)
+        for attempt in range(attempts):
+            waiting = []
+            try:
+                for index in silent:
+                    protocol, port, _ = probes[index]
+                    key, packet, seq = self._build_probe(protocol, port)
+                    pending = _PendingProbe()
+                    with self._lock:
+                        self._pending[key] = pending
+                    waiting.append((index, key, pending))
+                    if capture is not None:
+                        if index in watches:
+                            capture.finish(watches[index], replied=False)
+                        watches[index] = capture.watch(protocol, key[1], key[2], seq)
+                    pending.sent = time.monotonic()
+                    self._sockets[protocol].sendto(packet, (self.target, 0))
+            except Exception:
+                for _, key, pending in waiting:
+                    self.release(key, pending)
+                raise
+
+            timeout = self.timeout if self.timing is None else self.timing.deadline(self.target, attempt)
+            deadline = time.monotonic() + timeout
+            silent = []
+            for index, key, pending in waiting:
+                replied = pending.event.wait(max(0.0, deadline - time.monotonic()))
+                self.release(key, pending)
+                if replied:
+                    # Any reply, including an ICMP prohibited, is a final verdict
+                    replied_indices.add(index)
+                    verdicts[index] = pending.verdict
+                    if self.timing is not None:
+                        self.timing.record(self.target, pending.received - pending.sent)
+                else:
+                    silent.append(index)
+            if not silent or self.timing is None or timeout >= self.timing.max_timeout:
+                break  # Waiting the full timeout is conclusive
+        for index, watch in watches.items():
+            evidence[index].update(capture.finish(watch, replied=index in replied_indices))
+        return verdicts
+
+    def send_probe(self, protocol: str, port: int) -> Tuple[Tuple, _PendingProbe]:
+        """
+        Send one probe without waiting for its reply, for callers that pace many
+        probes themselves. The pending probe's event is set when a reply arrives.
+        :param protocol: The protocol to use ('tcp', 'udp', or 'icmp').
+        :param port: The destination port to test.
+        :return: (probe key, pending probe); pass both to release() when done.
+        """
+        key, packet, _ = self._build_probe(protocol, port)
+        pending = _PendingProbe()
+        with self._lock:
+            self._pending[key] = pending
+        pending.sent = time.monotonic()
+        try:
+            self._sockets[protocol].sendto(packet, (self.target, 0))
+        except Exception:
+            self.release(key, pending)
+            raise
+        return key, pending
+
+    def release(self, key: Tuple, pending: _PendingProbe) -> None:
+        """
+        Stop waiting for a reply to a probe sent with send_probe(), and free its
+        source port (or ICMP sequence number) for later probes.
+        """
+        with self._lock:
+            if self._pending.get(key) is pending:
+                del self._pending[key]
+                self._free_ids[key[0]].append(key[2] if key[0] == "icmp" else key[1])
+
+    def _build_probe(self, protocol: str, port: int) -> Tuple[Tuple, bytes, Optional[int]]:
+        """
+        Build the packet for a probe and the key its reply will carry. The probe
+        takes a free source port (or ICMP sequence number) until release().
+        :return: (probe key, packet bytes, TCP sequence number or None).
+        """
+        if protocol not in PROBE_IDS:
+            raise ValueError(f"Unsupported protocol: {protocol}")
+        with self._lock:
+            free = self._free_ids[protocol]
+            if not free:
+                raise Exception(f"All {len(PROBE_IDS[protocol])} {protocol} probe ids are held by outstanding "
+                                "probes; send fewer probes per timeout")
+            probe_id = free.popleft()
+
+        if protocol == "tcp":
+            seq = random.getrandbits(32)
+            return ("tcp", probe_id, port), build_tcp_syn(self.source, self.target, probe_id, port, seq), seq
+        if protocol == "udp":
+            return ("udp", probe_id, port), build_udp(self.source, self.target, probe_id, port), None
+        return ("icmp", self._ident, probe_id), build_icmp_echo(self._ident, probe_id), None
+
+    def _receive_loop(self) -> None:
+        """
+        Read replies from every raw socket and resolve the matching probes.
+        """
+        while self._running:
+            for selector_key, _ in self._selector.select(timeout=0.1):
+                try:
+                    packet = selector_key.fileobj.recv(65535)
+                except BlockingIOError:
+                    continue
+                match = parse_reply(packet)
+                if match is None:
+                    continue
+                key, verdict = match
+                with self._lock:
+                    pending = self._pending.get(key)
+                if pending is not None and not pending.event.is_set():
+                    pending.verdict = verdict
+                    pending.received = time.monotonic()
+                    pending.event.set()
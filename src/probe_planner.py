@@ -0,0 +1,101 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+from collections import defaultdict
+from typing import Dict, List, Tuple
+from src.rule_compiler import NO_MATCH, PORT_COUNT, CompiledPolicy
+from src.rule_model import port_bounds
+
+
+class ProbePlanner:
+    """Class to plan a deduplicated set of probes that exercises every rule's edges."""
+
+    def __init__(self, rules: List[Dict], policy: CompiledPolicy):
+        """
+        Initialize ProbePlanner.
+        :param rules: Rules in the rules file format.
+        :param policy: The same rules compiled, used to find the first rule matching each port class.
+        """
+        self.rules = rules
+        self.policy = policy
+        self.index: Dict[Tuple[str, int, str], int] = {}
+
+    def plan(self) -> List[Dict]:
+        """
+        Split each (direction, protocol) port space at every rule boundary into
+        classes of ports that all rules treat alike. Each class covered by a rule
+        is probed at its first and last port, so a live range that stops short of
+        the rule's upper bound is caught. Uncovered classes are probed at the port
+        right after a rule's range and the port right before one, where the chain
+        policy should apply, so a live range reaching too far is caught as well.
+        Every rule's lowest port starts a class and is always probed, even when
+        the compiled policy matches no rule there (a rule whose addresses exclude
+        the probe's), so identical probes from different rules collapse into one
+        and vector_for() finds every rule.
+        :return: Test vectors {protocol, port, direction, ports, owner, expected, rules}
+                 where ports is the (low, high) class the probe stands for, owner the
+                 index of the first rule matching it (NO_MATCH for the chain policy),
+                 expected the action the probe should see and rules the indices of the
+                 rules a mismatch is reported against. self.index maps
+                 (protocol, port, direction) to the vector's position.
+        """
+        boundaries = defaultdict(lambda: {0})
+        ending = defaultdict(list)  # Rules whose range ends right before a port
+        starting = defaultdict(list)  # Rules whose range starts right after a port
+        lows = set()
+        for index, rule in enumerate(self.rules):
+            low, high = port_bounds(rule["port"])
+            key = (rule["direction"], rule["protocol"])
+            boundaries[key].update((low, high + 1))
+            ending[key + (high + 1,)].append(index)
+            starting[key + (low - 1,)].append(index)
+            lows.add(key + (low,))
+
+        vectors = []
+        self.index = {}
+        for (direction, protocol), points in sorted(boundaries.items()):
+            starts = sorted(points - {PORT_COUNT})
+            ends = [start - 1 for start in starts[1:]] + [PORT_COUNT - 1]
+            owners = self.policy.match([protocol] * len(starts), starts, [direction] * len(starts))
+            for start, end, owner in zip(starts, ends, owners.tolist()):
+                if owner != NO_MATCH:
+                    probes = {start: [owner], end: [owner]}
+                    expected = self.rules[owner]["action"]
+                else:
+                    probes = defaultdict(list)
+                    probes[start] += ending[(direction, protocol, start)]
+                    probes[end] += starting[(direction, protocol, end)]
+                    expected = self.policy.default_action
+                for port, charged in probes.items():
+                    if not charged and (direction, protocol, port) not in lows:
+                        continue  # Gap away from any rule, left to the chain policy
+                    self.index[(protocol, port, direction)] = len(vectors)
+                    vectors.append({
+                        "protocol": protocol,
+                        "port": port,
+                        "direction": direction,
+                        "ports": (start, end),
+                        "owner": owner,
+                        "expected": expected,
+                        "rules": charged
+                    })
+        return vectors
+
+    def vector_for(self, rule: Dict) -> int:
+        """
+        Find the vector probing a rule's lowest port.
+        :param rule: One of the planned rules.
+        :return: Position in the list returned by plan().
+        """
+        return self.index[(rule["protocol"], port_bounds(rule["port"])[0], rule["direction"])]
@@ -12,26 +12,13 @@
 # 
 # You should have received a copy of the GNU General Public License
 # along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
-from typing import List, Dict
+import itertools
+import os
+from typing import Dict, Iterable, List, Optional
 from jinja2 import Template
+from src import metrics
 
-class ReportGenerator:
-    """Class to generate an HTML report for firewall rule validation."""
-
-    @staticmethod
-    def generate_html_report(results: List[Dict], output_file: str):
-        """
-        Generate an HTML report from validation results.
-        :param results: List of validation results.
-        :param output_file: Path to save the HTML report.
-        """
-        template = """
-        <html>
-        <head>
-            <title>Firewall Rule Validation Report</title>
-        </head>
-        <body>
-            <h1>Firewall Rule Validation Report</h1>
+RESULTS_TABLE = """
             <table border="1">
                 <tr>
                     <th>Rule ID</th>
@@ -50,17 +37,182 @@ class ReportGenerator:
                     <td>{{ result.direction }}</td>
                     <td>{{ result.expected_action }}</td>
                     <td>{{ result.observed_action }}</td>
-                    <td>{{ result.status }}</td>
+                    <td>{{ result.status }}{% if result.mismatched_ports %} (mismatched ports: {{ result.mismatched_ports | join(", ") }}){% endif %}{% if result.evidence %} ({{ result.evidence.summary }}){% endif %}{% if result.matched_rule %} (matched {{ result.matched_rule.summary }}{% if result.matched_rule.ambiguous %}, unparsed rules ahead also counted packets{% endif %}){% endif %}</td>
+                </tr>
+                {% endfor %}
+            </table>
+"""
+
+FINDINGS_TABLE = """
+            {% if findings %}
+            <h2>Rule Analysis</h2>
+            <table border="1">
+                <tr>
+                    <th>Rule ID</th>
+                    <th>Finding</th>
+                    <th>Related Rules</th>
+                    <th>Detail</th>
+                </tr>
+                {% for finding in findings %}
+                <tr>
+                    <td>{{ finding.rule_id }}</td>
+                    <td>{{ finding.type }}</td>
+                    <td>{{ finding.related_rule_ids | join(", ") }}</td>
+                    <td>{{ finding.detail }}</td>
                 </tr>
                 {% endfor %}
             </table>
+            {% endif %}
+"""
+
+REPORT_TEMPLATE = Template("""
+        <html>
+        <head>
+            <title>Firewall Rule Validation Report</title>
+        </head>
+        <body>
+            <h1>Firewall Rule Validation Report</h1>""" + RESULTS_TABLE + FINDINGS_TABLE + """
         </body>
         </html>
-        """
-        html_template = Template(template)
-        html_content = html_template.render(results=results)
+        """)
+
+PAGE_TEMPLATE = Template("""
+        <html>
+        <head>
+            <title>Firewall Rule Validation Report - Page {{ number }}</title>
+        </head>
+        <body>
+            <h1>Firewall Rule Validation Report - Page {{ number }}</h1>
+            <p>
+                <a href="{{ index }}">Summary</a>
+                {% if previous_page %}| <a href="{{ previous_page }}">Previous</a>{% endif %}
+                {% if next_page %}| <a href="{{ next_page }}">Next</a>{% endif %}
+            </p>""" + RESULTS_TABLE + """
+        </body>
+        </html>
+        """)
+
+INDEX_TEMPLATE = Template("""
+        <html>
+        <head>
+            <title>Firewall Rule Validation Report</title>
+        </head>
+        <body>
+            <h1>Firewall Rule Validation Report</h1>
+            <p>Total: {{ total }}, Passed: {{ passed }}, Failed: {{ failed }}</p>
+            <table border="1">
+                <tr>
+                    <th>Page</th>
+                    <th>Rule IDs</th>
+                    <th>Results</th>
+                    <th>Failed</th>
+                </tr>
+                {% for page in pages %}
+                <tr>
+                    <td><a href="{{ page.file }}">{{ page.number }}</a></td>
+                    <td>{{ page.first_rule_id }} - {{ page.last_rule_id }}</td>
+                    <td>{{ page.count }}</td>
+                    <td>{{ page.failed }}</td>
+                </tr>
+                {% endfor %}
+            </table>""" + FINDINGS_TABLE + """
+        </body>
+        </html>
+        """)
+
 
-        with open(output_file, "w") as file:
-            file.write(html_content)
+class ReportGenerator:
+    """Class to generate an HTML report for firewall rule validation."""
+
+    @staticmethod
+    def generate_html_report(results: List[Dict], output_file: str, findings: Optional[List[Dict]] = None):
+        """
+        Generate an HTML report from validation results.
+        :param results: List of validation results.
+        :param output_file: Path to save the HTML report.
+        :param findings: Optional rule analysis findings from RuleAnalyzer.
+        """
+        os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+        with metrics.span("report.render"), open(output_file, "w") as file:
+            REPORT_TEMPLATE.stream(results=results, findings=findings).dump(file)
+            metrics.increment("bytes_written", file.tell())
 
         print(f"Report generated: {output_file}")
+
+    @staticmethod
+    def generate_paginated_report(results: Iterable[Dict], output_file: str, page_size: int = 1000,
+                                  findings: Optional[List[Dict]] = None,
+                                  previous_results: Optional[List[Dict]] = None) -> List[str]:
+        """
+        Generate a paginated HTML report, streaming results from an iterator.
+        Only one page of results is held in memory at a time. Pages are written
+        next to output_file, which becomes a summary index linking to them.
+        :param results: Iterable of validation results, e.g. RuleValidator.iter_validate_rules().
+        :param output_file: Path to save the summary index page.
+        :param page_size: Number of results per page.
+        :param findings: Optional rule analysis findings from RuleAnalyzer.
+        :param previous_results: Results the existing report was generated from.
+                                 Pages whose results are unchanged are not rewritten,
+                                 and pages past the new end are removed.
+        :return: Paths of the written files, index first.
+        """
+        if page_size < 1:
+            raise ValueError("page_size must be at least 1")
+        directory = os.path.dirname(output_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        stem = os.path.splitext(os.path.basename(output_file))[0]
+
+        def page_file(number: int) -> str:
+            return f"{stem}_page_{number}.html"
+
+        pages = []
+        written = []
+        results = iter(results)
+        # Look one result ahead so each page knows whether a next page exists.
+        lookahead = next(results, None)
+        while lookahead is not None:
+            chunk = [lookahead] + list(itertools.islice(results, page_size - 1))
+            lookahead = next(results, None)
+            number = len(pages) + 1
+            page = {
+                "number": number,
+                "file": page_file(number),
+                "count": len(chunk),
+                "failed": sum(1 for result in chunk if result["status"] != "pass"),
+                "first_rule_id": chunk[0]["rule_id"],
+                "last_rule_id": chunk[-1]["rule_id"]
+            }
+            pages.append(page)
+            path = os.path.join(directory, page["file"])
+            start = (number - 1) * page_size
+            if (previous_results is not None and os.path.exists(path)
+                    and chunk == previous_results[start:start + page_size]
+                    and (lookahead is not None) == (len(previous_results) > start + page_size)):
+                continue
+            written.append(path)
+            with metrics.span("report.render"), open(path, "w") as file:
+                PAGE_TEMPLATE.stream(
+                    results=chunk,
+                    number=number,
+                    index=os.path.basename(output_file),
+                    previous_page=page_file(number - 1) if number > 1 else None,
+                    next_page=page_file(number + 1) if lookahead is not None else None
+                ).dump(file)
+                metrics.increment("bytes_written", file.tell())
+
+        if previous_results is not None:
+            for number in range(len(pages) + 1, -(-len(previous_results) // page_size) + 1):
+                path = os.path.join(directory, page_file(number))
+                if os.path.exists(path):
+                    os.remove(path)
+
+        total = sum(page["count"] for page in pages)
+        failed = sum(page["failed"] for page in pages)
+        with metrics.span("report.render"), open(output_file, "w") as file:
+            INDEX_TEMPLATE.stream(pages=pages, total=total, passed=total - failed, failed=failed,
+                                  findings=findings).dump(file)
+            metrics.increment("bytes_written", file.tell())
+
+        print(f"Report generated: {output_file} ({len(pages)} pages, {len(written)} written)")
+        return [output_file] + written
@@ -0,0 +1,158 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import os
+import pandas as pd
+from typing import Dict, Iterable, List
+from src.rule_model import format_port, port_bounds
+
+CATEGORIES = {
+    "protocol": ["tcp", "udp", "icmp"],
+    "direction": ["incoming", "outgoing"],
+    "expected_action": ["allow", "block"],
+    "observed_action": ["allow", "block"],
+    "policy_action": ["allow", "block"],
+    "status": ["pass", "fail"]
+}
+
+# IANA port bands
+PORT_BANDS = [-1, 1023, 49151, 65535]
+PORT_BAND_LABELS = ["well-known", "registered", "dynamic"]
+
+EXPORT_FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".parquet": "parquet", ".feather": "feather"}
+
+
+class ResultsBuilder:
+    """Class to accumulate validation results column by column."""
+
+    def __init__(self):
+        self.columns = {name: [] for name in ["rule_id", "port", "port_low", "port_high"] + list(CATEGORIES)}
+
+    def add(self, result: Dict) -> Dict:
+        """
+        Append a result to the columns.
+        :param result: Validation result.
+        :return: The same result, so the builder can sit inside a generator pipeline.
+        """
+        low, high = port_bounds(result["port"])
+        self.columns["rule_id"].append(result["rule_id"])
+        self.columns["port"].append(str(result["port"]))
+        self.columns["port_low"].append(low)
+        self.columns["port_high"].append(high)
+        for name in CATEGORIES:
+            self.columns[name].append(result.get(name))
+        return result
+
+    def build(self) -> "ResultsStore":
+        """
+        Convert the accumulated columns into a typed table.
+        :return: ResultsStore.
+        """
+        columns = self.columns
+        frame = pd.DataFrame({
+            "rule_id": pd.Series(columns["rule_id"], dtype="int64" if all(
+                isinstance(rule_id, int) for rule_id in columns["rule_id"]) else "string"),
+            "port": pd.Series(columns["port"], dtype="string"),
+            "port_low": pd.Series(columns["port_low"], dtype="uint16"),
+            "port_high": pd.Series(columns["port_high"], dtype="uint16"),
+            **{name: pd.Categorical(columns[name], categories=categories)
+               for name, categories in CATEGORIES.items()}
+        })
+        return ResultsStore(frame)
+
+
+class ResultsStore:
+    """Class to hold validation results as a typed, columnar table."""
+
+    def __init__(self, frame: pd.DataFrame):
+        """
+        Wrap a results DataFrame. Use from_results() to build one.
+        :param frame: DataFrame with one row per validation result.
+        """
+        self.frame = frame
+
+    @classmethod
+    def from_results(cls, results: Iterable[Dict]) -> "ResultsStore":
+        """
+        Build a store from validation results, consuming them one at a time
+        into per-column lists rather than keeping the result dicts.
+        :param results: Iterable of validation results, e.g. RuleValidator.iter_validate_rules().
+        :return: ResultsStore.
+        """
+        builder = ResultsBuilder()
+        for result in results:
+            builder.add(result)
+        return builder.build()
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    def to_results(self) -> List[Dict]:
+        """
+        Convert back to result dicts, e.g. for ReportGenerator.
+        :return: List of validation results.
+        """
+        frame = self.frame.astype(object).where(self.frame.notna(), None)
+        results = frame.to_dict(orient="records")
+        for result in results:
+            result["port"] = format_port((int(result.pop("port_low")), int(result.pop("port_high"))))
+            if result["policy_action"] is None:
+                del result["policy_action"]
+        return results
+
+    def summary(self, by: str) -> pd.DataFrame:
+        """
+        Count passes and failures per group.
+        :param by: 'protocol', 'direction' or 'port_band'.
+        :return: DataFrame indexed by group with pass, fail and total columns.
+        """
+        if by == "port_band":
+            keys = pd.cut(self.frame["port_low"].astype("int32"), bins=PORT_BANDS, labels=PORT_BAND_LABELS)
+        elif by in ("protocol", "direction"):
+            keys = self.frame[by]
+        else:
+            raise ValueError(f"Unsupported summary column: {by}")
+
+        counts = pd.crosstab(keys, self.frame["status"], dropna=False).reindex(columns=["pass", "fail"], fill_value=0)
+        counts["total"] = counts["pass"] + counts["fail"]
+        counts.index.name = by
+        counts.columns.name = None
+        return counts
+
+    def export(self, path: str) -> None:
+        """
+        Write the results to a file, choosing the format from its extension
+        (.csv, .jsonl, .parquet or .feather). Parquet and Feather need pyarrow.
+        :param path: Output file path.
+        """
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format: {extension or path}")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        export_format = EXPORT_FORMATS[extension]
+        try:
+            if export_format == "csv":
+                self.frame.to_csv(path, index=False)
+            elif export_format == "jsonl":
+                self.frame.to_json(path, orient="records", lines=True)
+            elif export_format == "parquet":
+                self.frame.to_parquet(path, index=False)
+            else:
+                self.frame.to_feather(path)
+        except ImportError as e:
+            raise Exception(f"{export_format} export requires pyarrow: {e}")
+        print(f"Results exported: {path}")
@@ -0,0 +1,369 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Set, Tuple
+from src.rule_model import PORT_COUNT, port_bounds, rule_networks
+
+_FULL = -1     # Block covered by several owners
+_PARTIAL = -2  # Block partly covered
+
+
+class _IntervalIndex:
+    """
+    Disjoint port segments, each owned by the first rule that covers it, kept
+    in a sparse segment tree over the port space. Fully covered blocks are
+    skipped, so assigning gaps costs O(log ports) per new segment.
+    """
+
+    def __init__(self):
+        self.nodes: Dict[int, int] = {}  # Node -> owner of its whole block, _FULL or _PARTIAL
+
+    def overlapping(self, low: int, high: int) -> List[Tuple[int, int, int]]:
+        """
+        Return the segments intersecting [low, high], clipped to it.
+        :return: List of (start, end, owner) tuples in port order.
+        """
+        pieces = []
+        state = self.nodes.get(1)
+        if state is not None and state >= 0:
+            pieces.append((low, high, state))
+        elif state is not None:
+            self._collect(1, 0, PORT_COUNT - 1, low, high, pieces)
+        return pieces
+
+    def insert_gaps(self, low: int, high: int, owner: int) -> List[Tuple[int, int]]:
+        """
+        Assign the still uncovered parts of [low, high] to owner.
+        :return: The (start, end) segments assigned.
+        """
+        claimed = []
+        state = self.nodes.get(1)
+        if state is None and low == 0 and high == PORT_COUNT - 1:
+            self.nodes[1] = owner
+            claimed.append((low, high))
+        elif state is None or state == _PARTIAL:
+            self._fill(1, 0, PORT_COUNT - 1, low, high, owner, claimed)
+        return claimed
+
+    def _collect(self, node: int, node_low: int, node_high: int, low: int, high: int,
+                 pieces: List[Tuple[int, int, int]]) -> None:
+        """
+        Append the owned blocks below a split node that intersect [low, high],
+        joining neighbours with the same owner.
+        """
+        nodes = self.nodes
+        middle = (node_low + node_high) // 2
+        for child, child_low, child_high in ((2 * node, node_low, middle), (2 * node + 1, middle + 1, node_high)):
+            if child_high < low or child_low > high:
+                continue
+            state = nodes.get(child)
+            if state is None:
+                continue
+            if state < 0:
+                self._collect(child, child_low, child_high, low, high, pieces)
+                continue
+            start, end = max(child_low, low), min(child_high, high)
+            if pieces and pieces[-1][2] == state and pieces[-1][1] == start - 1:
+                pieces[-1] = (pieces[-1][0], end, state)
+            else:
+                pieces.append((start, end, state))
+
+    def _fill(self, node: int, node_low: int, node_high: int, low: int, high: int, owner: int,
+              claimed: List[Tuple[int, int]]) -> None:
+        """
+        Assign the uncovered parts of [low, high] below a partly covered node,
+        then mark it full once both children are.
+        """
+        nodes = self.nodes
+        middle = (node_low + node_high) // 2
+        for child, child_low, child_high in ((2 * node, node_low, middle), (2 * node + 1, middle + 1, node_high)):
+            if child_high < low or child_low > high:
+                continue
+            state = nodes.get(child)
+            if state is None and low <= child_low and child_high <= high:
+                nodes[child] = owner
+                if claimed and claimed[-1][1] == child_low - 1:
+                    claimed[-1] = (claimed[-1][0], child_high)
+                else:
+                    claimed.append((child_low, child_high))
+            elif state is None or state == _PARTIAL:
+                self._fill(child, child_low, child_high, low, high, owner, claimed)
+        left, right = nodes.get(2 * node, _PARTIAL), nodes.get(2 * node + 1, _PARTIAL)
+        nodes[node] = _FULL if left != _PARTIAL and right != _PARTIAL else _PARTIAL
+
+
+class _ClaimIndex:
+    """
+    The network pairs that claim ports, kept in a sparse segment tree over the
+    port space, so the pairs claiming any port of a range are found in
+    O(log ports) lookups.
+    """
+
+    def __init__(self):
+        self.keys: Dict[int, Set[Tuple]] = {}   # Node -> pairs claiming its whole block
+        self.below: Dict[int, Set[Tuple]] = {}  # Node -> pairs claiming any port of its block
+
+    def add(self, low: int, high: int, key: Tuple) -> None:
+        """
+        Record that a network pair claims [low, high].
+        """
+        keys, below = self.keys, self.below
+        left, right = low + PORT_COUNT, high + PORT_COUNT + 1
+        for leaf in (left, right - 1):
+            node = leaf >> 1
+            while node:
+                below.setdefault(node, set()).add(key)
+                node >>= 1
+        while left < right:
+            if left & 1:
+                keys.setdefault(left, set()).add(key)
+                below.setdefault(left, set()).add(key)
+                left += 1
+            if right & 1:
+                right -= 1
+                keys.setdefault(right, set()).add(key)
+                below.setdefault(right, set()).add(key)
+            left >>= 1
+            right >>= 1
+
+    def find(self, low: int, high: int) -> Set[Tuple]:
+        """
+        Return the network pairs claiming any port of [low, high].
+        """
+        keys, below = self.keys, self.below
+        found = set()
+        left, right = low + PORT_COUNT, high + PORT_COUNT + 1
+        # Pairs claiming whole blocks above either end cover part of the range
+        for leaf in (left, right - 1):
+            node = leaf >> 1
+            while node:
+                if node in keys:
+                    found.update(keys[node])
+                node >>= 1
+        while left < right:
+            if left & 1:
+                if left in below:
+                    found.update(below[left])
+                left += 1
+            if right & 1:
+                right -= 1
+                if right in below:
+                    found.update(below[right])
+            left >>= 1
+            right >>= 1
+        return found
+
+
+def _bounds(net) -> Tuple[int, int, int]:
+    """Return (IP version, first address, last address) of a network."""
+    return net.version, int(net.network_address), int(net.broadcast_address)
+
+
+def _contains(outer: Tuple[int, int, int], inner: Tuple[int, int, int]) -> bool:
+    """Return whether a network, given by its bounds, contains another."""
+    return outer[0] == inner[0] and outer[1] <= inner[1] and inner[2] <= outer[2]
+
+
+def _merge(piece_lists: List[List[Tuple[int, int, int]]], low: int, high: int) -> List[Tuple[int, int, int]]:
+    """
+    Combine the segments of several network pairs that all match the same traffic.
+    :return: Disjoint (start, end, owner) segments in port order; where several
+             rules cover a port, the earliest owns it.
+    """
+    if len(piece_lists) == 1:
+        return piece_lists[0]
+    resolved = _IntervalIndex()
+    for start, end, owner in sorted((piece for pieces in piece_lists for piece in pieces), key=lambda piece: piece[2]):
+        resolved.insert_gaps(start, end, owner)
+    return resolved.overlapping(low, high)
+
+
+def _first_owners(source: Tuple[int, int, int], destination: Tuple[int, int, int],
+                  active: List[Tuple]) -> Tuple[Set[int], bool]:
+    """
+    Split a rule's address space into the classes some narrower network pairs
+    tell apart, and find the earliest of those pairs' rules matching each class.
+    :param active: (source bounds, destination bounds, owner) of the pairs.
+    :return: The earliest owner per class that any pair matches, and whether
+             some class is matched by none of them.
+    """
+    source_points = sorted({source[1]}.union(*({other[1], other[2] + 1} for other, _, _ in active
+                                               if not _contains(other, source))) - {source[2] + 1})
+    destination_points = sorted({destination[1]}.union(*({other[1], other[2] + 1} for _, other, _ in active
+                                                         if not _contains(other, destination)))
+                                - {destination[2] + 1})
+
+    def classes(other, own, points):
+        if _contains(other, own):
+            return range(len(points))
+        return range(bisect_left(points, other[1]), bisect_left(points, other[2] + 1))
+
+    cells: Dict[Tuple[int, int], int] = {}
+    for other_source, other_destination, owner in active:
+        for source_class in classes(other_source, source, source_points):
+            for destination_class in classes(other_destination, destination, destination_points):
+                cell = (source_class, destination_class)
+                if owner < cells.get(cell, owner + 1):
+                    cells[cell] = owner
+    return set(cells.values()), len(cells) < len(source_points) * len(destination_points)
+
+
+class RuleAnalyzer:
+    """Class to find shadowed, redundant and overlapping rules in a rule list."""
+
+    def __init__(self, rules: List[Dict]):
+        """
+        Initialize RuleAnalyzer with a rule list in chain order.
+        :param rules: Rules in the rules file format.
+        """
+        self.rules = rules
+
+    def analyze(self) -> List[Dict]:
+        """
+        Compare every rule with the rules before it.
+        Rules are indexed per (direction, protocol) by exact (source, destination)
+        network pair, each holding an interval index of the ports its rules claim
+        first, and the pairs are indexed by the ports they claim. A rule looks up
+        the pairs that claim its ports and whose networks meet its own. Pairs whose
+        networks enclose both of the rule's decide all of its traffic; narrower
+        ones only decide the address classes inside their networks, so those are
+        resolved class by class, as the chain would.
+        Each lookup costs O(log ports) per segment and network pair found, plus one
+        step per address class wherever narrower pairs claim the same ports.
+        :return: List of findings with rule_id, type ('shadowed', 'redundant' or
+                 'overlap'), related_rule_ids and detail.
+        """
+        tables: Dict[Tuple[str, str], Tuple[Dict[Tuple, _IntervalIndex], _ClaimIndex]] = {}
+        keys: Dict[Tuple, Tuple] = {}  # Network pair bounds per (source, destination) as written
+        findings = []
+
+        for index, rule in enumerate(self.rules):
+            key = keys.get((rule.get("source"), rule.get("destination")))
+            if key is None:
+                key = keys[(rule.get("source"), rule.get("destination"))] = tuple(map(_bounds, rule_networks(rule)))
+            source, destination = key
+            low, high = port_bounds(rule["port"])
+            table = tables.get((rule["direction"], rule["protocol"]))
+            if table is None:
+                table = tables[(rule["direction"], rule["protocol"])] = ({}, _ClaimIndex())
+            pairs, claims = table
+
+            enclosing, narrower = [], []
+            for other in claims.find(low, high):
+                other_source, other_destination = other
+                if _contains(other_source, source) and _contains(other_destination, destination):
+                    enclosing.append(pairs[other].overlapping(low, high))
+                elif ((_contains(other_source, source) or _contains(source, other_source))
+                      and (_contains(other_destination, destination) or _contains(destination, other_destination))):
+                    narrower.append((other_source, other_destination, pairs[other].overlapping(low, high)))
+
+            owners, fully_covered = self._resolve(source, destination, low, high,
+                                                  _merge(enclosing, low, high) if enclosing else [], narrower)
+            finding = self._classify(rule, fully_covered, sorted(owners))
+            if finding is not None:
+                findings.append(finding)
+
+            interval_index = pairs.get(key)
+            if interval_index is None:
+                interval_index = pairs[key] = _IntervalIndex()
+            for start, end in interval_index.insert_gaps(low, high, index):
+                claims.add(start, end, key)
+
+        return findings
+
+    @staticmethod
+    def _resolve(source: Tuple[int, int, int], destination: Tuple[int, int, int], low: int, high: int,
+                 enclosing: List[Tuple[int, int, int]], narrower: List[Tuple]) -> Tuple[Set[int], bool]:
+        """
+        Find the earlier rules that decide some of a rule's traffic, sweeping its
+        ports once and splitting its address space where narrower pairs are active.
+        :param source: Bounds of the rule's source network.
+        :param destination: Bounds of the rule's destination network.
+        :param enclosing: Segments of the pairs deciding all of its traffic.
+        :param narrower: (source bounds, destination bounds, segments) of the
+                         pairs deciding only part of its address space.
+        :return: Positions of the deciding rules, and whether they decide all of it.
+        """
+        if not narrower:
+            return {owner for _, _, owner in enclosing}, sum(end - start + 1 for start, end, _ in enclosing) > high - low
+
+        opening: Dict[int, List[Tuple]] = {}
+        closing: Dict[int, List[Tuple]] = {}
+        for start, end, owner in enclosing:
+            opening.setdefault(start, []).append((None, None, owner))
+            closing.setdefault(end + 1, []).append((None, None, owner))
+        for other_source, other_destination, pieces in narrower:
+            for start, end, owner in pieces:
+                opening.setdefault(start, []).append((other_source, other_destination, owner))
+                closing.setdefault(end + 1, []).append((other_source, other_destination, owner))
+
+        owners: Set[int] = set()
+        fully_covered = True
+        active: Set[Tuple] = set()
+        decided, bare = set(), True  # Owners and uncovered classes of the narrower pairs now active
+        enclosing_owner = None
+        for point in sorted(set(opening) | {low} | set(closing) - {high + 1}):
+            changed = False
+            for other_source, other_destination, owner in closing.get(point, ()):
+                if other_source is None:
+                    enclosing_owner = None
+                else:
+                    active.discard((other_source, other_destination, owner))
+                    changed = True
+            for other_source, other_destination, owner in opening.get(point, ()):
+                if other_source is None:
+                    enclosing_owner = owner
+                else:
+                    active.add((other_source, other_destination, owner))
+                    changed = True
+            if changed:
+                decided, bare = _first_owners(source, destination, list(active)) if active else (set(), True)
+            if enclosing_owner is None:
+                owners.update(decided)
+                fully_covered = fully_covered and not bare
+            else:
+                owners.update(owner if owner < enclosing_owner else enclosing_owner for owner in decided)
+                if bare:
+                    owners.add(enclosing_owner)
+        return owners, fully_covered
+
+    def _classify(self, rule: Dict, fully_covered: bool, owners: List[int]) -> Dict:
+        """
+        Turn the earlier matches of a rule into a finding.
+        :param rule: The rule being checked.
+        :param fully_covered: Whether earlier rules decide all of its traffic.
+        :param owners: Positions of the earlier rules deciding some of its traffic.
+        :return: A finding, or None if the rule is unaffected.
+        """
+        conflicting = [owner for owner in owners if self.rules[owner]["action"] != rule["action"]]
+
+        if fully_covered and conflicting:
+            kind, related = "shadowed", conflicting
+            detail = "never matches; earlier rules with a different action cover all its traffic"
+        elif fully_covered:
+            kind, related = "redundant", owners
+            detail = "never matches; earlier rules with the same action cover all its traffic"
+        elif conflicting:
+            kind, related = "overlap", conflicting
+            detail = "partially overlaps earlier rules with a different action"
+        else:
+            return None
+
+        return {
+            "rule_id": rule["rule_id"],
+            "type": kind,
+            "related_rule_ids": [self.rules[owner]["rule_id"] for owner in related],
+            "detail": detail
+        }
@@ -0,0 +1,127 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import ipaddress
+import numpy as np
+from typing import Dict, Iterable, List, Optional, Tuple
+from src.rule_model import PORT_COUNT, port_bounds, rule_networks
+
+DIRECTIONS = ("incoming", "outgoing")
+PROTOCOLS = ("tcp", "udp", "icmp")
+
+BLOCK = 0
+ALLOW = 1
+NO_MATCH = -1
+
+
+class CompiledPolicy:
+    """Class to evaluate flows against a rule list without touching the network."""
+
+    def __init__(self, rules: Iterable[Dict], default_action: str = "allow",
+                 source: Optional[str] = None, destination: Optional[str] = None,
+                 addresses: Optional[Dict[str, Tuple[str, str]]] = None):
+        """
+        Compile rules into per-(direction, protocol) port lookup tables.
+        The first rule matching a flow decides its verdict, as in an iptables chain.
+        :param rules: Rules in the rules file format.
+        :param default_action: Verdict for flows no rule matches (the chain policy).
+        :param source: Evaluate flows from this address only, skipping rules whose
+                       source network excludes it. None ignores source networks.
+        :param destination: Same as source, for destination networks.
+        :param addresses: (source, destination) per direction, for flows whose
+                          addresses depend on their direction; overrides source
+                          and destination.
+        """
+        self.default_action = default_action
+        self.rules: List[Dict] = list(rules)
+        default = ALLOW if default_action == "allow" else BLOCK
+        self.verdicts = np.full((len(DIRECTIONS), len(PROTOCOLS), PORT_COUNT), default, dtype=np.uint8)
+        self.matches = np.full((len(DIRECTIONS), len(PROTOCOLS), PORT_COUNT), NO_MATCH, dtype=np.int32)
+
+        if addresses is None:
+            addresses = {direction: (source, destination) for direction in DIRECTIONS}
+        addresses = {direction: tuple(ipaddress.ip_address(address) if address else None for address in pair)
+                     for direction, pair in addresses.items()}
+
+        # Assign in reverse so earlier rules overwrite later ones (first match wins).
+        for index in range(len(self.rules) - 1, -1, -1):
+            rule = self.rules[index]
+            source, destination = addresses[rule["direction"]]
+            source_net, destination_net = rule_networks(rule)
+            if (source and source not in source_net) or (destination and destination not in destination_net):
+                continue
+            d = DIRECTIONS.index(rule["direction"])
+            p = PROTOCOLS.index(rule["protocol"])
+            low, high = port_bounds(rule["port"])
+            self.verdicts[d, p, low:high + 1] = ALLOW if rule["action"] == "allow" else BLOCK
+            self.matches[d, p, low:high + 1] = index
+
+    @staticmethod
+    def encode(values, vocabulary) -> np.ndarray:
+        """
+        Convert an array of names (or already encoded indices) to indices.
+        :param values: Array-like of strings or integers.
+        :param vocabulary: Tuple of valid names, e.g. PROTOCOLS.
+        :return: Integer index array.
+        """
+        values = np.asarray(values)
+        if values.dtype.kind in "iu":
+            return values.astype(np.intp, copy=False)
+        names, inverse = np.unique(values, return_inverse=True)
+        try:
+            lookup = np.array([vocabulary.index(name) for name in names], dtype=np.intp)
+        except ValueError as e:
+            raise ValueError(f"Unknown value in {vocabulary}: {e}")
+        return lookup[inverse.reshape(values.shape)]
+
+    def evaluate(self, protocols, ports, directions) -> np.ndarray:
+        """
+        Evaluate a batch of flows.
+        :param protocols: Protocol names or PROTOCOLS indices.
+        :param ports: Destination ports.
+        :param directions: Direction names or DIRECTIONS indices.
+        :return: Array of verdicts (ALLOW or BLOCK) per flow.
+        """
+        d = self.encode(directions, DIRECTIONS)
+        p = self.encode(protocols, PROTOCOLS)
+        return self.verdicts[d, p, np.asarray(ports, dtype=np.intp)]
+
+    def match(self, protocols, ports, directions) -> np.ndarray:
+        """
+        Find the index of the first matching rule for a batch of flows.
+        :return: Array of rule indices, NO_MATCH where the default policy applies.
+        """
+        d = self.encode(directions, DIRECTIONS)
+        p = self.encode(protocols, PROTOCOLS)
+        return self.matches[d, p, np.asarray(ports, dtype=np.intp)]
+
+    def evaluate_rules(self, rules: List[Dict]) -> List[str]:
+        """
+        Evaluate the flow each rule describes, as TrafficSimulator would report it.
+        Port ranges are represented by their lowest port.
+        :param rules: Rules in the rules file format.
+        :return: 'allowed' or 'blocked' per rule.
+        """
+        if not rules:
+            return []
+        verdicts = self.evaluate([r["protocol"] for r in rules], [port_bounds(r["port"])[0] for r in rules],
+                                 [r["direction"] for r in rules])
+        return ["allowed" if verdict == ALLOW else "blocked" for verdict in verdicts]
+
+    def verdict(self, protocol: str, port: int, direction: str) -> str:
+        """
+        Evaluate a single flow.
+        :return: 'allowed' or 'blocked'.
+        """
+        return self.evaluate_rules([{"protocol": protocol, "port": port, "direction": direction}])[0]
@@ -0,0 +1,214 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import io
+import itertools
+import json
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from jsonschema import Draft7Validator
+from jsonschema.exceptions import best_match
+from src.rule_model import port_bounds, rule_networks
+
+RULE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "rule_id": {"type": ["integer", "string"]},
+        "direction": {"enum": ["incoming", "outgoing"]},
+        "protocol": {"enum": ["tcp", "udp", "icmp"]},
+        "port": {
+            "anyOf": [
+                {"type": "integer", "minimum": 0, "maximum": 65535},
+                {"type": "string", "pattern": r"^\d+([-:]\d+)?$"}
+            ]
+        },
+        "action": {"enum": ["allow", "block"]},
+        "source": {"type": "string"},
+        "destination": {"type": "string"}
+    },
+    "required": ["rule_id", "direction", "protocol", "port", "action"]
+}
+
+# Compiled once and shared by every loader
+RULE_VALIDATOR = Draft7Validator(RULE_SCHEMA)
+
+JSON_LINES_EXTENSIONS = (".jsonl", ".ndjson")
+MAX_RULE_SIZE = 1 << 20
+_WHITESPACE = re.compile(r"\s*")
+
+
+class RuleLoader:
+    """Class to stream and validate rules from a JSON array or JSON Lines file."""
+
+    def __init__(self, rule_file: str, chunk_size: int = 1 << 16, known_valid: Optional[Set[Tuple]] = None):
+        """
+        Initialize RuleLoader with the path to a rules file.
+        :param rule_file: Path to a JSON array or JSON Lines file with firewall rules.
+        :param chunk_size: Number of characters read from the file at a time.
+        :param known_valid: Keys of rules validated by an earlier load. Matching
+                            rules skip schema validation; newly validated rules are added.
+        """
+        self.rule_file = rule_file
+        self.chunk_size = chunk_size
+        self.known_valid = known_valid
+        self.errors: List[Dict] = []
+
+    def __iter__(self) -> Iterator[Dict]:
+        return self.iter_rules()
+
+    def load(self) -> List[Dict]:
+        """
+        Load all valid rules into a list.
+        :return: List of rules.
+        """
+        return list(self.iter_rules())
+
+    def iter_rules(self) -> Iterator[Dict]:
+        """
+        Yield valid rules one at a time.
+        Invalid rules are skipped and recorded in self.errors with their line number.
+        A file that is not well-formed JSON raises json.JSONDecodeError.
+        """
+        self.errors = []
+        with open(self.rule_file, "r") as file:
+            if self.rule_file.endswith(JSON_LINES_EXTENSIONS):
+                records = self._read_lines(file)
+            else:
+                records = self._read_document(file)
+            for line, rule in records:
+                key = self._rule_key(rule) if self.known_valid is not None else None
+                if key is not None and key in self.known_valid:
+                    yield rule
+                    continue
+                error = self.validate(rule)
+                if error is None:
+                    if key is not None:
+                        self.known_valid.add(key)
+                    yield rule
+                else:
+                    rule_id = rule.get("rule_id") if isinstance(rule, dict) else None
+                    self.errors.append({"line": line, "rule_id": rule_id, "message": error})
+
+    @staticmethod
+    def _rule_key(rule) -> Optional[Tuple]:
+        """
+        Build a hashable key for a decoded rule, keeping value types apart so
+        that e.g. true and 1 do not collide.
+        :return: Key, or None if the rule cannot be keyed.
+        """
+        if not isinstance(rule, dict):
+            return None
+        key = tuple(sorted((name, type(value).__name__, value) for name, value in rule.items()))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    @staticmethod
+    def validate(rule) -> str:
+        """
+        Validate a single rule against the rule schema.
+        :param rule: Decoded rule.
+        :return: Error message, or None if the rule is valid.
+        """
+        error = best_match(RULE_VALIDATOR.iter_errors(rule))
+        if error is not None:
+            location = "/".join(str(part) for part in error.absolute_path)
+            return f"{location}: {error.message}" if location else error.message
+        try:
+            port_bounds(rule["port"])
+            rule_networks(rule)
+        except ValueError as e:
+            return str(e)
+        return None
+
+    def _read_lines(self, lines: Iterable[str], first_line: int = 1) -> Iterator[Tuple[int, object]]:
+        """
+        Decode one rule per line, recording undecodable lines as errors.
+        :return: Iterator of (line number, decoded rule).
+        """
+        for line, text in enumerate(lines, first_line):
+            text = text.strip()
+            if not text:
+                continue
+            try:
+                yield line, json.loads(text)
+            except json.JSONDecodeError as e:
+                self.errors.append({"line": line, "rule_id": None, "message": f"Invalid JSON: {e.msg}"})
+
+    def _read_document(self, file) -> Iterator[Tuple[int, object]]:
+        """
+        Decode the elements of a top-level JSON array incrementally.
+        Files whose first value is an object are read as JSON Lines instead.
+        :return: Iterator of (line number, decoded rule).
+        """
+        decoder = json.JSONDecoder()
+        buffer, pos, line = "", 0, 1
+        expect = "["
+        while True:
+            # Skip whitespace, refilling the buffer as needed
+            eof = False
+            while True:
+                end = _WHITESPACE.match(buffer, pos).end()
+                line += buffer.count("\n", pos, end)
+                pos = end
+                if pos < len(buffer):
+                    break
+                chunk = file.read(self.chunk_size)
+                if not chunk:
+                    eof = True
+                    break
+                buffer, pos = buffer[pos:] + chunk, 0
+
+            if eof:
+                if expect in ("end", "["):
+                    return
+                raise json.JSONDecodeError(f"Unexpected end of file (line {line})", buffer, pos)
+
+            char = buffer[pos]
+            if expect == "[":
+                if char == "{":
+                    rest = io.StringIO(buffer[pos:] + file.readline())
+                    yield from self._read_lines(itertools.chain(rest, file), line)
+                    return
+                if char != "[":
+                    raise json.JSONDecodeError(f"Expected a JSON array (line {line})", buffer, pos)
+                pos += 1
+                expect = "first"
+            elif expect == "end":
+                raise json.JSONDecodeError(f"Extra data after the rule array (line {line})", buffer, pos)
+            elif char == "]" and expect in ("first", "separator"):
+                pos += 1
+                expect = "end"
+            elif expect == "separator":
+                if char != ",":
+                    raise json.JSONDecodeError(f"Expected ',' or ']' (line {line})", buffer, pos)
+                pos += 1
+                expect = "value"
+            else:
+                while True:
+                    try:
+                        rule, end = decoder.raw_decode(buffer, pos)
+                        break
+                    except json.JSONDecodeError as e:
+                        # The rule may be cut off by the chunk boundary; read more and retry
+                        chunk = file.read(self.chunk_size) if len(buffer) - pos < MAX_RULE_SIZE else ""
+                        if not chunk:
+                            raise json.JSONDecodeError(f"{e.msg} (line {line})", e.doc, e.pos)
+                        buffer, pos = buffer[pos:] + chunk, 0
+                yield line, rule
+                line += buffer.count("\n", pos, end)
+                pos = end
+                expect = "separator"
@@ -0,0 +1,166 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import ipaddress
+from typing import Dict, List, Optional, Tuple, Union
+
+ANY_NETWORK = ipaddress.ip_network("0.0.0.0/0")
+PORT_COUNT = 65536
+
+
+def port_bounds(port: Union[int, str]) -> Tuple[int, int]:
+    """
+    Parse a rule's port field into inclusive bounds.
+    :param port: A single port (22 or "22") or a range ("1000-2000" or "1000:2000").
+    :return: (low, high) port tuple.
+    """
+    text = str(port).replace(":", "-")
+    low, _, high = text.partition("-")
+    try:
+        bounds = (int(low), int(high or low))
+    except ValueError:
+        raise ValueError(f"Invalid port: {port}")
+    if not 0 <= bounds[0] <= bounds[1] <= 65535:
+        raise ValueError(f"Invalid port range: {port}")
+    return bounds
+
+
+def format_port(bounds: Tuple[int, int]) -> Union[int, str]:
+    """
+    Format port bounds back into the rule file representation.
+    :param bounds: (low, high) port tuple.
+    :return: An int for a single port, "low-high" for a range.
+    """
+    low, high = bounds
+    return low if low == high else f"{low}-{high}"
+
+
+def iptables_port(port: Union[int, str]) -> str:
+    """
+    Format a rule's port field for an iptables '--dport' match.
+    :param port: A single port or a range.
+    :return: "22" or "1000:2000".
+    """
+    low, high = port_bounds(port)
+    return str(low) if low == high else f"{low}:{high}"
+
+
+def network(value) -> ipaddress.IPv4Network:
+    """
+    Parse a source or destination address into a network.
+    :param value: CIDR or address string, or None for any address.
+    :return: IPv4 network.
+    """
+    if value is None:
+        return ANY_NETWORK
+    try:
+        return ipaddress.ip_network(value, strict=False)
+    except ValueError as e:
+        raise ValueError(f"Invalid network: {e}")
+
+
+def rule_networks(rule: Dict) -> Tuple[ipaddress.IPv4Network, ipaddress.IPv4Network]:
+    """
+    Return the source and destination networks a rule matches.
+    :param rule: A dictionary containing the rule details.
+    :return: (source, destination) networks.
+    """
+    return network(rule.get("source")), network(rule.get("destination"))
+
+
+def representative_addresses(rules: List[Dict], field: str) -> List[Optional[str]]:
+    """
+    Pick one address from every class of addresses the rules' networks treat alike:
+    each network's first address and the address just past its end.
+    """
+    networks = [rule_networks(rule)[0 if field == "source" else 1] for rule in rules if rule.get(field)]
+    if not networks:
+        return [None]  # No rule looks at this field
+    points = {ipaddress.ip_address("0.0.0.0")}
+    for net in networks:
+        points.add(net.network_address)
+        if int(net.broadcast_address) < (2 ** net.max_prefixlen) - 1:
+            points.add(net.broadcast_address + 1)
+    return [str(point) for point in sorted(points, key=lambda point: (point.version, point))]
+
+
+class PortMaxTree:
+    """Sparse segment tree over the port space holding the highest value recorded for each port."""
+
+    def __init__(self):
+        self.tags: Dict[int, int] = {}  # Value applied to a node's whole port block
+        self.best: Dict[int, int] = {}  # Highest value anywhere in a node's port block
+
+    def add(self, low: int, high: int, value: int) -> None:
+        """
+        Record a non-negative value for every port in [low, high].
+        """
+        tags, best = self.tags, self.best
+        left, right = low + PORT_COUNT, high + PORT_COUNT + 1
+        for leaf in (left, right - 1):
+            node = leaf >> 1
+            while node and best.get(node, -1) < value:
+                best[node] = value
+                node >>= 1
+        while left < right:
+            if left & 1:
+                tags[left] = max(tags.get(left, -1), value)
+                best[left] = max(best.get(left, -1), value)
+                left += 1
+            if right & 1:
+                right -= 1
+                tags[right] = max(tags.get(right, -1), value)
+                best[right] = max(best.get(right, -1), value)
+            left >>= 1
+            right >>= 1
+
+    def highest(self, low: int, high: int) -> int:
+        """
+        Return the highest value recorded for any port in [low, high], or -1.
+        """
+        tags, best = self.tags, self.best
+        # Values tagged on ancestors of either end cover part of the range
+        left, right = low + PORT_COUNT, high + PORT_COUNT
+        result = -1
+        while left != right:
+            value = tags.get(left, -1)
+            if value > result:
+                result = value
+            value = tags.get(right, -1)
+            if value > result:
+                result = value
+            left >>= 1
+            right >>= 1
+        while left:
+            value = tags.get(left, -1)
+            if value > result:
+                result = value
+            left >>= 1
+        if low == high:
+            return result
+        left, right = low + PORT_COUNT, high + PORT_COUNT + 1
+        while left < right:
+            if left & 1:
+                value = best.get(left, -1)
+                if value > result:
+                    result = value
+                left += 1
+            if right & 1:
+                right -= 1
+                value = best.get(right, -1)
+                if value > result:
+                    result = value
+            left >>= 1
+            right >>= 1
+        return result
@@ -0,0 +1,219 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from src.rule_analyzer import RuleAnalyzer
+from src.rule_compiler import DIRECTIONS, PROTOCOLS, CompiledPolicy
+from src.rule_model import PORT_COUNT, PortMaxTree, format_port, port_bounds, representative_addresses, rule_networks
+
+
+def _networks_overlap(a, b) -> bool:
+    return a.version == b.version and a.overlaps(b)
+
+
+def conflicts(a: Dict, b: Dict) -> bool:
+    """
+    Tell whether swapping two rules could change a verdict: they match some
+    common traffic and act differently on it.
+    :return: True if the rules' relative order matters.
+    """
+    if (a["direction"], a["protocol"]) != (b["direction"], b["protocol"]) or a["action"] == b["action"]:
+        return False
+    a_low, a_high = port_bounds(a["port"])
+    b_low, b_high = port_bounds(b["port"])
+    if a_high < b_low or b_high < a_low:
+        return False
+    a_source, a_destination = rule_networks(a)
+    b_source, b_destination = rule_networks(b)
+    return _networks_overlap(a_source, b_source) and _networks_overlap(a_destination, b_destination)
+
+
+def find_difference(original: List[Dict], optimized: List[Dict]) -> Optional[Dict]:
+    """
+    Compare the verdicts of two rule lists for every direction, protocol and
+    port, from a representative of every class of source and destination
+    addresses. This covers all traffic, so no difference means the lists are
+    verdict-equivalent.
+    :return: None if equivalent, else the first flow they disagree on.
+    """
+    both = original + optimized
+    for source in representative_addresses(both, "source"):
+        for destination in representative_addresses(both, "destination"):
+            before = CompiledPolicy(original, source=source, destination=destination).verdicts
+            after = CompiledPolicy(optimized, source=source, destination=destination).verdicts
+            if not np.array_equal(before, after):
+                d, p, port = (int(i) for i in np.argwhere(before != after)[0])
+                return {"direction": DIRECTIONS[d], "protocol": PROTOCOLS[p], "port": port,
+                        "source": source, "destination": destination,
+                        "original": "allow" if before[d, p, port] else "block",
+                        "optimized": "allow" if after[d, p, port] else "block"}
+    return None
+
+
+class RuleOptimizer:
+    """Class to shrink and reorder a rule list without changing any verdict."""
+
+    def __init__(self, rules: List[Dict], hits: Optional[List[int]] = None):
+        """
+        Initialize RuleOptimizer.
+        :param rules: Rules in the rules file format, in chain order.
+        :param hits: Packet counter per rule. When given, frequently hit rules are
+                     moved ahead of rules they do not conflict with.
+        """
+        self.rules = rules
+        self.hits = hits
+        self.stats = {}
+
+    def optimize(self) -> List[Dict]:
+        """
+        Drop rules that can never match, merge contiguous ports into ranges,
+        optionally reorder by hits, and check the result is verdict-equivalent.
+        :return: Optimized rules; the input list is not modified.
+        """
+        hits = self.hits if self.hits is not None else [0] * len(self.rules)
+        pairs = [(dict(rule), count) for rule, count in zip(self.rules, hits)]
+
+        unreachable = {finding["rule_id"] for finding in RuleAnalyzer(self.rules).analyze()
+                       if finding["type"] in ("shadowed", "redundant")}
+        pairs = [(rule, count) for rule, count in pairs if rule["rule_id"] not in unreachable]
+        removed = len(self.rules) - len(pairs)
+
+        count_before_merge = len(pairs)
+        pairs = self._merge_ranges(pairs)
+
+        moved = 0
+        if self.hits is not None:
+            pairs, moved = self._reorder(pairs)
+
+        optimized = [rule for rule, _ in pairs]
+        difference = find_difference(self.rules, optimized)
+        if difference is not None:
+            raise Exception(f"Optimized rules are not equivalent to the original rules: {difference}")
+
+        self.stats = {"original": len(self.rules), "optimized": len(optimized), "removed": removed,
+                      "merged": count_before_merge - len(pairs), "moved": moved}
+        return optimized
+
+    @staticmethod
+    def _merge_ranges(pairs: List[Tuple[Dict, int]]) -> List[Tuple[Dict, int]]:
+        """
+        Fold each rule into an earlier rule with the same direction, protocol,
+        action and networks whose ports touch or overlap its own, provided no
+        conflicting rule sits between them, in a single pass.
+        Kept rules are indexed by (direction, protocol, action, networks) in
+        segment trees holding the earliest and latest rule position per port.
+        The barrier for a range is the latest overlapping rule of an
+        opposite-action group with overlapping networks, so each lookup costs
+        O(log ports) per group instead of a scan over every kept rule. A grown
+        range is folded into the touching rules of its group the same way.
+        Barriers also count conflicting rules after the later rule and positions
+        left behind by folded rules, so they can prevent a merge but never allow
+        a wrong one.
+        :return: (rule, hits) pairs after merging.
+        """
+        kept: List[Optional[list]] = []  # [rule, hits, low, high, key] per position; None once folded
+        folded: Dict[int, int] = {}
+        trees: Dict[Tuple, Tuple[PortMaxTree, PortMaxTree]] = {}
+        groups: Dict[Tuple, List[Tuple[Tuple, PortMaxTree]]] = {}
+        overlap_cache: Dict[Tuple, bool] = {}
+        flip = len(pairs)  # Earliest positions are stored as flip - position
+
+        def resolve(position: int) -> int:
+            while position in folded:
+                position = folded[position]
+            return position
+
+        def barrier(position: int) -> int:
+            _, _, low, high, (direction, protocol, action, networks) = kept[position]
+            latest_conflict = -1
+            for other, latest in groups.get((direction, protocol, "block" if action == "allow" else "allow"), ()):
+                overlap = overlap_cache.get((networks, other))
+                if overlap is None:
+                    overlap = _networks_overlap(networks[0], other[0]) and _networks_overlap(networks[1], other[1])
+                    overlap_cache[(networks, other)] = overlap
+                if overlap:
+                    latest_conflict = max(latest_conflict, latest.highest(low, high))
+            return latest_conflict
+
+        def record(position: int) -> None:
+            _, _, low, high, key = kept[position]
+            latest, earliest = trees[key]
+            latest.add(low, high, position)
+            earliest.add(low, high, flip - position)
+
+        def fold(later: int, earlier: int) -> None:
+            _, hits, low, high, _ = kept[later]
+            kept[later] = None
+            folded[later] = earlier
+            entry = kept[earlier]
+            entry[1] += hits
+            entry[2], entry[3] = min(entry[2], low), max(entry[3], high)
+            entry[0]["port"] = format_port((entry[2], entry[3]))
+            record(earlier)
+
+        for rule, count in pairs:
+            low, high = port_bounds(rule["port"])
+            key = (rule["direction"], rule["protocol"], rule["action"], rule_networks(rule))
+            if key not in trees:
+                trees[key] = (PortMaxTree(), PortMaxTree())
+                groups.setdefault(key[:3], []).append((key[3], trees[key][0]))
+            latest, earliest = trees[key]
+            target = len(kept)
+            kept.append([rule, count, low, high, key])
+
+            # Fold into the earliest touching rule of the group if nothing conflicting
+            # lies in between, else the latest; repeat while the grown range touches more.
+            while True:
+                _, _, low, high, _ = kept[target]
+                span = (max(low - 1, 0), min(high + 1, PORT_COUNT - 1))
+                # The latest position in the range may be stale, so later rules are also looked up at its edges
+                candidates = [flip - earliest.highest(*span), latest.highest(*span),
+                              latest.highest(span[0], span[0]), latest.highest(span[1], span[1])]
+                merged = False
+                for other in candidates:
+                    if not 0 <= other < flip:
+                        continue
+                    other = resolve(other)
+                    if other == target:
+                        continue
+                    earlier, later = min(target, other), max(target, other)
+                    if barrier(later) < earlier:
+                        fold(later, earlier)
+                        target, merged = earlier, True
+                        break
+                if not merged:
+                    break
+            if target == len(kept) - 1:
+                record(target)
+
+        return [(entry[0], entry[1]) for entry in kept if entry is not None]
+
+    @staticmethod
+    def _reorder(pairs: List[Tuple[Dict, int]]) -> Tuple[List[Tuple[Dict, int]], int]:
+        """
+        Move each rule ahead of less frequently hit rules, stopping at the first
+        rule it conflicts with, so only verdict-preserving swaps are made.
+        :return: Reordered (rule, hits) pairs and the number of rules that moved.
+        """
+        ordered = []
+        moved = 0
+        for rule, count in pairs:
+            position = len(ordered)
+            while position > 0 and ordered[position - 1][1] < count and not conflicts(ordered[position - 1][0], rule):
+                position -= 1
+            if position < len(ordered):
+                moved += 1
+            ordered.insert(position, (rule, count))
+        return ordered, moved
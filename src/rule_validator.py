@@ -12,69 +12,516 @@
 # 
 # You should have received a copy of the GNU General Public License
 # along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
-from src.traffic_simulator import TrafficSimulator
+from src import metrics
+from src.adaptive_timeout import AdaptiveTimeout
+from src.traffic_simulator import LOCAL_ADDRESS, TrafficSimulator
+from src.firewall_manager import FirewallManager
+from src.hit_attribution import HitAttribution
+from src.namespace_sandbox import NamespaceSandbox
+from src.packet_capture import PacketCapture
+from src.probe_planner import ProbePlanner
+from src.probe_cache import ProbeCache
+from src.results_store import ResultsStore
 from src.report_generator import ReportGenerator
+from src.rule_analyzer import RuleAnalyzer
+from src.rule_compiler import DIRECTIONS, NO_MATCH, CompiledPolicy
+from src.rule_loader import RuleLoader
+from src.rule_model import format_port, port_bounds, rule_networks
 from src.logger import setup_logger
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict, deque
+from typing import Dict, Iterator, List, Optional, Tuple
+import ipaddress
 import json
+import os
 
 class RuleValidator:
     """Class to validate firewall rules against observed traffic behavior."""
 
-    def __init__(self, rule_file: str):
+    def __init__(self, rule_file: Optional[str], max_in_flight: int = 1, probe_backend: str = "hping3",
+                 dry_run: bool = False, cache: Optional[ProbeCache] = None, namespaces: int = 0,
+                 plan_probes: bool = False, timing: Optional[AdaptiveTimeout] = None,
+                 capture: Optional[PacketCapture] = None, attribute_hits: bool = False):
         """
         Initialize RuleValidator with the path to a JSON file containing rules.
-        :param rule_file: Path to the JSON file with firewall rules.
+        :param rule_file: Path to the JSON file with firewall rules; None for validators built by from_rules().
+        :param max_in_flight: Maximum number of traffic probes running concurrently.
+        :param probe_backend: TrafficSimulator backend ('hping3' or 'raw').
+        :param dry_run: Take observed actions from the compiled policy instead of
+                        sending traffic, so neither root nor hping3 is needed.
+        :param cache: Reuse probe results from earlier runs while the active
+                      ruleset is unchanged.
+        :param namespaces: Load the rules into this many throwaway network namespaces
+                           and probe shards of the rule list there in parallel, with
+                           max_in_flight probes per namespace, instead of on the host.
+        :param plan_probes: Send one probe per class of ports the rules treat alike
+                            instead of one per rule, and check every class a rule
+                            decides rather than only its lowest port.
+        :param timing: Adaptive probe deadlines shared by every simulator.
+        :param capture: Capture probe traffic and attach per-probe evidence to results.
+        :param attribute_hits: Snapshot the iptables counters before and after each
+                               validation and add the kernel rule each probe matched,
+                               with its hit counts, to the results.
         """
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        if namespaces and probe_backend != "hping3":
+            raise ValueError("Namespace sandboxes require the hping3 probe backend")
+        if namespaces and capture is not None:
+            raise ValueError("Packet capture cannot be combined with namespace sandboxes")
+        if attribute_hits and (dry_run or namespaces):
+            raise ValueError("Hit attribution needs probes sent on the host")
         self.rule_file = rule_file
-        self.simulator = TrafficSimulator()
+        self.max_in_flight = max_in_flight
+        self.dry_run = dry_run
+        self.namespaces = namespaces
+        self.plan_probes = plan_probes
+        self.policy = None
+        self.findings = []
+        self.cache = cache
+        self.firewall_state = None
+        self.timing = timing
+        self.capture = capture
+        self.attribute_hits = attribute_hits
+        self._prepared = None
+        self._observations = None  # (protocol, direction) -> {port: observed}, kept by revalidate_rules
+        self._valid_rules = None
+        self.simulator = TrafficSimulator(backend=probe_backend, timing=timing, capture=capture)
         self.logger = setup_logger("RuleValidator", "logs/validation.log")
 
+    @classmethod
+    def from_rules(cls, rules: List[Dict], policy_actions: List[str], simulator: Optional[TrafficSimulator] = None,
+                   **options) -> "RuleValidator":
+        """
+        Build a validator over rules parsed and compiled elsewhere, such as a shard
+        handed over by a coordinator. No rules file is read, analyzed or compiled.
+        :param rules: Rules to probe, in order.
+        :param policy_actions: The compiled policy's action for each rule's flow.
+        :param simulator: Probe with this simulator, e.g. one shared by many shards, instead of a new one.
+        :param options: Other RuleValidator options.
+        :return: RuleValidator whose validate_rules() probes the given rules.
+        """
+        if options.get("namespaces"):
+            raise ValueError("Namespace sandboxes load the rules from the rules file")
+        validator = cls(None, **options)
+        if simulator is not None:
+            validator.simulator = simulator
+        validator._prepared = (None, rules, policy_actions)
+        return validator
+
     def load_rules(self):
         """
         Load firewall rules from the JSON file.
         :return: List of rules.
         """
+        loader = RuleLoader(self.rule_file, known_valid=self._valid_rules)
         try:
-            with open(self.rule_file, "r") as file:
-                return json.load(file)
+            with metrics.span("rules.load"):
+                rules = loader.load()
         except (FileNotFoundError, json.JSONDecodeError) as e:
             self.logger.error(f"Failed to load rules file: {e}")
             raise
+        for error in loader.errors:
+            self.logger.error(f"Skipping invalid rule at line {error['line']}: {error['message']}")
+        return rules
+
+    def analyze_rules(self, rules=None):
+        """
+        Find shadowed, redundant and overlapping rules.
+        :param rules: Rules to analyze; loaded from the rules file if omitted.
+        :return: List of findings, also kept in self.findings.
+        """
+        if rules is None:
+            rules = self.load_rules()
+        with metrics.span("rules.analyze"):
+            self.findings = RuleAnalyzer(rules).analyze()
+        for finding in self.findings:
+            self.logger.warning(f"Rule {finding['rule_id']} is {finding['type']} "
+                                f"(related rules: {finding['related_rule_ids']})")
+        return self.findings
 
     def validate_rules(self):
         """
         Validate each rule by simulating traffic and comparing expected vs observed results.
+        Up to max_in_flight probes run concurrently; results keep the rule order.
         :return: List of validation results.
         """
+        return list(self.iter_validate_rules())
+
+    def validate_rules_table(self) -> ResultsStore:
+        """
+        Validate the rules and collect the results into a typed columnar table
+        instead of a list of dicts.
+        :return: ResultsStore with one row per rule.
+        """
+        return ResultsStore.from_results(self.iter_validate_rules())
+
+    def iter_validate_rules(self) -> Iterator[Dict]:
+        """
+        Validate the rules lazily, yielding each result in rule order as soon as
+        it is available. Rules are loaded and analyzed before this returns, so
+        self.findings is already populated. With hit attribution, results are
+        only yielded once the whole batch has been probed.
+        :return: Iterator of validation results.
+        """
+        rules, policy_actions = self._prepare_rules()
+        if self.attribute_hits:
+            attribution = HitAttribution(rules)
+            attribution.begin()
+            return iter(attribution.attribute(list(self._iter_results(rules, policy_actions))))
+        return self._iter_results(rules, policy_actions)
+
+    def revalidate_rules(self) -> Tuple[List[Dict], List]:
+        """
+        Validate the rules, probing only rules that were added or changed (by
+        rule_id and content) since the previous call. Other rules reuse what was
+        observed for their flows, and every rule's policy action is recomputed
+        from the whole new policy. The first call probes everything.
+        :return: Results for every rule, and the rule_ids that were probed again.
+        """
+        if self.namespaces:
+            raise ValueError("Incremental revalidation does not support namespace sandboxes")
+        if self._observations is None:
+            self._observations = {}
+            self._valid_rules = set()
+        previous = {rule["rule_id"]: rule for rule in (self._prepared[1] if self._prepared else [])}
+        rules, policy_actions = self._prepare_rules()
+
+        changed = [rule for rule in rules if previous.get(rule["rule_id"]) != rule]
+        for rule in changed:
+            self._forget_observations(rule)
+        return list(self._iter_results(rules, policy_actions)), [rule["rule_id"] for rule in changed]
+
+    def _forget_observations(self, rule: Dict) -> None:
+        """
+        Drop remembered observations for every flow within a rule's port range,
+        so they are probed again.
+        """
+        low, high = port_bounds(rule["port"])
+        observed = self._observations.setdefault((rule["protocol"], rule["direction"]), {})
+        if high - low + 1 < len(observed):
+            for port in range(low, high + 1):
+                observed.pop(port, None)
+        else:
+            for port in [port for port in observed if low <= port <= high]:
+                del observed[port]
+
+    def _iter_results(self, rules: List[Dict], policy_actions: List[str]) -> Iterator[Dict]:
+        """
+        Validate prepared rules with the configured probing strategy.
+        :return: Iterator of validation results in rule order.
+        """
+        if self.dry_run:
+            return (self._build_result(rule, action, action) for rule, action in zip(rules, policy_actions))
+
+        if self.namespaces:
+            return self._iter_sandboxed(rules, policy_actions)
+
+        if self.cache is not None:
+            self.firewall_state = self._firewall_state(self.simulator.backend, LOCAL_ADDRESS)
+
+        if self.plan_probes:
+            return self._iter_planned(rules, policy_actions)
+        if self.max_in_flight == 1:
+            return (self.validate_rule(rule, action) for rule, action in zip(rules, policy_actions))
+        if self.simulator.backend == "raw":
+            return self._iter_batched(rules, policy_actions)
+        return self._iter_concurrent(rules, policy_actions)
+
+    def _prepare_rules(self) -> Tuple[List[Dict], List[str]]:
+        """
+        Load, analyze and compile the rules. The work is reused while the rules
+        file is unchanged, so a long-lived validator only pays for probing.
+        :return: Rules and the action the compiled policy takes for each rule.
+        """
+        if self.rule_file is None:
+            return self._prepared[1], self._prepared[2]
+        try:
+            stat = os.stat(self.rule_file)
+            stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            stamp = None
+        if stamp is not None and self._prepared is not None and self._prepared[0] == stamp:
+            return self._prepared[1], self._prepared[2]
+
         rules = self.load_rules()
-        results = []
-
-        for rule in rules:
-            protocol = rule["protocol"]
-            port = rule["port"]
-            direction = rule["direction"]
-            expected_action = rule["action"]
-
-            observed_action = self.simulator.simulate_traffic(protocol, port, direction)
-
-            # Normalize observed_action to match expected_action vocabulary
-            normalized_observed = "allow" if observed_action == "allowed" else "block"
-
-            result = {
-                "rule_id": rule["rule_id"],
-                "protocol": protocol,
-                "port": port,
-                "direction": direction,
-                "expected_action": expected_action,
-                "observed_action": normalized_observed,
-                "status": "pass" if expected_action == normalized_observed else "fail"
-            }
-            results.append(result)
-
-            # Log the result
-            self.logger.info(f"Rule {rule['rule_id']} validation: {result['status']}")
-
-        return results
+        self.analyze_rules(rules)
+        with metrics.span("rules.compile"):
+            self.policy = CompiledPolicy(rules, addresses=self._probe_addresses(rules))
+            policy_actions = self.policy.evaluate_rules(rules)
+        self._prepared = (stamp, rules, policy_actions)
+        return rules, policy_actions
+
+    def _probe_addresses(self, rules: List[Dict]) -> Dict[str, Tuple[str, str]]:
+        """
+        Find where probes are sent from and to, so only rules matching those
+        addresses decide the compiled policy. Host probes run from and to
+        LOCAL_ADDRESS; sandbox probes run between a shard's client and firewall
+        namespaces.
+        :param rules: Rules in the rules file format.
+        :return: Mapping of direction to (source, destination) address.
+        """
+        if not self.namespaces:
+            return {direction: (LOCAL_ADDRESS, LOCAL_ADDRESS) for direction in DIRECTIONS}
+        shards = [NamespaceSandbox.flow_addresses(index) for index in range(self.namespaces)]
+        networks = [(rule["direction"], rule_networks(rule)) for rule in rules
+                    if rule.get("source") or rule.get("destination")]
+
+        def matching(addresses):
+            return [ipaddress.ip_address(addresses[direction][0]) in source
+                    and ipaddress.ip_address(addresses[direction][1]) in destination
+                    for direction, (source, destination) in networks]
+
+        # Each shard has its own subnet; one policy only holds if no rule tells them apart
+        first = matching(shards[0])
+        if any(matching(addresses) != first for addresses in shards[1:]):
+            raise ValueError("Rule networks match only some namespace shards' addresses; use a single namespace")
+        return shards[0]
+
+    @staticmethod
+    def _firewall_state(backend: str, target: str, netns: Optional[str] = None) -> str:
+        """
+        Fingerprint everything a cached probe result depends on: the iptables
+        filter table, the nftables table, the probe backend and the probe target.
+        :param netns: Namespace whose firewall is read; the host's if omitted.
+        :return: Key for ProbeCache lookups.
+        """
+        return FirewallManager.ruleset_fingerprint(
+            FirewallManager.save_live_ruleset(netns), FirewallManager.save_nft_table(netns),
+            f"backend={backend}", f"target={target}")
+
+    def _iter_sandboxed(self, rules: List[Dict], policy_actions: List[str]) -> Iterator[Dict]:
+        """
+        Probe rules from network namespaces, one shard per namespace.
+        The namespaces are created on first use and removed when the iterator
+        is exhausted or closed.
+        :return: Iterator of validation results in rule order.
+        """
+        with NamespaceSandbox(self.namespaces) as sandbox:
+            shards = sandbox.create(self.rule_file)
+            simulators = [TrafficSimulator(routes=NamespaceSandbox.routes(shard), timing=self.timing)
+                          for shard in shards]
+            if self.cache is not None:
+                routes = NamespaceSandbox.routes(shards[0])
+                self.firewall_state = self._firewall_state(
+                    simulators[0].backend, " ".join(address for _, address in routes.values()),
+                    shards[0]["firewall"])
+            if self.plan_probes:
+                yield from self._iter_planned(rules, policy_actions, simulators)
+            else:
+                yield from self._iter_concurrent(rules, policy_actions, simulators)
+
+    def _iter_planned(self, rules: List[Dict], policy_actions: List[str],
+                      simulators: Optional[List[TrafficSimulator]] = None) -> Iterator[Dict]:
+        """
+        Probe the planned test vectors, then fan the observations out to the rules.
+        A rule's observed action is still taken at its lowest port; it also fails
+        if any class of ports it is the first match for behaves differently, or if
+        the port just outside either end of its range does not get the chain policy.
+        :param simulators: Spread probes round-robin over these simulators; defaults to self.simulator.
+        :return: Iterator of validation results in rule order.
+        """
+        planner = ProbePlanner(rules, self.policy)
+        vectors = planner.plan()
+        self.logger.info(f"Planned {len(vectors)} probes for {len(rules)} rules")
+        metrics.increment("probes_planned", len(vectors))
+
+        simulators = simulators or [self.simulator]
+        workers = self.max_in_flight * len(simulators)
+        evidence = [{} if self.capture is not None else None for _ in vectors]
+        if simulators[0].backend == "raw":
+            flows = [(v["protocol"], v["port"], v["direction"]) for v in vectors]
+            observations = []
+            for start in range(0, len(flows), self.max_in_flight):
+                observations += self._observe_batch(flows[start:start + self.max_in_flight], simulators[0],
+                                                    evidence[start:start + self.max_in_flight])
+        elif workers == 1:
+            observations = [self._observe(v["protocol"], v["port"], v["direction"], simulators[0], e)
+                            for v, e in zip(vectors, evidence)]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                observations = list(pool.map(
+                    lambda item: self._observe(item[1]["protocol"], item[1]["port"], item[1]["direction"],
+                                               simulators[item[0] % len(simulators)], evidence[item[0]]),
+                    enumerate(vectors)))
+
+        mismatched_ports = defaultdict(list)
+        for vector, observed_action in zip(vectors, observations):
+            expected = "allowed" if vector["expected"] == "allow" else "blocked"
+            if observed_action == expected:
+                continue
+            # A class owned by the rule is reported whole; a gap only at the probed port
+            ports = str(format_port(vector["ports"])) if vector["owner"] != NO_MATCH else str(vector["port"])
+            for index in vector["rules"]:
+                if ports not in mismatched_ports[index]:
+                    mismatched_ports[index].append(ports)
+
+        for index, (rule, action) in enumerate(zip(rules, policy_actions)):
+            vector = planner.vector_for(rule)
+            yield self._build_result(rule, observations[vector], action, mismatched_ports.get(index),
+                                     evidence[vector])
+
+    def _iter_concurrent(self, rules: List[Dict], policy_actions: List[str],
+                         simulators: Optional[List[TrafficSimulator]] = None) -> Iterator[Dict]:
+        """
+        Probe rules on a worker pool, keeping a bounded number of results
+        queued so memory does not grow with the number of rules.
+        :param simulators: Spread rules round-robin over these simulators, with
+                           max_in_flight probes each; defaults to self.simulator.
+        :return: Iterator of validation results in rule order.
+        """
+        simulators = simulators or [self.simulator]
+        workers = self.max_in_flight * len(simulators)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            queued = deque()
+            for index, (rule, action) in enumerate(zip(rules, policy_actions)):
+                simulator = simulators[index % len(simulators)]
+                queued.append(pool.submit(self.validate_rule, rule, action, simulator))
+                if len(queued) >= 2 * workers:
+                    yield queued.popleft().result()
+            while queued:
+                yield queued.popleft().result()
+
+    def _iter_batched(self, rules: List[Dict], policy_actions: List[str]) -> Iterator[Dict]:
+        """
+        Probe rules with the raw backend in batches of max_in_flight probes.
+        :return: Iterator of validation results in rule order.
+        """
+        for start in range(0, len(rules), self.max_in_flight):
+            batch = rules[start:start + self.max_in_flight]
+            flows = [(rule["protocol"], port_bounds(rule["port"])[0], rule["direction"]) for rule in batch]
+            evidence = [{} if self.capture is not None else None for _ in batch]
+            observed = self._observe_batch(flows, self.simulator, evidence)
+            for rule, action, observed_action, item in zip(batch, policy_actions[start:start + self.max_in_flight],
+                                                         observed, evidence):
+                yield self._build_result(rule, observed_action, action, evidence=item)
+
+    def validate_rule(self, rule: Dict, policy_action: Optional[str] = None,
+                      simulator: Optional[TrafficSimulator] = None) -> Dict:
+        """
+        Validate a single rule by simulating traffic for it.
+        :param rule: A dictionary containing the rule details.
+        :param policy_action: Verdict the compiled policy predicts for the rule's flow.
+        :param simulator: Simulator to probe with; defaults to self.simulator.
+        :return: Validation result for the rule.
+        """
+        port = port_bounds(rule["port"])[0]  # Probe the lowest port of a range
+        evidence = {} if self.capture is not None else None
+        observed_action = self._observe(rule["protocol"], port, rule["direction"], simulator or self.simulator,
+                                        evidence)
+        return self._build_result(rule, observed_action, policy_action, evidence=evidence)
+
+    def _observe(self, protocol: str, port: int, direction: str, simulator: TrafficSimulator,
+                 evidence: Optional[Dict] = None) -> str:
+        """
+        Probe a flow, reusing a cached result when there is one.
+        :param evidence: Filled with captured evidence when the flow is actually probed.
+        :return: 'allowed' or 'blocked' as reported by TrafficSimulator.
+        """
+        observed_action = self._recall(protocol, port, direction)
+        if observed_action is None:
+            if evidence is not None:
+                observed_action = simulator.simulate_traffic(protocol, port, direction, evidence)
+            else:
+                observed_action = simulator.simulate_traffic(protocol, port, direction)
+            self._remember(protocol, port, direction, observed_action)
+        return observed_action
+
+    def _observe_batch(self, flows: List[Tuple[str, int, str]], simulator: TrafficSimulator,
+                       evidence: List[Optional[Dict]]) -> List[str]:
+        """
+        Probe several flows with one simulate_batch() call, so the raw backend sends
+        them back to back and waits out a single timeout. Remembered and cached
+        results are reused, and a flow listed twice is probed once.
+        :param flows: (protocol, port, direction) tuples.
+        :param evidence: One dict (or None) per flow, filled when the flow is probed.
+        :return: 'allowed' or 'blocked' per flow.
+        """
+        observed = [self._recall(*flow) for flow in flows]
+        missing: Dict[Tuple, List[int]] = {}
+        for index, (flow, observed_action) in enumerate(zip(flows, observed)):
+            if observed_action is None:
+                missing.setdefault(flow, []).append(index)
+        if not missing:
+            return observed
+
+        probes = list(missing)
+        batch_evidence = [evidence[missing[flow][0]] for flow in probes] if self.capture is not None else None
+        for flow, observed_action in zip(probes, simulator.simulate_batch(probes, batch_evidence)):
+            self._remember(*flow, observed_action)
+            first = missing[flow][0]
+            for index in missing[flow]:
+                observed[index] = observed_action
+                if index != first and evidence[index] is not None:
+                    evidence[index].update(evidence[first])
+        return observed
+
+    def _recall(self, protocol: str, port: int, direction: str) -> Optional[str]:
+        """
+        Return the result remembered by watch mode or cached for a flow, if any.
+        """
+        remembered = self._observations.get((protocol, direction)) if self._observations is not None else None
+        if remembered is not None and port in remembered:
+            return remembered[port]
+        if self.cache is not None:
+            return self.cache.get(protocol, port, direction, self.firewall_state)
+        return None
+
+    def _remember(self, protocol: str, port: int, direction: str, observed_action: str) -> None:
+        """
+        Keep a probed result in the cache and, in watch mode, for the next revalidation.
+        """
+        if observed_action not in ("allowed", "blocked"):
+            return
+        if self.cache is not None:
+            self.cache.put(protocol, port, direction, self.firewall_state, observed_action)
+        if self._observations is not None:
+            self._observations.setdefault((protocol, direction), {})[port] = observed_action
+
+    def _build_result(self, rule: Dict, observed_action: str, policy_action: Optional[str] = None,
+                      mismatched_ports: Optional[List[str]] = None, evidence: Optional[Dict] = None) -> Dict:
+        """
+        Compare an observed action with the rule and log the outcome.
+        :param rule: A dictionary containing the rule details.
+        :param observed_action: 'allowed' or 'blocked' as reported by TrafficSimulator.
+        :param policy_action: 'allowed' or 'blocked' as predicted by the compiled policy.
+        :param mismatched_ports: Port ranges this rule decides that behaved against its action.
+        :param evidence: What the packet capture saw of the probe.
+        :return: Validation result for the rule.
+        """
+        protocol = rule["protocol"]
+        port = rule["port"]
+        direction = rule["direction"]
+        expected_action = rule["action"]
+
+        # Normalize observed_action to match expected_action vocabulary
+        normalized_observed = "allow" if observed_action == "allowed" else "block"
+
+        result = {
+            "rule_id": rule["rule_id"],
+            "protocol": protocol,
+            "port": port,
+            "direction": direction,
+            "expected_action": expected_action,
+            "observed_action": normalized_observed,
+            "status": "pass" if expected_action == normalized_observed else "fail"
+        }
+        if policy_action is not None:
+            # What the whole policy does to this flow after first-match resolution;
+            # differs from expected_action when an earlier rule shadows this one.
+            result["policy_action"] = "allow" if policy_action == "allowed" else "block"
+        if mismatched_ports:
+            result["mismatched_ports"] = mismatched_ports
+            result["status"] = "fail"
+        if evidence:
+            result["evidence"] = evidence
+
+        metrics.increment("rules_validated")
+
+        # Log the result
+        self.logger.info(f"Rule {rule['rule_id']} validation: {result['status']}")
+
+        return result
 
 
 if __name__ == "__main__":
@@ -12,21 +12,68 @@
 # 
 # You should have received a copy of the GNU General Public License
 # along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import os
+import signal
 import subprocess
-from typing import Dict
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from src import metrics
+from src.adaptive_timeout import AdaptiveTimeout
+from src.packet_capture import PacketCapture
+from src.probe_engine import RawProbeEngine
+
+BACKENDS = ("hping3", "raw")
+LOCAL_ADDRESS = "127.0.0.1"  # Source and target of probes sent on the host
 
 class TrafficSimulator:
-    """Class to simulate network traffic using hping3."""
+    """Class to simulate network traffic using hping3 or in-process raw sockets."""
+
+    def __init__(self, backend: str = "hping3", routes: Optional[Dict[str, Tuple[str, str]]] = None,
+                 timing: Optional[AdaptiveTimeout] = None, capture: Optional[PacketCapture] = None):
+        """
+        Initialize TrafficSimulator with a probe backend.
+        :param backend: 'hping3' to spawn hping3 per probe, or 'raw' to send
+                        probes from a shared in-process raw socket engine.
+        :param routes: Map each direction to the (network namespace, target address)
+                       its probes are sent from and to, instead of 127.0.0.1 on the host.
+        :param timing: Stop waiting for silent probes after a deadline learned from
+                       reply round-trip times, retrying them up to timing.retries times,
+                       instead of waiting out hping3's fixed timeout.
+        :param capture: Capture probe traffic on the host and report per-probe evidence.
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unsupported probe backend: {backend}")
+        if routes and backend != "hping3":
+            raise ValueError("Only the hping3 backend can probe from network namespaces")
+        if routes and capture is not None:
+            raise ValueError("Packet capture cannot observe probes sent from network namespaces")
+        self.backend = backend
+        self.routes = routes
+        self.timing = timing
+        self.capture = capture
+        self.engine = None
+        self._engine_lock = threading.Lock()
 
-    def simulate_traffic(self, protocol: str, port: int, direction: str) -> str:
+    def simulate_traffic(self, protocol: str, port: int, direction: str, evidence: Optional[Dict] = None) -> str:
         """
         Simulate network traffic and return the result.
         :param protocol: The protocol to use ('tcp', 'udp', or 'icmp').
         :param port: The port to test.
         :param direction: The traffic direction ('incoming' or 'outgoing').
+        :param evidence: Filled with what the packet capture saw of the probe, if capturing.
         :return: 'allowed' if the traffic passes, 'blocked' otherwise.
         """
-        target = "127.0.0.1"  # Test traffic locally
+        metrics.increment("probes_sent")
+        if self.backend == "raw":
+            with metrics.span("probe.raw"):
+                return self._get_engine().probe(protocol, port, direction, evidence)
+
+        target = LOCAL_ADDRESS  # Test traffic locally
+        sudo = "sudo"
+        if self.routes:
+            netns, target = self.routes[direction]
+            sudo = f"sudo ip netns exec {netns}"
         flags = {
             "tcp": "-S",   # TCP SYN flag
             "udp": "--udp",  # UDP traffic
@@ -35,25 +82,129 @@ class TrafficSimulator:
 
         # Construct the hping3 command
         if direction == "incoming":
-            cmd = f"sudo hping3 {target} {flags[protocol]} -p {port} -c 1"
+            cmd = f"{sudo} hping3 {target} {flags[protocol]} -p {port} -c 1"
         else:  # Simulate outgoing traffic
-            cmd = f"sudo hping3 -c 1 -s {port} {target} {flags[protocol]}"
+            cmd = f"{sudo} hping3 -c 1 -s {port} {target} {flags[protocol]}"
+
+        watch = None
+        if self.capture is not None and evidence is not None:
+            # hping3 picks its own source port and sequence number, so match on the port under test
+            self.capture.start()
+            ports = {} if protocol == "icmp" else {"dport" if direction == "incoming" else "sport": port}
+            watch = self.capture.watch(protocol, **ports)
+
+        if self.timing is not None:
+            verdict = self._run_adaptive(cmd, (sudo, target))
+        else:
+            verdict = self._run_hping3(cmd)
 
+        if watch is not None:
+            evidence.update(self.capture.finish(watch, replied=verdict == "allowed"))
+        return verdict
+
+    def _run_hping3(self, cmd: str) -> str:
+        """
+        Run hping3 once, waiting for it to exit.
+        :param cmd: hping3 command.
+        :return: 'allowed' or 'blocked'.
+        """
+        metrics.increment("subprocesses_spawned")
         try:
-            result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-
-            # Parse hping3 output
-            if "flags=SA" in result.stdout:  # TCP response for allowed traffic
-                return "allowed"
-            elif "Operation not permitted" in result.stderr:  # Blocked traffic
-                return "blocked"
-            elif "ICMP Packet received" in result.stdout:  # ICMP allowed
-                return "allowed"
-            else:
-                return "blocked"
+            with metrics.span("probe.hping3"):
+                result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+            return self._parse_hping3(result.stdout, result.stderr)
         except subprocess.CalledProcessError as e:
             return f"Error: {e}"
 
+    def _run_adaptive(self, cmd: str, path: Tuple[str, str]) -> str:
+        """
+        Run hping3 under a learned deadline. 'hping3 -c 1' exits as soon as its
+        reply arrives, so any reply ends the probe early; only silence is retried.
+        :param cmd: hping3 command.
+        :param path: Key for the round-trip times of this namespace and target.
+        :return: 'allowed' or 'blocked'.
+        """
+        for attempt in range(self.timing.retries + 1):
+            metrics.increment("subprocesses_spawned")
+            with metrics.span("probe.hping3"):
+                start = time.monotonic()
+                # A process group of its own, so sudo and hping3 can be stopped together
+                process = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                           text=True, start_new_session=True)
+                deadline = self.timing.deadline(path, attempt)
+                try:
+                    stdout, stderr = process.communicate(timeout=deadline)
+                except subprocess.TimeoutExpired:
+                    os.killpg(process.pid, signal.SIGTERM)
+                    stdout, stderr = process.communicate()
+                    metrics.increment("probe_timeouts")
+            if self._is_reply(stdout, stderr):
+                self.timing.record(path, time.monotonic() - start)
+                return self._parse_hping3(stdout, stderr)
+            if deadline >= self.timing.max_timeout:
+                break  # Waiting the full timeout is conclusive
+        return "blocked"
+
+    @staticmethod
+    def _is_reply(stdout: str, stderr: str) -> bool:
+        """
+        Tell a definitive answer from silence in hping3 output.
+        :return: True if a reply or a local send error was reported.
+        """
+        return "flags=" in stdout or "ICMP" in stdout or "Operation not permitted" in stderr
+
+    @staticmethod
+    def _parse_hping3(stdout: str, stderr: str) -> str:
+        """
+        Turn hping3 output into a verdict.
+        :return: 'allowed' or 'blocked'.
+        """
+        if "flags=SA" in stdout or "flags=R" in stdout:  # SYN-ACK or reset: the SYN reached the host
+            return "allowed"
+        elif "Operation not permitted" in stderr:  # Blocked traffic
+            return "blocked"
+        elif "ICMP Packet received" in stdout:  # ICMP allowed
+            return "allowed"
+        else:
+            return "blocked"
+
+    def simulate_batch(self, probes: List[Tuple[str, int, str]], evidence: Optional[List[Dict]] = None) -> List[str]:
+        """
+        Simulate traffic for several probes at once.
+        The raw backend sends the whole batch before waiting for replies.
+        :param probes: List of (protocol, port, direction) tuples.
+        :param evidence: One dict per probe, filled with captured evidence if capturing.
+        :return: Results in the same order as the probes.
+        """
+        if self.backend == "raw":
+            metrics.increment("probes_sent", len(probes))
+            with metrics.span("probe.raw_batch"):
+                return self._get_engine().probe_batch(probes, evidence)
+        if evidence is None:
+            return [self.simulate_traffic(*probe) for probe in probes]
+        return [self.simulate_traffic(*probe, evidence=item) for probe, item in zip(probes, evidence)]
+
+    def close(self) -> None:
+        """
+        Release the raw probe engine, if one was started.
+        """
+        with self._engine_lock:
+            if self.engine is not None:
+                self.engine.close()
+                self.engine = None
+
+    def _get_engine(self) -> RawProbeEngine:
+        """
+        Return the shared raw probe engine, starting it on first use.
+        Probing threads share one engine, so creation is serialized.
+        """
+        with self._engine_lock:
+            if self.engine is None:
+                engine = RawProbeEngine(timing=self.timing, capture=self.capture)
+                engine.start()
+                self.engine = engine
+            return self.engine
+
 if __name__ == "__main__":
     # Example usage
     simulator = TrafficSimulator()
@@ -0,0 +1,56 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import unittest
+from src.adaptive_timeout import AdaptiveTimeout
+
+class TestAdaptiveTimeout(unittest.TestCase):
+    def test_cold_start_uses_max_timeout(self):
+        """Until enough replies are seen, probes wait the full timeout."""
+        timing = AdaptiveTimeout(max_timeout=1.0, min_samples=3)
+        timing.record("a", 0.001)
+        timing.record("a", 0.001)
+        self.assertEqual(timing.deadline("a"), 1.0)
+        self.assertEqual(timing.deadline("b"), 1.0)
+        self.assertIsNone(timing.percentile("b", 0.99))
+
+    def test_learned_deadline(self):
+        """The deadline follows the p99 round-trip time, clamped and doubled per retry."""
+        timing = AdaptiveTimeout(factor=4.0, min_timeout=0.01, max_timeout=1.0, min_samples=10)
+        for _ in range(99):
+            timing.record("a", 0.005)
+        timing.record("a", 0.5)  # A single outlier above p99
+        self.assertAlmostEqual(timing.deadline("a"), 0.02)
+        self.assertAlmostEqual(timing.deadline("a", attempt=1), 0.04)
+        self.assertEqual(timing.deadline("a", attempt=10), 1.0)
+
+        for _ in range(10):
+            timing.record("fast", 0.0001)
+        self.assertEqual(timing.deadline("fast"), 0.01)
+
+    def test_window(self):
+        """Only the most recent round-trip times count."""
+        timing = AdaptiveTimeout(window=5, min_samples=1)
+        for _ in range(5):
+            timing.record("a", 0.2)
+        for _ in range(5):
+            timing.record("a", 0.001)
+        self.assertEqual(timing.percentile("a", 0.99), 0.001)
+
+    def test_invalid_retries(self):
+        with self.assertRaises(ValueError):
+            AdaptiveTimeout(retries=-1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import os
+import tempfile
+import unittest
+from benchmarks.bench import compare, generate_rules, percentile
+from src.rule_loader import RuleLoader
+
+class TestBench(unittest.TestCase):
+    def test_generate_rules(self):
+        """Generated rule sets are valid and reproducible."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            first, second = os.path.join(tmpdir, "a.json"), os.path.join(tmpdir, "b.json")
+            generate_rules(50, first)
+            generate_rules(50, second)
+            loader = RuleLoader(first)
+            rules = loader.load()
+            self.assertEqual(len(rules), 50)
+            self.assertEqual(loader.errors, [])
+            with open(first) as a, open(second) as b:
+                self.assertEqual(a.read(), b.read())
+
+    def test_percentile(self):
+        """Nearest-rank percentiles."""
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.50), 50)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile([7], 0.99), 7)
+        self.assertIsNone(percentile([], 0.5))
+
+    def test_compare(self):
+        """Only throughput drops beyond the threshold are regressions."""
+        previous = {"results": [
+            {"stage": "apply_batch", "rules": 10, "throughput_per_s": 100.0},
+            {"stage": "report", "rules": 10, "throughput_per_s": 100.0},
+            {"stage": "apply_per_rule", "rules": 100000, "skipped": True}
+        ]}
+        current = {"results": [
+            {"stage": "apply_batch", "rules": 10, "throughput_per_s": 95.0},
+            {"stage": "report", "rules": 10, "throughput_per_s": 50.0},
+            {"stage": "apply_per_rule", "rules": 100000, "skipped": True}
+        ]}
+        regressions = compare(previous, current, 0.1)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn("report (10 rules)", regressions[0])
+
+if __name__ == "__main__":
+    unittest.main()
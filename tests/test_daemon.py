@@ -0,0 +1,114 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import json
+import os
+import socket
+import tempfile
+import threading
+import unittest
+from src.client import request
+from src.daemon import ValidationDaemon
+
+RULES = [
+    {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "block"},
+    {"rule_id": 2, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "allow"}
+]
+
+class TestValidationDaemon(unittest.TestCase):
+    def setUp(self):
+        """Start a daemon on a temporary socket."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.rule_file = os.path.join(self.tmpdir.name, "rules.json")
+        with open(self.rule_file, "w") as file:
+            json.dump(RULES, file)
+        self.socket_path = os.path.join(self.tmpdir.name, "daemon.sock")
+        self.daemon = ValidationDaemon(self.rule_file, self.socket_path,
+                                       os.path.join(self.tmpdir.name, "reports", "report.html"))
+        self.daemon.bind()
+        self.thread = threading.Thread(target=self.daemon.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        """Stop the daemon and remove the temporary files."""
+        if self.thread.is_alive():
+            request("shutdown", socket_path=self.socket_path)
+            self.thread.join(5)
+        self.tmpdir.cleanup()
+
+    def test_validate_reuses_validator(self):
+        """
+        Test that dry-run validation is served and repeated requests reuse one validator.
+        """
+        for _ in range(3):
+            result = request("validate", {"dry_run": True}, self.socket_path)
+        self.assertEqual((result["passed"], result["failed"]), (1, 1))
+        self.assertEqual(result["findings"][0]["type"], "shadowed")
+
+        status = request("status", socket_path=self.socket_path)
+        self.assertEqual((status["requests"], status["validators"]), (4, 1))
+
+    def test_concurrent_requests(self):
+        """
+        Test that concurrent requests are all answered.
+        """
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            request("validate", {"dry_run": True}, self.socket_path))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual([result["failed"] for result in results], [1] * 8)
+
+    def test_report_after_validate(self):
+        """
+        Test that the report command renders the last validation.
+        """
+        with self.assertRaisesRegex(Exception, "No validation"):
+            request("report", socket_path=self.socket_path)
+        request("validate", {"dry_run": True}, self.socket_path)
+        path = request("report", socket_path=self.socket_path)["report"]
+        with open(path) as file:
+            self.assertIn("Firewall Rule Validation Report", file.read())
+
+    def test_errors_keep_connection_usable(self):
+        """
+        Test that bad requests get an error response on a connection that stays open.
+        """
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.socket_path)
+            reader = sock.makefile("rb")
+            sock.sendall(b'{"command": "explode"}\nnot json\n{"command": "status"}\n')
+            responses = [json.loads(reader.readline()) for _ in range(3)]
+            reader.close()
+        self.assertEqual([response["ok"] for response in responses], [False, False, True])
+        self.assertIn("Unknown command", responses[0]["error"])
+
+    def test_shutdown_removes_socket(self):
+        """
+        Test that a shutdown request stops the daemon and removes its socket, and a
+        second daemon refuses a socket that is in use.
+        """
+        with self.assertRaisesRegex(Exception, "already listening"):
+            ValidationDaemon(self.rule_file, self.socket_path).bind()
+        request("shutdown", socket_path=self.socket_path)
+        self.thread.join(5)
+        self.assertFalse(self.thread.is_alive())
+        self.assertFalse(os.path.exists(self.socket_path))
+        with self.assertRaisesRegex(Exception, "No daemon listening"):
+            request("status", socket_path=self.socket_path)
+
+if __name__ == "__main__":
+    unittest.main()
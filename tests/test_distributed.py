@@ -0,0 +1,177 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+from benchmarks.bench import generate_rules
+from src import metrics
+from src.distributed import Coordinator, Worker, parse_address
+from src.rule_validator import RuleValidator
+
+class _FakeWorker:
+    """Worker that takes one shard and then misbehaves."""
+
+    def __init__(self, address):
+        self.sock = socket.create_connection(address)
+        self.reader = self.sock.makefile("rb")
+        self.sock.sendall(json.dumps({"worker": "fake"}).encode() + b"\n")
+
+    def take_shard(self):
+        return json.loads(self.reader.readline())
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+class TestDistributedValidation(unittest.TestCase):
+    def setUp(self):
+        """Write a generated rule file."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.rule_file = os.path.join(self.tmpdir.name, "rules.json")
+        generate_rules(60, self.rule_file)
+        self.expected = RuleValidator(self.rule_file, dry_run=True).validate_rules()
+        metrics.reset()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _start(self, coordinator):
+        """Run the coordinator in a thread; the outcome lands in self.outcome."""
+        self.outcome = {}
+        address = coordinator.bind()
+
+        def run():
+            try:
+                self.outcome["results"] = coordinator.run(timeout=30)
+            except Exception as e:
+                self.outcome["error"] = e
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        return address, thread
+
+    def test_parse_address(self):
+        """
+        Test HOST:PORT parsing.
+        """
+        self.assertEqual(parse_address("10.0.0.1:7070"), ("10.0.0.1", 7070))
+        self.assertEqual(parse_address(":7070"), ("0.0.0.0", 7070))
+        with self.assertRaises(ValueError):
+            parse_address("10.0.0.1")
+
+    def test_local_worker_processes(self):
+        """
+        Test that shards validated by several worker processes merge back into rule order.
+        """
+        coordinator = Coordinator(self.rule_file, shard_size=7, dry_run=True)
+        results = coordinator.run(local_workers=3, timeout=60)
+
+        self.assertEqual(results, self.expected)
+        self.assertEqual(coordinator.findings, RuleValidator(self.rule_file).analyze_rules())
+        self.assertGreaterEqual(sum(coordinator.workers.values()), 9)
+
+    def test_dead_worker_shard_is_retried(self):
+        """
+        Test that a shard held by a worker that disconnects is validated by another worker.
+        """
+        coordinator = Coordinator(self.rule_file, shard_size=10, dry_run=True)
+        address, thread = self._start(coordinator)
+        fake = _FakeWorker(address)
+        self.assertEqual(fake.take_shard()["shard"], 0)
+        fake.close()
+        # Let the coordinator notice the disconnect first; otherwise the real worker may steal shard 0
+        deadline = time.monotonic() + 10
+        while "shards_retried" not in metrics.snapshot()["counters"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        Worker(address, name="real").run()
+        thread.join(30)
+
+        self.assertEqual(self.outcome["results"], self.expected)
+        self.assertEqual(coordinator.workers, {"real": 6})
+        self.assertEqual(metrics.snapshot()["counters"]["shards_retried"], 1)
+
+    def test_slow_worker_shard_is_stolen(self):
+        """
+        Test that an idle worker takes over the shard of a worker that stalls.
+        """
+        coordinator = Coordinator(self.rule_file, shard_size=10, dry_run=True)
+        address, thread = self._start(coordinator)
+        fake = _FakeWorker(address)
+        self.assertEqual(fake.take_shard()["shard"], 0)
+
+        Worker(address, name="real").run()
+        thread.join(30)
+        fake.close()
+
+        self.assertEqual(self.outcome["results"], self.expected)
+        self.assertEqual(coordinator.workers, {"real": 6})
+        self.assertEqual(metrics.snapshot()["counters"]["shards_stolen"], 1)
+
+    def test_shard_failing_too_often_raises(self):
+        """
+        Test that the run fails once a shard has been lost max_attempts times.
+        """
+        coordinator = Coordinator(self.rule_file, shard_size=100, dry_run=True, max_attempts=2)
+        address, thread = self._start(coordinator)
+        for _ in range(2):
+            fake = _FakeWorker(address)
+            fake.take_shard()
+            fake.close()
+        thread.join(30)
+
+        self.assertIn("failed 2 times", str(self.outcome["error"]))
+
+    def test_worker_reports_validation_errors(self):
+        """
+        Test that a worker whose validation raises reports the error and the shard is retried.
+        """
+        coordinator = Coordinator(self.rule_file, shard_size=30, dry_run=True, max_attempts=1)
+        address, thread = self._start(coordinator)
+        worker = Worker(address, name="broken")
+        worker._validate = lambda message: 1 / 0
+        worker.run()
+        thread.join(30)
+
+        self.assertIn("division by zero", str(self.outcome["error"]))
+
+    @patch("src.distributed.TrafficSimulator")
+    def test_worker_shares_one_simulator(self, mock_simulator_class):
+        """
+        Test that a probing worker builds validators from the shards it is handed,
+        probes every shard with one simulator and closes it when done.
+        """
+        mock_simulator_class.return_value.backend = "hping3"
+        mock_simulator_class.return_value.simulate_traffic.side_effect = lambda protocol, port, direction: "allowed"
+        coordinator = Coordinator(self.rule_file, shard_size=20)
+        address, thread = self._start(coordinator)
+
+        with patch("src.distributed.RuleValidator.load_rules") as mock_load_rules:
+            Worker(address, name="real").run()
+            mock_load_rules.assert_not_called()
+        thread.join(30)
+
+        self.assertEqual(len(self.outcome["results"]), len(self.expected))
+        mock_simulator_class.assert_called_once()
+        self.assertEqual(mock_simulator_class.return_value.simulate_traffic.call_count, len(self.expected))
+        mock_simulator_class.return_value.close.assert_called_once()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import os
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock
+from src.file_watcher import FileWatcher
+
+class TestFileWatcher(unittest.TestCase):
+    def setUp(self):
+        """Create a temporary rules file."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "rules.json")
+        self.write(self.path, "[]")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    @staticmethod
+    def write(path: str, content: str):
+        with open(path, "w") as file:
+            file.write(content)
+
+    def later(self, action):
+        """Run an action shortly after the watcher starts waiting."""
+        thread = threading.Thread(target=lambda: (time.sleep(0.05), action()))
+        thread.start()
+        self.addCleanup(thread.join)
+
+    def check_watcher(self, watcher: FileWatcher):
+        """Check that the watcher reports writes and renames of the file only."""
+        self.assertFalse(watcher.wait(timeout=0.1))
+
+        self.later(lambda: self.write(self.path, "[1]"))
+        self.assertTrue(watcher.wait(timeout=2))
+
+        # Editors often save by renaming a temporary file over the original
+        def replace():
+            self.write(self.path + ".tmp", "[1, 2]")
+            os.replace(self.path + ".tmp", self.path)
+        self.later(replace)
+        self.assertTrue(watcher.wait(timeout=2))
+
+        self.write(os.path.join(self.tmpdir.name, "other.json"), "[]")
+        self.assertFalse(watcher.wait(timeout=0.2))
+
+    def test_inotify(self):
+        """
+        Test that writes and renames of the watched file are seen, and other files are ignored.
+        """
+        with FileWatcher(self.path) as watcher:
+            if watcher._fd is None:
+                self.skipTest("inotify is not available")
+            self.check_watcher(watcher)
+
+    def test_polling_fallback(self):
+        """
+        Test that changes are found by polling when inotify is unavailable.
+        """
+        with unittest.mock.patch.object(FileWatcher, "_inotify", return_value=None):
+            watcher = FileWatcher(self.path, poll_interval=0.01)
+        self.check_watcher(watcher)
+
+if __name__ == "__main__":
+    unittest.main()
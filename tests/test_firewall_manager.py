@@ -12,6 +12,7 @@
 # 
 # You should have received a copy of the GNU General Public License
 # along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import subprocess
 import unittest
 from unittest.mock import patch, MagicMock
 from src.firewall_manager import FirewallManager
@@ -74,6 +75,268 @@ class TestFirewallManager(unittest.TestCase):
         ]
         mock_subprocess.assert_has_calls(expected_calls, any_order=True)
 
+    @patch("src.firewall_manager.subprocess.run")
+    def test_apply_all_rules_batch(self, mock_subprocess):
+        """
+        Test that batch mode commits every rule in a single iptables-restore call.
+        """
+        mock_subprocess.return_value = MagicMock()
+        self.manager.rules = [
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "allow"},
+            {"rule_id": 2, "direction": "outgoing", "protocol": "udp", "port": 53, "action": "block"}
+        ]
+
+        timings = self.manager.apply_all_rules(batch=True)
+
+        expected_payload = (
+            "*filter\n"
+            "-A INPUT -p tcp --dport 22 -j ACCEPT\n"
+            "-A OUTPUT -p udp --dport 53 -j DROP\n"
+            "COMMIT\n"
+        )
+        mock_subprocess.assert_called_once_with(
+            "sudo iptables-restore --noflush", shell=True, check=True, input=expected_payload, text=True
+        )
+        self.assertIn("compile", timings)
+        self.assertIn("commit", timings)
+
+    @patch("src.firewall_manager.subprocess.run")
+    def test_reset_firewall_batch(self, mock_subprocess):
+        """
+        Test that batch reset flushes the filter table through iptables-restore.
+        """
+        mock_subprocess.return_value = MagicMock()
+
+        self.manager.reset_firewall(batch=True)
+
+        mock_subprocess.assert_called_once_with(
+            "sudo iptables-restore --noflush", shell=True, check=True, input="*filter\n-F\nCOMMIT\n", text=True
+        )
+
+    @patch("src.firewall_manager.subprocess.run")
+    def test_tester_chains(self, mock_subprocess):
+        """
+        Test that tester chains are loaded and removed without touching other rules.
+        """
+        self.manager.rules = [{"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "allow"}]
+        fresh = "*filter\n:INPUT ACCEPT [0:0]\n:OUTPUT ACCEPT [0:0]\n-A INPUT -p tcp --dport 80 -j DROP\nCOMMIT\n"
+        loaded = ("*filter\n:INPUT ACCEPT [0:0]\n:OUTPUT ACCEPT [0:0]\n:firewall_tester_input - [0:0]\n"
+                  ":firewall_tester_output - [0:0]\n-A INPUT -j firewall_tester_input\n"
+                  "-A INPUT -p tcp --dport 80 -j DROP\n-A OUTPUT -j firewall_tester_output\n"
+                  "-A firewall_tester_input -p tcp -m tcp --dport 22 -j ACCEPT\nCOMMIT\n")
+        mock_subprocess.side_effect = lambda command, **kwargs: MagicMock(stdout=fresh if "save" in command else "")
+        self.manager.load_tester_chains()
+        mock_subprocess.side_effect = lambda command, **kwargs: MagicMock(stdout=loaded if "save" in command else "")
+        self.manager.load_tester_chains()
+        self.manager.remove_tester_chains()
+
+        payloads = [c.kwargs["input"] for c in mock_subprocess.call_args_list if "restore" in c.args[0]]
+        header = "*filter\n:firewall_tester_input - [0:0]\n:firewall_tester_output - [0:0]\n"
+        spec = "-A firewall_tester_input -p tcp --dport 22 -j ACCEPT\nCOMMIT\n"
+        self.assertEqual(payloads, [
+            header + "-I INPUT 1 -j firewall_tester_input\n-I OUTPUT 1 -j firewall_tester_output\n" + spec,
+            header + spec,
+            "*filter\n-D INPUT -j firewall_tester_input\n-D OUTPUT -j firewall_tester_output\n"
+            "-F firewall_tester_input\n-X firewall_tester_input\n"
+            "-F firewall_tester_output\n-X firewall_tester_output\nCOMMIT\n"
+        ])
+        self.assertFalse(any("-F\n" in payload for payload in payloads))
+
+    @patch("src.firewall_manager.subprocess.run")
+    def test_netns_commands(self, mock_subprocess):
+        """
+        Test that a namespaced manager runs iptables inside the namespace.
+        """
+        mock_subprocess.return_value = MagicMock(stdout="")
+        manager = FirewallManager(self.rule_file, netns="fwtest-0")
+
+        manager.reset_firewall()
+        manager.apply_all_rules(batch=True)
+        manager.read_live_rules()
+
+        commands = [call.args[0] for call in mock_subprocess.call_args_list]
+        self.assertEqual(commands, [
+            "sudo ip netns exec fwtest-0 iptables -F",
+            "sudo ip netns exec fwtest-0 iptables-restore --noflush",
+            "sudo ip netns exec fwtest-0 iptables-save -t filter"
+        ])
+
+    @patch("src.firewall_manager.subprocess.run")
+    def test_nftables_backend(self, mock_subprocess):
+        """
+        Test that the nftables backend loads one ruleset atomically and resets only its table.
+        """
+        mock_subprocess.return_value = MagicMock()
+        manager = FirewallManager(self.rule_file, backend="nftables")
+
+        manager.apply_all_rules()
+        manager.reset_firewall()
+
+        self.assertEqual(mock_subprocess.call_count, 2)
+        apply_call, reset_call = mock_subprocess.call_args_list
+        self.assertEqual(apply_call.args[0], "sudo nft -f -")
+        self.assertIn("tcp dport vmap @input_tcp_1", apply_call.kwargs["input"])
+        self.assertEqual(reset_call.kwargs["input"],
+                         "add table inet firewall_tester\ndelete table inet firewall_tester\n")
+        with self.assertRaises(Exception):
+            manager.reconcile_rules()
+        with self.assertRaises(ValueError):
+            FirewallManager(self.rule_file, backend="pf")
+
+    def test_build_rule_spec_range_and_cidr(self):
+        """
+        Test that port ranges and networks are translated to iptables matches.
+        """
+        rule = {
+            "rule_id": 1,
+            "direction": "incoming",
+            "protocol": "tcp",
+            "port": "1000-2000",
+            "source": "10.0.0.0/8",
+            "destination": "192.168.1.10",
+            "action": "block"
+        }
+
+        spec = self.manager.build_rule_spec(rule)
+
+        self.assertEqual(spec, "-A INPUT -s 10.0.0.0/8 -d 192.168.1.10 -p tcp --dport 1000:2000 -j DROP")
+        parsed = FirewallManager.parse_iptables_save(
+            "-A INPUT -s 10.0.0.0/8 -d 192.168.1.10/32 -p tcp -m tcp --dport 1000:2000 -j DROP\n"
+        )
+        self.assertEqual(parsed[0]["port"], "1000-2000")
+        self.assertEqual(FirewallManager._rule_key(parsed[0]), FirewallManager._rule_key(rule))
+
+    def test_parse_iptables_save(self):
+        """
+        Test that iptables-save output is parsed into the rule file format.
+        """
+        output = (
+            "*filter\n"
+            ":INPUT ACCEPT [0:0]\n"
+            "-A INPUT -p tcp -m tcp --dport 22 -j ACCEPT\n"
+            "-A INPUT -m conntrack --ctstate RELATED,ESTABLISHED -j ACCEPT\n"
+            "-A FORWARD -p tcp -m tcp --dport 80 -j DROP\n"
+            "-A OUTPUT -p udp -m udp --dport 53 -j DROP\n"
+            "COMMIT\n"
+        )
+
+        rules = FirewallManager.parse_iptables_save(output)
+
+        self.assertEqual(len(rules), 3)
+        self.assertEqual(rules[0], {"rule_id": 1, "direction": "incoming", "protocol": "tcp",
+                                    "port": 22, "action": "allow"})
+        self.assertEqual(rules[1]["raw"], "-m conntrack --ctstate RELATED,ESTABLISHED -j ACCEPT")
+        self.assertEqual(rules[2]["direction"], "outgoing")
+        self.assertEqual(rules[2]["action"], "block")
+
+    def test_compute_diff(self):
+        """
+        Test that only changed rules produce operations, at the right positions.
+        """
+        live = [
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "allow"},
+            {"rule_id": 2, "direction": "incoming", "protocol": "tcp", "port": 23, "action": "allow"},
+            {"rule_id": 3, "direction": "incoming", "protocol": "tcp", "port": 80, "action": "allow"},
+            {"rule_id": 4, "direction": "outgoing", "protocol": "udp", "port": 53, "action": "block"}
+        ]
+        desired = [
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "allow"},
+            {"rule_id": 2, "direction": "incoming", "protocol": "tcp", "port": 80, "action": "allow"},
+            {"rule_id": 3, "direction": "incoming", "protocol": "tcp", "port": 443, "action": "allow"},
+            {"rule_id": 4, "direction": "outgoing", "protocol": "udp", "port": 53, "action": "block"}
+        ]
+
+        operations = self.manager.compute_diff(live, desired)
+
+        self.assertEqual(operations, [
+            "-I INPUT 4 -p tcp --dport 443 -j ACCEPT",
+            "-D INPUT 2"
+        ])
+        self.assertEqual(self.manager.compute_diff(desired, desired), [])
+
+    @patch("src.firewall_manager.subprocess.run")
+    def test_reconcile_rules(self, mock_subprocess):
+        """
+        Test that reconcile reads the live ruleset once and commits only the delta.
+        """
+        mock_subprocess.side_effect = [
+            MagicMock(stdout="*filter\n-A INPUT -p tcp -m tcp --dport 22 -j ACCEPT\nCOMMIT\n"),
+            MagicMock()
+        ]
+        self.manager.rules = [
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "allow"},
+            {"rule_id": 2, "direction": "outgoing", "protocol": "udp", "port": 53, "action": "block"}
+        ]
+
+        self.manager.reconcile_rules()
+
+        self.assertEqual(mock_subprocess.call_count, 2)
+        mock_subprocess.assert_called_with(
+            "sudo iptables-restore --noflush", shell=True, check=True,
+            input="*filter\n-I OUTPUT 1 -p udp --dport 53 -j DROP\nCOMMIT\n", text=True
+        )
+
+    @patch("src.firewall_manager.subprocess.run")
+    def test_optimize_rules_with_counters(self, mock_subprocess):
+        """
+        Test that hit counters are read once and used to reorder an equivalent rule list.
+        """
+        mock_subprocess.return_value = MagicMock(stdout=(
+            "*filter\n:INPUT ACCEPT [500:40000]\n"
+            "[3:180] -A INPUT -p tcp -m tcp --dport 22 -j ACCEPT\n"
+            "[7:420] -A INPUT -p tcp -m tcp --dport 23 -j ACCEPT\n"
+            "[0:0] -A INPUT -p tcp -m tcp --dport 25 -j DROP\n"
+            "[90:5400] -A INPUT -p tcp -m tcp --dport 443 -j ACCEPT\nCOMMIT\n"))
+        self.manager.rules = [
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "allow"},
+            {"rule_id": 2, "direction": "incoming", "protocol": "tcp", "port": 23, "action": "allow"},
+            {"rule_id": 3, "direction": "incoming", "protocol": "tcp", "port": 25, "action": "block"},
+            {"rule_id": 4, "direction": "incoming", "protocol": "tcp", "port": 443, "action": "allow"}
+        ]
+
+        self.assertEqual(self.manager.read_hit_counters(), [3, 7, 0, 90])
+        stats = self.manager.optimize_rules(use_counters=True)
+
+        mock_subprocess.assert_called_with("sudo iptables-save -c -t filter", shell=True, check=True,
+                                           capture_output=True, text=True)
+        self.assertEqual([(rule["rule_id"], rule["port"]) for rule in self.manager.rules],
+                         [(4, 443), (1, "22-23"), (3, 25)])
+        self.assertEqual((stats["merged"], stats["moved"]), (1, 1))
+
+    def test_ruleset_fingerprint_ignores_counters(self):
+        """
+        Test that the fingerprint ignores comments and counters but not rules.
+        """
+        first = ("# Generated by iptables-save on Mon\n*filter\n:INPUT ACCEPT [10:600]\n"
+                 "-A INPUT -p tcp -m tcp --dport 22 -j ACCEPT\nCOMMIT\n")
+        second = ("# Generated by iptables-save on Tue\n*filter\n:INPUT ACCEPT [99:9000]\n"
+                  "-A INPUT -p tcp -m tcp --dport 22 -j ACCEPT\nCOMMIT\n")
+
+        self.assertEqual(FirewallManager.ruleset_fingerprint(first), FirewallManager.ruleset_fingerprint(second))
+        self.assertNotEqual(FirewallManager.ruleset_fingerprint(first),
+                            FirewallManager.ruleset_fingerprint(first.replace("ACCEPT\nCOMMIT", "DROP\nCOMMIT")))
+
+        table = "table inet firewall_tester {\n\tchain input {\n\t\ttcp dport 22 counter packets %d bytes 60 accept\n"
+        self.assertEqual(FirewallManager.ruleset_fingerprint(first, table % 1),
+                         FirewallManager.ruleset_fingerprint(first, table % 7))
+        self.assertNotEqual(FirewallManager.ruleset_fingerprint(first),
+                            FirewallManager.ruleset_fingerprint(first, table % 1))
+        self.assertNotEqual(FirewallManager.ruleset_fingerprint(first, "", "backend=raw"),
+                            FirewallManager.ruleset_fingerprint(first, "", "backend=hping3"))
+
+    @patch("src.firewall_manager.subprocess.run")
+    def test_save_nft_table(self, mock_subprocess):
+        """
+        Test that the tester's nftables table is listed, and a missing table reads as empty.
+        """
+        mock_subprocess.return_value = MagicMock(stdout="table inet firewall_tester {\n}\n")
+        self.assertEqual(FirewallManager.save_nft_table(), "table inet firewall_tester {\n}\n")
+        mock_subprocess.assert_called_with("sudo nft list table inet firewall_tester", shell=True, check=True,
+                                           capture_output=True, text=True)
+
+        mock_subprocess.side_effect = subprocess.CalledProcessError(1, "nft")
+        self.assertEqual(FirewallManager.save_nft_table("fw-0"), "")
+
     def test_load_rules(self):
         """
         Test the _load_rules method to ensure it reads and parses the rules file correctly.
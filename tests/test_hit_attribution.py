@@ -0,0 +1,90 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import unittest
+from unittest.mock import patch
+from src.hit_attribution import HitAttribution
+
+RULES = [
+    {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "allow"},
+    {"rule_id": 2, "direction": "incoming", "protocol": "tcp", "port": "20-30", "action": "block"},
+    {"rule_id": 3, "direction": "outgoing", "protocol": "udp", "port": 53, "action": "block"}
+]
+
+def save_output(input_policy, counts, conntrack=0):
+    """Build 'iptables-save -c' output with the given [packets:bytes] per rule."""
+    lines = ["*filter", f":INPUT ACCEPT [{input_policy}:{input_policy * 60}]", ":OUTPUT ACCEPT [0:0]",
+             f"[{conntrack}:{conntrack * 60}] -A INPUT -m conntrack --ctstate ESTABLISHED -j ACCEPT"]
+    specs = ["-A INPUT -p tcp -m tcp --dport 22 -j ACCEPT", "-A INPUT -p tcp -m tcp --dport 20:30 -j DROP",
+             "-A OUTPUT -p udp -m udp --dport 53 -j DROP"]
+    lines += [f"[{packets}:{packets * 60}] {spec}" for packets, spec in zip(counts, specs)]
+    return "\n".join(lines + ["COMMIT"]) + "\n"
+
+def result(rule_id, protocol, port, direction):
+    return {"rule_id": rule_id, "protocol": protocol, "port": port, "direction": direction, "status": "fail"}
+
+class TestHitAttribution(unittest.TestCase):
+    @patch("src.hit_attribution.FirewallManager.save_live_ruleset")
+    def test_attribute(self, mock_save_live_ruleset):
+        """
+        Test that each probe is mapped to the first matching chain position with the counter deltas.
+        """
+        mock_save_live_ruleset.side_effect = [save_output(100, [5, 0, 7]), save_output(101, [6, 2, 8])]
+        attribution = HitAttribution(RULES)
+        attribution.begin()
+        results = attribution.attribute([result(1, "tcp", 22, "incoming"), result(2, "tcp", "25-30", "incoming"),
+                                         result(4, "tcp", 25, "incoming"), result(3, "udp", 53, "outgoing"),
+                                         result(5, "tcp", 80, "incoming")])
+
+        self.assertEqual(mock_save_live_ruleset.call_count, 2)
+        mock_save_live_ruleset.assert_called_with(None, counters=True)
+        self.assertEqual(results[0]["matched_rule"], {
+            "chain": "INPUT", "position": 2, "rule_id": 1, "action": "allow", "packets": 1, "bytes": 60,
+            "probes": 1, "summary": "INPUT #2 (rule 1): 1 packets, 60 bytes for 1 probes"})
+        self.assertEqual([results[i]["matched_rule"]["position"] for i in (1, 2)], [3, 3])
+        self.assertEqual((results[1]["matched_rule"]["packets"], results[1]["matched_rule"]["probes"]), (2, 2))
+        self.assertEqual(results[3]["matched_rule"]["summary"], "OUTPUT #1 (rule 3): 1 packets, 60 bytes for 1 probes")
+        self.assertEqual(results[4]["matched_rule"]["summary"], "INPUT policy: 1 packets, 60 bytes for 1 probes")
+        self.assertNotIn("ambiguous", results[0]["matched_rule"])
+
+    @patch("src.hit_attribution.FirewallManager.save_live_ruleset")
+    def test_unparsed_rule_hits_make_attribution_ambiguous(self, mock_save_live_ruleset):
+        """
+        Test that hits on a rule that cannot be evaluated ahead of the match are flagged.
+        """
+        mock_save_live_ruleset.side_effect = [save_output(0, [0, 0, 0]), save_output(0, [0, 0, 0], conntrack=3)]
+        attribution = HitAttribution(RULES)
+        attribution.begin()
+        results = attribution.attribute([result(1, "tcp", 22, "incoming"), result(3, "udp", 53, "outgoing")])
+
+        self.assertTrue(results[0]["matched_rule"]["ambiguous"])
+        self.assertNotIn("ambiguous", results[1]["matched_rule"])
+
+    @patch("src.hit_attribution.FirewallManager.save_live_ruleset")
+    def test_changed_ruleset_is_not_attributed(self, mock_save_live_ruleset):
+        """
+        Test that results are left alone when the ruleset changed during the batch.
+        """
+        mock_save_live_ruleset.side_effect = [save_output(0, [0, 0, 0]),
+                                              save_output(0, [0, 0, 0]).replace("--dport 22", "--dport 23")]
+        attribution = HitAttribution(RULES)
+        attribution.begin()
+        results = attribution.attribute([result(1, "tcp", 22, "incoming")])
+
+        self.assertNotIn("matched_rule", results[0])
+        with self.assertRaises(Exception):
+            attribution.attribute(results)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,224 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import random
+import time
+import unittest
+import numpy
+from src.load_generator import (
+    FILLER_PORTS, FILLER_SOURCE, LatencyHistogram, LoadGenerator, class_summary, filler_rules, flows_from_rules,
+    parse_mix, path_cost, sweep
+)
+from src.probe_engine import SOURCE_PORTS, RawProbeEngine, _PendingProbe
+from src.rule_compiler import CompiledPolicy
+
+class FakeEngine:
+    """Engine that answers every port but 23 after half a millisecond."""
+
+    def __init__(self):
+        self.pending = {}
+        self.sent = 0
+        self.started = False
+
+    def start(self):
+        self.started = True
+
+    def close(self):
+        pass
+
+    def send_probe(self, protocol, port):
+        pending = _PendingProbe()
+        pending.sent = time.monotonic()
+        self.sent += 1
+        key = (protocol, self.sent, port)
+        if port != 23:
+            pending.verdict = "blocked" if port == 25 else "allowed"
+            pending.received = pending.sent + 0.0005
+            pending.event.set()
+        self.pending[key] = pending
+        return key, pending
+
+    def release(self, key, pending):
+        del self.pending[key]
+
+class FakeManager:
+    """FirewallManager stand-in that records the chains it was asked to load."""
+
+    def __init__(self, rules, backend="iptables"):
+        self.rules = rules
+        self.backend = backend
+        self.loaded = []
+
+    def reset_firewall(self, batch=False):
+        raise AssertionError("The sweep must not flush the filter table")
+
+    def apply_all_rules(self, batch=False):
+        self.loaded.append(len(self.rules))
+
+    def load_tester_chains(self):
+        self.loaded.append(len(self.rules))
+
+    def remove_tester_chains(self):
+        self.loaded.append(0)
+
+class TestLoadGenerator(unittest.TestCase):
+    def test_histogram_percentiles(self):
+        """
+        Test that percentiles stay within the histogram's relative error.
+        """
+        rng = random.Random(0)
+        values = [rng.lognormvariate(6, 1.5) for _ in range(20000)]
+        histogram = LatencyHistogram()
+        for value in values:
+            histogram.record(value)
+        exact = numpy.array([int(value) for value in values])
+        for percentile in (50, 99, 99.9, 100):
+            expected = numpy.percentile(exact, percentile, method="inverted_cdf")
+            self.assertLessEqual(abs(histogram.percentile(percentile) - expected), expected * 1e-3)
+        self.assertEqual(histogram.summary()["count"], 20000)
+
+    def test_histogram_merge(self):
+        """
+        Test merging histograms and summarizing an empty one.
+        """
+        first, second = LatencyHistogram(), LatencyHistogram()
+        self.assertIsNone(first.summary()["p50_ms"])
+        for value in (100, 200, 300):
+            first.record(value)
+        second.record(5_000_000)
+        first.merge(second)
+        self.assertEqual((first.count, first.min, first.max), (4, 100, 5_000_000))
+        self.assertEqual(first.percentile(50), 200)
+        with self.assertRaises(ValueError):
+            first.merge(LatencyHistogram(significant_figures=2))
+
+    def test_parse_mix(self):
+        """
+        Test that a traffic mix shares the total rate out by weight.
+        """
+        flows = parse_mix("tcp:80=3,udp:53=1,icmp=0", 400)
+        self.assertEqual([(flow["name"], flow["rate"]) for flow in flows], [("tcp:80", 300), ("udp:53", 100)])
+        with self.assertRaises(ValueError):
+            parse_mix("sctp:80=1", 100)
+
+    def test_flows_from_rules(self):
+        """
+        Test one flow per rule at its lowest port, classed by protocol, direction and action.
+        """
+        flows = flows_from_rules([{"rule_id": 7, "direction": "incoming", "protocol": "tcp",
+                                   "port": "1000-2000", "action": "allow"}], 50)
+        self.assertEqual(flows, [{"name": "rule 7", "class": "tcp/incoming/allow", "protocol": "tcp",
+                                  "port": 1000, "rate": 50}])
+
+    def test_run_paces_and_accounts(self):
+        """
+        Test that flows are sent at their rates and loss, rejections and latency are recorded per flow.
+        """
+        engine = FakeEngine()
+        generator = LoadGenerator(engine, timeout=0.05)
+        flows = parse_mix("tcp:22=2,tcp:23=1,tcp:25=1", 800)
+        results = generator.run(flows, 0.5)
+
+        sent = [result["sent"] for result in results]
+        self.assertTrue(190 <= sent[0] <= 201 and 95 <= sent[1] <= 101 and 95 <= sent[2] <= 101, sent)
+        self.assertEqual([result["loss"] for result in results], [0.0, 1.0, 0.0])
+        self.assertEqual(results[2]["rejected"], results[2]["sent"])
+        self.assertAlmostEqual(results[0]["latency"]["p50_ms"], 0.5, delta=0.01)
+        self.assertIsNone(results[1]["latency"]["p99_ms"])
+        self.assertEqual(engine.pending, {})
+
+        (tcp,) = class_summary(results)
+        self.assertEqual((tcp["flows"], tcp["sent"]), (3, sum(sent)))
+        self.assertAlmostEqual(tcp["loss"], sent[1] / sum(sent), places=3)
+
+    def test_run_rejects_more_outstanding_packets_than_source_ports(self):
+        """
+        Test that a rate that would run out of source ports within the timeout is rejected.
+        """
+        engine = FakeEngine()
+        generator = LoadGenerator(engine, timeout=2.0)
+        with self.assertRaises(ValueError):
+            generator.run(parse_mix("tcp:22=1,udp:53=1", 2 * 2 * len(SOURCE_PORTS)), 0.1)
+        self.assertEqual(engine.sent, 0)
+
+    def test_filler_rules(self):
+        """
+        Test that filler rules avoid the flows' ports and the probes' source ports.
+        """
+        flows = parse_mix("tcp:1=1,udp:2=1,icmp=1", 30)
+        fillers = filler_rules(6, flows)
+        self.assertEqual([(rule["protocol"], rule["port"]) for rule in fillers],
+                         [("tcp", 3), ("udp", 3), ("tcp", 4), ("udp", 4), ("tcp", 5), ("udp", 5)])
+        self.assertLess(max(FILLER_PORTS), min(SOURCE_PORTS))
+        with self.assertRaises(ValueError):
+            filler_rules(2 * len(FILLER_PORTS), flows)
+
+    def test_filler_rules_accept_nothing_the_rules_block(self):
+        """
+        Test that filler rules ahead of the real rules never let a blocked port through.
+        """
+        rules = [{"rule_id": "1", "direction": "incoming", "protocol": "tcp", "port": 443, "action": "allow"},
+                 {"rule_id": "2", "direction": "incoming", "protocol": "tcp", "port": "1-1000", "action": "block"},
+                 {"rule_id": "3", "direction": "incoming", "protocol": "udp", "port": 53, "action": "block"}]
+        fillers = filler_rules(200, flows_from_rules(rules, 30))
+        self.assertTrue(all(rule["source"] == FILLER_SOURCE and rule["action"] != "allow" for rule in fillers))
+        for default_action in ("allow", "block"):
+            alone = CompiledPolicy(rules, default_action, source="127.0.0.1", destination="127.0.0.1")
+            padded = CompiledPolicy(fillers + rules, default_action, source="127.0.0.1", destination="127.0.0.1")
+            numpy.testing.assert_array_equal(padded.verdicts, alone.verdicts)
+
+    def test_sweep(self):
+        """
+        Test that the sweep grows the tester's chain ahead of the rules and removes it afterwards.
+        """
+        rules = [{"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "allow"}]
+        manager = FakeManager(rules)
+        points = sweep(manager, LoadGenerator(FakeEngine(), timeout=0.05), parse_mix("tcp:22=1", 200),
+                       [0, 10, 100], 0.05)
+
+        self.assertEqual([point["chain_rules"] for point in points], [1, 11, 101])
+        self.assertEqual(manager.loaded, [1, 11, 101, 0])
+        self.assertIs(manager.rules, rules)
+        self.assertEqual(points[1]["classes"][0]["class"], "tcp")
+
+        # nftables replaces only the tester's table and leaves the rules in it
+        manager = FakeManager(rules, backend="nftables")
+        sweep(manager, LoadGenerator(FakeEngine(), timeout=0.05), parse_mix("tcp:22=1", 200), [0, 10], 0.05)
+        self.assertEqual(manager.loaded, [1, 11, 1])
+
+    def test_path_cost(self):
+        """
+        Test the per-rule cost fitted from latency against chain length.
+        """
+        points = [{"chain_rules": chain, "classes": [{"class": "tcp", "latency": {
+            "p50_ms": 0.05 + chain * 0.0001, "p99_ms": 0.2 + chain * 0.0003}}]} for chain in (0, 1000, 2000)]
+        self.assertEqual(path_cost(points), {"tcp": {"p50_us_per_rule": 0.1, "p99_us_per_rule": 0.3}})
+        self.assertEqual(path_cost(points[:1]), {})
+
+    def test_live_loopback(self):
+        """
+        Test a short ICMP load run on loopback, where every echo is answered.
+        """
+        generator = LoadGenerator(RawProbeEngine(timeout=0.5))
+        try:
+            results = generator.run(parse_mix("icmp=1", 200), 0.2)
+        except Exception as e:
+            self.skipTest(f"Raw sockets are not available: {e}")
+        finally:
+            generator.close()
+        self.assertEqual(results[0]["loss"], 0.0)
+        self.assertEqual(results[0]["latency"]["count"], results[0]["sent"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import json
+import logging
+import os
+import tempfile
+import unittest
+from src.logger import setup_logger, shutdown_logging
+
+class TestLogger(unittest.TestCase):
+    def setUp(self):
+        """Create a temporary directory for log files."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.log_file = os.path.join(self.tmpdir.name, "logs", "test.log")
+
+    def tearDown(self):
+        shutdown_logging()
+        self.tmpdir.cleanup()
+
+    def read_lines(self, path: str):
+        with open(path) as file:
+            return file.read().splitlines()
+
+    def test_setup_logger_is_idempotent(self):
+        """
+        Test that repeated setup for one name adds no extra handlers or duplicate lines.
+        """
+        first = setup_logger("TestLoggerIdempotent", self.log_file)
+        second = setup_logger("TestLoggerIdempotent", self.log_file)
+
+        self.assertIs(first, second)
+        self.assertEqual(len(first.handlers), 1)
+
+        first.info("only once")
+        shutdown_logging()
+
+        lines = self.read_lines(self.log_file)
+        self.assertEqual(len(lines), 1)
+        self.assertTrue(lines[0].endswith("INFO - only once"))
+        self.assertEqual(first.handlers, [])
+
+    def test_loggers_share_one_file(self):
+        """
+        Test that several loggers writing to the same file share one writer.
+        """
+        setup_logger("TestLoggerSharedA", self.log_file).info("from a")
+        setup_logger("TestLoggerSharedB", self.log_file).info("from b")
+        shutdown_logging()
+
+        self.assertEqual(len(self.read_lines(self.log_file)), 2)
+
+    def test_json_format(self):
+        """
+        Test the structured JSON Lines format.
+        """
+        logger = setup_logger("TestLoggerJson", self.log_file, json_format=True)
+        logger.warning("Rule %s is %s", 2, "shadowed")
+        shutdown_logging()
+
+        entry = json.loads(self.read_lines(self.log_file)[0])
+        self.assertEqual(entry["level"], "WARNING")
+        self.assertEqual(entry["logger"], "TestLoggerJson")
+        self.assertEqual(entry["message"], "Rule 2 is shadowed")
+
+    def test_rotation(self):
+        """
+        Test that the log file rotates once it reaches max_bytes.
+        """
+        logger = setup_logger("TestLoggerRotation", self.log_file, max_bytes=200, backup_count=2)
+        for i in range(20):
+            logger.info(f"Rule {i} validation: pass")
+        shutdown_logging()
+
+        self.assertTrue(os.path.exists(self.log_file + ".1"))
+        self.assertLessEqual(os.path.getsize(self.log_file), 200)
+
+    def test_level(self):
+        """
+        Test that records below the configured level are dropped.
+        """
+        logger = setup_logger("TestLoggerLevel", self.log_file, level=logging.WARNING)
+        logger.info("dropped")
+        logger.error("kept")
+        shutdown_logging()
+
+        self.assertEqual(len(self.read_lines(self.log_file)), 1)
+
+if __name__ == "__main__":
+    unittest.main()
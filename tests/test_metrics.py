@@ -0,0 +1,97 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+from src import metrics
+from src.firewall_manager import FirewallManager
+from src.traffic_simulator import TrafficSimulator
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def tearDown(self):
+        metrics.reset()
+
+    def test_span_and_counter(self):
+        """Spans accumulate count, total and max; counters add up."""
+        metrics.record_span("phase", 0.5)
+        metrics.record_span("phase", 1.5)
+        with metrics.span("other"):
+            pass
+        metrics.increment("probes_sent")
+        metrics.increment("probes_sent", 2)
+
+        data = metrics.snapshot()
+        self.assertEqual(data["spans"]["phase"], {"count": 2, "total_seconds": 2.0, "max_seconds": 1.5})
+        self.assertEqual(data["spans"]["other"]["count"], 1)
+        self.assertEqual(data["counters"], {"probes_sent": 3})
+        self.assertIn("probes_sent", metrics.format_summary())
+
+    def test_prometheus_format(self):
+        """Spans are labelled series; counters get a _total suffix."""
+        metrics.record_span("rules.load", 0.25)
+        metrics.increment("rules_applied", 4)
+        text = metrics.format_prometheus()
+        self.assertIn('firewall_tester_span_seconds_total{span="rules.load"} 0.25', text)
+        self.assertIn('firewall_tester_span_calls_total{span="rules.load"} 1', text)
+        self.assertIn("# TYPE firewall_tester_rules_applied_total counter", text)
+        self.assertIn("firewall_tester_rules_applied_total 4", text)
+
+    def test_write_metrics(self):
+        """The format follows the file extension."""
+        metrics.increment("bytes_written", 10)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            json_path = os.path.join(tmpdir, "metrics.json")
+            prom_path = os.path.join(tmpdir, "textfile", "metrics.prom")
+            metrics.write_metrics(json_path)
+            metrics.write_metrics(prom_path)
+            with open(json_path) as file:
+                self.assertEqual(json.load(file)["counters"], {"bytes_written": 10})
+            with open(prom_path) as file:
+                self.assertIn("firewall_tester_bytes_written_total 10", file.read())
+            self.assertEqual(sorted(os.listdir(tmpdir)), ["metrics.json", "textfile"])
+
+    @patch("src.firewall_manager.subprocess.run")
+    def test_firewall_manager_instrumentation(self, mock_subprocess):
+        """Applying rules counts subprocesses and rules and times iptables calls."""
+        mock_subprocess.return_value = MagicMock()
+        manager = FirewallManager("rules/sample_rules.json")
+        manager.apply_all_rules()
+        manager.apply_all_rules(batch=True)
+
+        data = metrics.snapshot()
+        rules = len(manager.rules)
+        self.assertEqual(data["counters"]["rules_applied"], 2 * rules)
+        self.assertEqual(data["counters"]["subprocesses_spawned"], rules + 1)
+        self.assertEqual(data["spans"]["iptables.command"]["count"], rules)
+        self.assertEqual(data["spans"]["iptables.restore"]["count"], 1)
+        self.assertEqual(data["spans"]["rules.load"]["count"], 1)
+
+    @patch("src.traffic_simulator.subprocess.run")
+    def test_traffic_simulator_instrumentation(self, mock_subprocess):
+        """Each hping3 probe is counted and timed."""
+        mock_subprocess.return_value = MagicMock(stdout="flags=SA", stderr="")
+        TrafficSimulator().simulate_traffic("tcp", 22, "incoming")
+
+        data = metrics.snapshot()
+        self.assertEqual(data["counters"], {"probes_sent": 1, "subprocesses_spawned": 1})
+        self.assertEqual(data["spans"]["probe.hping3"]["count"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
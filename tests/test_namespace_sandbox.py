@@ -0,0 +1,72 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import subprocess
+import unittest
+from unittest.mock import patch, MagicMock
+from src.namespace_sandbox import NamespaceSandbox
+
+class TestNamespaceSandbox(unittest.TestCase):
+    @patch("src.namespace_sandbox.FirewallManager")
+    @patch("src.namespace_sandbox.subprocess.run")
+    def test_create_and_destroy(self, mock_subprocess, mock_manager_class):
+        """Each shard gets a linked namespace pair with the rules loaded into the firewall side."""
+        mock_subprocess.return_value = MagicMock()
+        manager = mock_manager_class.return_value
+        loaded_into = []
+        manager.apply_all_rules.side_effect = lambda batch: loaded_into.append(manager.netns)
+
+        with NamespaceSandbox(2, prefix="fwt") as sandbox:
+            shards = sandbox.create("rules/sample_rules.json")
+            self.assertEqual([shard["firewall"] for shard in shards], ["fwt-0", "fwt-1"])
+            self.assertEqual(loaded_into, ["fwt-0", "fwt-1"])
+            self.assertEqual(NamespaceSandbox.routes(shards[1]), {
+                "incoming": ("fwt-1-client", "10.200.1.1"),
+                "outgoing": ("fwt-1", "10.200.1.2")
+            })
+
+        commands = [call.args[0] for call in mock_subprocess.call_args_list]
+        self.assertIn("sudo ip link add fwt0 netns fwt-0 type veth peer name fwt0 netns fwt-0-client", commands)
+        self.assertIn("sudo ip -n fwt-1 addr add 10.200.1.1/30 dev fwt0", commands)
+        self.assertEqual(commands[-4:], ["sudo ip netns del fwt-0", "sudo ip netns del fwt-0-client",
+                                         "sudo ip netns del fwt-1", "sudo ip netns del fwt-1-client"])
+        self.assertEqual(sandbox.shards, [])
+
+    @patch("src.namespace_sandbox.FirewallManager")
+    @patch("src.namespace_sandbox.subprocess.run")
+    def test_create_failure_cleans_up(self, mock_subprocess, mock_manager_class):
+        """A failed setup step removes the namespaces created so far."""
+        def run(command, **kwargs):
+            if command.startswith("sudo ip link add"):
+                raise subprocess.CalledProcessError(2, command)
+            return MagicMock()
+        mock_subprocess.side_effect = run
+
+        sandbox = NamespaceSandbox(2, prefix="fwt")
+        with self.assertRaises(Exception):
+            sandbox.create("rules/sample_rules.json")
+
+        commands = [call.args[0] for call in mock_subprocess.call_args_list]
+        self.assertEqual(commands[-2:], ["sudo ip netns del fwt-0", "sudo ip netns del fwt-0-client"])
+        self.assertEqual(sandbox.shards, [])
+
+    def test_invalid_count(self):
+        """The count must fit the 10.200.x.0/30 address plan."""
+        with self.assertRaises(ValueError):
+            NamespaceSandbox(0)
+        with self.assertRaises(ValueError):
+            NamespaceSandbox(257)
+
+if __name__ == "__main__":
+    unittest.main()
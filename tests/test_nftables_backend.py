@@ -0,0 +1,69 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import unittest
+from src.nftables_backend import build_ruleset, build_statement
+
+class TestNftablesBackend(unittest.TestCase):
+    def test_build_statement(self):
+        """Addresses, port ranges and ICMP map to nftables matches."""
+        self.assertEqual(build_statement({"direction": "incoming", "protocol": "tcp", "port": "1000:2000",
+                                          "action": "allow", "source": "10.0.0.0/8"}),
+                         "ip saddr 10.0.0.0/8 tcp dport 1000-2000 accept")
+        self.assertEqual(build_statement({"direction": "outgoing", "protocol": "udp", "port": 53,
+                                          "action": "block", "destination": "2001:db8::/32"}),
+                         "ip6 daddr 2001:db8::/32 udp dport 53 drop")
+        self.assertEqual(build_statement({"direction": "incoming", "protocol": "icmp", "port": 0,
+                                          "action": "block"}),
+                         "meta l4proto icmp drop")
+
+    def test_verdict_maps_keep_first_match(self):
+        """Overlapping rules resolve to disjoint intervals with the first rule's verdict."""
+        rules = [
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 1500, "action": "block"},
+            {"rule_id": 2, "direction": "incoming", "protocol": "tcp", "port": "1000-2000", "action": "allow"},
+            {"rule_id": 3, "direction": "incoming", "protocol": "tcp", "port": "1800-2500", "action": "block"},
+            {"rule_id": 4, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "allow"},
+            {"rule_id": 5, "direction": "incoming", "protocol": "tcp", "port": 23, "action": "allow"}
+        ]
+        ruleset = build_ruleset(rules)
+        self.assertIn("elements = { 22-23 : accept, 1000-1499 : accept, 1500 : drop, "
+                      "1501-2000 : accept, 2001-2500 : drop }", ruleset)
+        self.assertEqual(ruleset.count("tcp dport vmap @"), 1)
+
+    def test_address_rules_split_lookups(self):
+        """A rule with addresses stays an ordered statement between two map lookups."""
+        rules = [
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 80, "action": "allow"},
+            {"rule_id": 2, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "block",
+             "source": "10.0.0.0/8"},
+            {"rule_id": 3, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "allow"},
+            {"rule_id": 4, "direction": "outgoing", "protocol": "udp", "port": 53, "action": "block"}
+        ]
+        lines = [line.strip() for line in build_ruleset(rules).splitlines()]
+        self.assertEqual(lines[:3], ["add table inet firewall_tester", "delete table inet firewall_tester",
+                                     "table inet firewall_tester {"])
+        input_chain = lines[lines.index("chain input {") + 2:lines.index("chain output {") - 1]
+        self.assertEqual(input_chain, ["tcp dport vmap @input_tcp_1", "ip saddr 10.0.0.0/8 tcp dport 22 drop",
+                                       "tcp dport vmap @input_tcp_2"])
+        self.assertIn("udp dport vmap @output_udp_3", lines)
+
+    def test_empty_ruleset(self):
+        """No rules still produce valid, empty chains."""
+        ruleset = build_ruleset([])
+        self.assertNotIn("map ", ruleset)
+        self.assertIn("type filter hook input priority 0; policy accept;", ruleset)
+
+if __name__ == "__main__":
+    unittest.main()
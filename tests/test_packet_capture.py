@@ -0,0 +1,181 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import socket
+import struct
+import threading
+import time
+import unittest
+from unittest.mock import patch
+from src.packet_capture import (
+    BLOCK_STATUS_OFFSET, FRAME_HEADER, TP_STATUS_KERNEL, TP_STATUS_USER, PacketCapture, build_filter
+)
+from src.probe_engine import RawProbeEngine, build_icmp_echo, build_tcp_syn, build_udp
+
+def ip_packet(protocol: int, payload: bytes, src: str = "127.0.0.1", dst: str = "127.0.0.1") -> bytes:
+    """Build an IPv4 packet around a transport payload."""
+    return struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(payload), 0, 0, 64, protocol, 0,
+                       socket.inet_aton(src), socket.inet_aton(dst)) + payload
+
+def tcp_segment(sport: int, dport: int, seq: int, ack: int, flags: int) -> bytes:
+    """Build a TCP header with the given flags."""
+    return struct.pack("!HHLLBBHHH", sport, dport, seq, ack, 0x50, flags, 0, 0, 0)
+
+def run_filter(program, packet: bytes) -> int:
+    """Interpret the classic BPF instructions build_filter emits."""
+    accumulator, pc = 0, 0
+    while True:
+        code, jt, jf, k = program[pc]
+        if code == 0x30:
+            accumulator = packet[k]
+        elif code == 0x20:
+            accumulator = struct.unpack_from("!I", packet, k)[0]
+        elif code == 0x15:
+            pc += jt if accumulator == k else jf
+        elif code == 0x06:
+            return k
+        pc += 1
+
+def ring_block(packets, block_size: int = 4096) -> bytearray:
+    """Lay packets out in a TPACKET_V3 block handed over to user space."""
+    ring = bytearray(block_size)
+    first = 48
+    struct.pack_into("=III", ring, BLOCK_STATUS_OFFSET, TP_STATUS_USER, len(packets), first)
+    position = first
+    for index, (timestamp, packet) in enumerate(packets):
+        frame_size = 80 + len(packet) + (-len(packet) % 16)
+        next_offset = frame_size if index < len(packets) - 1 else 0
+        FRAME_HEADER.pack_into(ring, position, next_offset, int(timestamp), int(timestamp % 1 * 1e9),
+                               len(packet), len(packet), 0, 80, 80)
+        ring[position + 80:position + 80 + len(packet)] = packet
+        position += frame_size
+    return ring
+
+class TestPacketCapture(unittest.TestCase):
+    def test_filter(self):
+        """
+        Test that the BPF program keeps TCP, UDP and ICMP to or from the target only.
+        """
+        program = build_filter("10.0.0.1", 128)
+        self.assertEqual(run_filter(program, ip_packet(6, b"", "10.0.0.2", "10.0.0.1")), 128)
+        self.assertEqual(run_filter(program, ip_packet(17, b"", "10.0.0.1", "10.0.0.2")), 128)
+        self.assertEqual(run_filter(program, ip_packet(1, b"", "10.0.0.1", "10.0.0.1")), 128)
+        self.assertEqual(run_filter(program, ip_packet(6, b"", "10.0.0.2", "10.0.0.3")), 0)
+        self.assertEqual(run_filter(program, ip_packet(47, b"", "10.0.0.2", "10.0.0.1")), 0)
+
+    def test_tcp_probe_evidence(self):
+        """
+        Test that a SYN and the SYN-ACK acknowledging its sequence number are attributed
+        to the probe, while a reply acknowledging another sequence number is not.
+        """
+        capture = PacketCapture()
+        watch = capture.watch("tcp", 40000, 22, seq=1000)
+        ring = ring_block([
+            (10.0, ip_packet(6, build_tcp_syn("127.0.0.1", "127.0.0.1", 40000, 22, 1000))),
+            (10.001, ip_packet(6, tcp_segment(22, 40000, 5, 999, 0x12))),
+            (10.002, ip_packet(6, tcp_segment(22, 40000, 5, 1001, 0x12))),
+        ])
+
+        self.assertTrue(capture._read_block(ring, 0))
+        self.assertEqual(struct.unpack_from("=I", ring, BLOCK_STATUS_OFFSET)[0], TP_STATUS_KERNEL)
+        self.assertFalse(capture._read_block(ring, 0))
+
+        evidence = capture.finish(watch, replied=True)
+        self.assertEqual((evidence["egress"], evidence["reply"], evidence["packets"]), (True, "syn-ack", 2))
+        self.assertAlmostEqual(evidence["rtt_ms"], 2.0, places=2)
+        self.assertIn("syn-ack reply captured", evidence["summary"])
+        self.assertEqual(capture._watches, {})
+
+    def test_wildcard_and_icmp_unreachable(self):
+        """
+        Test that a probe with an unknown source port matches on its destination port,
+        and an ICMP unreachable quoting it is recorded as its reply.
+        """
+        capture = PacketCapture()
+        udp_watch = capture.watch("udp", dport=53)
+        silent_watch = capture.watch("icmp")
+        probe = ip_packet(17, build_udp("127.0.0.1", "127.0.0.1", 51000, 53))
+        unreachable = ip_packet(1, struct.pack("!BBHI", 3, 13, 0, 0) + probe[:28])
+        capture._read_block(ring_block([(1.0, probe), (1.5, unreachable)]), 0)
+
+        evidence = capture.finish(udp_watch, replied=True)
+        self.assertEqual(evidence["reply"], "icmp-unreachable/13")
+        self.assertEqual(evidence["rtt_ms"], 500.0)
+
+        capture.settle = 0
+        evidence = capture.finish(silent_watch, replied=False)
+        self.assertEqual((evidence["egress"], evidence["reply"]), (False, None))
+        self.assertEqual(evidence["summary"], "probe not captured leaving")
+
+    def test_icmp_echo(self):
+        """
+        Test that an echo request and reply are matched by identifier and sequence number.
+        """
+        capture = PacketCapture()
+        watch = capture.watch("icmp", 7, 9)
+        reply = bytearray(build_icmp_echo(7, 9))
+        reply[0] = 0
+        capture._read_block(ring_block([(1.0, ip_packet(1, build_icmp_echo(7, 9))),
+                                        (1.25, ip_packet(1, bytes(reply)))]), 0)
+        evidence = capture.finish(watch, replied=True)
+        self.assertEqual((evidence["egress"], evidence["reply"], evidence["rtt_ms"]), (True, "echo", 250.0))
+
+    @patch("src.packet_capture.mmap.mmap")
+    @patch("src.packet_capture.socket.socket")
+    def test_concurrent_start_opens_one_capture(self, mock_socket, mock_mmap):
+        """
+        Test that probing threads starting the capture together share one socket, ring and reader.
+        """
+        capture = PacketCapture()
+        stop = threading.Event()
+        with patch.object(PacketCapture, "_attach_filter", side_effect=lambda sock: time.sleep(0.05)), \
+                patch.object(PacketCapture, "_drain"), \
+                patch.object(PacketCapture, "_read_loop", side_effect=lambda: stop.wait(5)):
+            threads = [threading.Thread(target=capture.start) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            stop.set()
+            capture.close()
+
+        mock_socket.assert_called_once()
+        mock_mmap.assert_called_once()
+        mock_mmap.return_value.close.assert_called_once()
+        mock_socket.return_value.close.assert_called_once()
+
+    def test_live_loopback(self):
+        """
+        Test capturing raw engine probes on loopback, where the kernel answers a
+        closed TCP port with a RST.
+        """
+        try:
+            capture = PacketCapture()
+            capture.start()
+        except Exception as e:
+            self.skipTest(f"Packet capture is not available: {e}")
+        engine = RawProbeEngine(timeout=0.5, capture=capture)
+        try:
+            evidence = {}
+            engine.probe("tcp", 9, "incoming", evidence)
+        except Exception as e:
+            self.skipTest(f"Raw sockets are not available: {e}")
+        finally:
+            engine.close()
+            capture.close()
+        self.assertTrue(evidence["egress"])
+        self.assertIn(evidence["reply"], ("rst", "syn-ack"))
+
+if __name__ == "__main__":
+    unittest.main()
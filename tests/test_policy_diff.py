@@ -0,0 +1,103 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import random
+import unittest
+from unittest.mock import MagicMock
+import numpy as np
+from src.policy_diff import compile_intervals, confirm_changes, diff_policies, format_change
+from src.rule_compiler import DIRECTIONS, PROTOCOLS, CompiledPolicy
+
+def tcp(rule_id, port, action="allow", **fields):
+    return dict({"rule_id": rule_id, "direction": "incoming", "protocol": "tcp", "port": port, "action": action}, **fields)
+
+def random_rules(generator, count):
+    return [{"rule_id": rule_id, "direction": generator.choice(DIRECTIONS), "protocol": generator.choice(PROTOCOLS),
+             "port": generator.choice([low, f"{low}-{low + generator.randint(0, 5000)}"]),
+             "action": generator.choice(["allow", "block"])}
+            for rule_id, low in ((rule_id, generator.randint(0, 60000)) for rule_id in range(1, count + 1))]
+
+class TestPolicyDiff(unittest.TestCase):
+    def test_compile_intervals(self):
+        """
+        Test that first-match verdicts are compiled into disjoint intervals covering every port.
+        """
+        intervals = compile_intervals([tcp(1, "80-90", "block"), tcp(2, "85-100"), tcp(3, 95, "block")],
+                                      "incoming", "tcp", default_action="block")
+        self.assertEqual(intervals, [(0, 79, "block", "default"), (80, 90, "block", 1), (91, 100, "allow", 2),
+                                     (101, 65535, "block", "default")])
+        self.assertEqual(compile_intervals([], "incoming", "udp"), [(0, 65535, "allow", "default")])
+
+    def test_diff_policies(self):
+        """
+        Test that changed ranges are reported with the rules deciding them before and after.
+        """
+        old = [tcp(1, 22), tcp(2, "1-1024", "block")]
+        new = [tcp(1, 22), tcp(5, 443), tcp(2, "1-2048", "block")]
+
+        changes = diff_policies(old, new)
+
+        self.assertEqual([format_change(change) for change in changes], [
+            "incoming tcp 443: block -> allow (rules 2 -> 5)",
+            "incoming tcp 1025-2048: allow -> block (rules default -> 2)"])
+        self.assertEqual((changes[1]["low"], changes[1]["high"]), (1025, 2048))
+        self.assertEqual(diff_policies(old, [dict(rule) for rule in old]), [])
+
+    def test_changes_limited_to_address_classes(self):
+        """
+        Test that a change holding for only some source addresses names their range.
+        """
+        old = [tcp(1, 53, "block", source="10.0.0.0/8")]
+        changes = diff_policies(old, [])
+
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(changes[0]["source"], "10.0.0.0-10.255.255.255")
+        self.assertNotIn("destination", changes[0])
+        self.assertEqual(diff_policies(old, [], source="192.168.0.1", destination="127.0.0.1"), [])
+
+    def test_random_policies_match_dense_evaluation(self):
+        """
+        Test that the interval sweep finds exactly the ports where dense per-port evaluation differs.
+        """
+        generator = random.Random(11)
+        for _ in range(20):
+            old = random_rules(generator, 40)
+            new = [dict(rule) for rule in old[:30]] + random_rules(generator, 10)
+            for rule in generator.sample(new, 5):
+                rule["action"] = "allow" if rule["action"] == "block" else "block"
+
+            changed = np.zeros((len(DIRECTIONS), len(PROTOCOLS), 65536), dtype=bool)
+            for change in diff_policies(old, new):
+                changed[DIRECTIONS.index(change["direction"]), PROTOCOLS.index(change["protocol"]),
+                        change["low"]:change["high"] + 1] = True
+            expected = CompiledPolicy(old).verdicts != CompiledPolicy(new).verdicts
+            self.assertTrue(np.array_equal(changed, expected))
+
+    def test_confirm_changes(self):
+        """
+        Test that only the ends of changed ranges are probed and compared with the new verdict.
+        """
+        changes = diff_policies([tcp(1, "1000-2000", "block"), tcp(2, 22, "block")], [])
+        simulator = MagicMock()
+        simulator.simulate_batch.return_value = ["allowed", "allowed", "blocked"]
+
+        confirm_changes(changes, simulator)
+
+        simulator.simulate_batch.assert_called_once_with([("tcp", 22, "incoming"), ("tcp", 1000, "incoming"),
+                                                          ("tcp", 2000, "incoming")])
+        self.assertEqual([change["status"] for change in changes], ["confirmed", "unconfirmed"])
+        self.assertEqual(changes[1]["observed"], {1000: "allowed", 2000: "blocked"})
+
+if __name__ == "__main__":
+    unittest.main()
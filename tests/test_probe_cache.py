@@ -0,0 +1,76 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+from src.probe_cache import ProbeCache
+
+class TestProbeCache(unittest.TestCase):
+    def setUp(self):
+        """Open a cache in a temporary directory."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "cache", "probes.sqlite3")
+        self.cache = ProbeCache(self.path, ttl=60, max_entries=2, commit_every=1)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmpdir.cleanup()
+
+    def test_hit_and_miss(self):
+        """
+        Test that results are keyed on the flow and the firewall state.
+        """
+        self.cache.put("tcp", 22, "incoming", "state-a", "allowed")
+
+        self.assertEqual(self.cache.get("tcp", 22, "incoming", "state-a"), "allowed")
+        self.assertIsNone(self.cache.get("tcp", 22, "incoming", "state-b"))
+        self.assertIsNone(self.cache.get("udp", 22, "incoming", "state-a"))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+    def test_persistence(self):
+        """
+        Test that results survive reopening the database.
+        """
+        self.cache.put("tcp", 22, "incoming", "state-a", "blocked")
+        self.cache.close()
+
+        self.cache = ProbeCache(self.path, ttl=60)
+        self.assertEqual(self.cache.get("tcp", 22, "incoming", "state-a"), "blocked")
+
+    def test_ttl_expiry(self):
+        """
+        Test that results older than the TTL are not returned.
+        """
+        with patch("src.probe_cache.time.time", return_value=1000.0):
+            self.cache.put("tcp", 22, "incoming", "state-a", "allowed")
+        with patch("src.probe_cache.time.time", return_value=1061.0):
+            self.assertIsNone(self.cache.get("tcp", 22, "incoming", "state-a"))
+
+    def test_size_eviction(self):
+        """
+        Test that the oldest results are evicted beyond max_entries.
+        """
+        now = time.time()
+        for offset, port in enumerate((22, 80, 443)):
+            with patch("src.probe_cache.time.time", return_value=now - 10 + offset):
+                self.cache.put("tcp", port, "incoming", "state-a", "allowed")
+
+        self.assertIsNone(self.cache.get("tcp", 22, "incoming", "state-a"))
+        self.assertEqual(self.cache.get("tcp", 443, "incoming", "state-a"), "allowed")
+
+if __name__ == "__main__":
+    unittest.main()
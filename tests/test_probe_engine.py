@@ -0,0 +1,144 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import socket
+import struct
+import time
+import unittest
+from collections import deque
+from unittest.mock import MagicMock, patch
+from src.adaptive_timeout import AdaptiveTimeout
+from src.probe_engine import (
+    RawProbeEngine, checksum, build_tcp_syn, build_udp, build_icmp_echo, parse_reply
+)
+
+def ip_header(protocol: int, src: str = "127.0.0.1", dst: str = "127.0.0.1") -> bytes:
+    """Build a minimal IPv4 header for test packets."""
+    return struct.pack("!BBHHHBBH4s4s", 0x45, 0, 0, 0, 0, 64, protocol, 0,
+                       socket.inet_aton(src), socket.inet_aton(dst))
+
+class TestProbeEngine(unittest.TestCase):
+    def test_checksum(self):
+        """
+        Test the Internet checksum against a known value and its self-check property.
+        """
+        self.assertEqual(checksum(b"\x00\x01\xf2\x03\xf4\xf5\xf6\xf7"), 0x220D)
+        message = build_icmp_echo(0x1234, 1)
+        self.assertEqual(checksum(message), 0)
+
+    def test_build_tcp_syn(self):
+        """
+        Test that the SYN segment carries the ports, flags and a valid checksum.
+        """
+        segment = build_tcp_syn("127.0.0.1", "127.0.0.1", 40000, 22, 12345)
+        sport, dport, seq, _, offset, flags = struct.unpack("!HHLLBB", segment[:14])
+        self.assertEqual((sport, dport, seq, offset >> 4, flags), (40000, 22, 12345, 5, 0x02))
+
+        pseudo = struct.pack("!4s4sBBH", socket.inet_aton("127.0.0.1"), socket.inet_aton("127.0.0.1"),
+                             0, socket.IPPROTO_TCP, len(segment))
+        self.assertEqual(checksum(pseudo + segment), 0)
+
+    def test_parse_reply_tcp(self):
+        """
+        Test that SYN-ACK and RST replies are matched to the probe as allowed,
+        while a bare SYN (our own probe seen on loopback) is ignored.
+        """
+        syn_ack = ip_header(socket.IPPROTO_TCP) + struct.pack("!HHLLBBHHH", 22, 40000, 1, 2, 0x50, 0x12, 0, 0, 0)
+        rst = ip_header(socket.IPPROTO_TCP) + struct.pack("!HHLLBBHHH", 23, 40001, 0, 2, 0x50, 0x14, 0, 0, 0)
+        syn = ip_header(socket.IPPROTO_TCP) + build_tcp_syn("127.0.0.1", "127.0.0.1", 40000, 22, 1)
+
+        self.assertEqual(parse_reply(syn_ack), (("tcp", 40000, 22), "allowed"))
+        self.assertEqual(parse_reply(rst), (("tcp", 40001, 23), "allowed"))
+        self.assertIsNone(parse_reply(syn))
+
+    def test_parse_reply_bare_rst(self):
+        """
+        Test that a reset without ACK counts as allowed, as in the hping3 backend.
+        """
+        rst = ip_header(socket.IPPROTO_TCP) + struct.pack("!HHLLBBHHH", 23, 40001, 0, 0, 0x50, 0x04, 0, 0, 0)
+        self.assertEqual(parse_reply(rst), (("tcp", 40001, 23), "allowed"))
+
+    def test_parse_reply_icmp_unreachable(self):
+        """
+        Test that ICMP unreachables are matched through the quoted datagram.
+        """
+        quoted = ip_header(socket.IPPROTO_UDP) + build_udp("127.0.0.1", "127.0.0.1", 40002, 53)
+        port_unreachable = ip_header(socket.IPPROTO_ICMP) + struct.pack("!BBHL", 3, 3, 0, 0) + quoted
+        prohibited = ip_header(socket.IPPROTO_ICMP) + struct.pack("!BBHL", 3, 13, 0, 0) + quoted
+
+        self.assertEqual(parse_reply(port_unreachable), (("udp", 40002, 53), "allowed"))
+        self.assertEqual(parse_reply(prohibited), (("udp", 40002, 53), "blocked"))
+
+    def test_parse_reply_icmp_echo(self):
+        """
+        Test that echo replies are matched by identifier and sequence number.
+        """
+        reply = ip_header(socket.IPPROTO_ICMP) + struct.pack("!BBHHH", 0, 0, 0, 0x1234, 7)
+        self.assertEqual(parse_reply(reply), (("icmp", 0x1234, 7), "allowed"))
+
+    def test_probe_batch_adaptive_retries_silence(self):
+        """
+        Test that replies end a probe at once and only silent probes are resent.
+        """
+        timing = AdaptiveTimeout(min_timeout=0.01, retries=2, min_samples=1)
+        timing.record("127.0.0.1", 0.001)
+        engine = RawProbeEngine(timing=timing)
+        sent = []
+
+        class FakeSocket:
+            def sendto(self, packet, address):
+                # Port 22 answers immediately; port 23 never does
+                key = list(engine._pending)[-1]  # The probe registered just before sending
+                sent.append(key)
+                if key[2] == 22:
+                    pending = engine._pending[key]
+                    pending.verdict = "allowed"
+                    pending.received = time.monotonic()
+                    pending.event.set()
+
+        engine._sockets = {"tcp": FakeSocket()}
+        with patch.object(RawProbeEngine, "start"):
+            verdicts = engine.probe_batch([("tcp", 22, "incoming"), ("tcp", 23, "incoming")])
+
+        self.assertEqual(verdicts, ["allowed", "blocked"])
+        self.assertEqual([key[2] for key in sent], [22, 23, 23, 23])
+        self.assertEqual(len(timing._samples["127.0.0.1"][1]), 2)
+
+    def test_source_ports_are_not_reused_while_outstanding(self):
+        """
+        Test that outstanding probes hold their source ports and released ports are handed out again.
+        """
+        engine = RawProbeEngine()
+        engine._sockets = {"udp": MagicMock()}
+        engine._free_ids["udp"] = deque([40000, 40001])
+
+        first, first_pending = engine.send_probe("udp", 53)
+        second, _ = engine.send_probe("udp", 53)
+        self.assertEqual((first[1], second[1]), (40000, 40001))
+        with self.assertRaises(Exception):
+            engine.send_probe("udp", 53)
+
+        engine.release(first, first_pending)
+        engine.release(first, first_pending)  # Releasing twice frees the port once
+        self.assertEqual(engine.send_probe("udp", 53)[0][1], 40000)
+        self.assertEqual(list(engine._free_ids["udp"]), [])
+
+        engine._sockets["udp"].sendto.side_effect = OSError("network unreachable")
+        engine.release(second, engine._pending[second])
+        with self.assertRaises(OSError):
+            engine.send_probe("udp", 53)
+        self.assertEqual(list(engine._free_ids["udp"]), [40001])
+
+if __name__ == "__main__":
+    unittest.main()
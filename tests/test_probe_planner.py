@@ -0,0 +1,91 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import unittest
+from src.probe_planner import ProbePlanner
+from src.rule_compiler import NO_MATCH, CompiledPolicy
+
+class TestProbePlanner(unittest.TestCase):
+    def plan(self, rules):
+        planner = ProbePlanner(rules, CompiledPolicy(rules))
+        return planner, planner.plan()
+
+    def test_classes_from_boundaries(self):
+        """Nested ranges split into classes, each owned by its first matching rule and probed at both ends."""
+        rules = [
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 1500, "action": "block"},
+            {"rule_id": 2, "direction": "incoming", "protocol": "tcp", "port": "1000-2000", "action": "allow"},
+            {"rule_id": 3, "direction": "incoming", "protocol": "tcp", "port": "3000-65535", "action": "block"}
+        ]
+        planner, vectors = self.plan(rules)
+        self.assertEqual([(v["port"], v["ports"], v["owner"], v["rules"]) for v in vectors], [
+            (999, (0, 999), NO_MATCH, [1]),
+            (1000, (1000, 1499), 1, [1]), (1499, (1000, 1499), 1, [1]),
+            (1500, (1500, 1500), 0, [0]),
+            (1501, (1501, 2000), 1, [1]), (2000, (1501, 2000), 1, [1]),
+            (2001, (2001, 2999), NO_MATCH, [1]), (2999, (2001, 2999), NO_MATCH, [2]),
+            (3000, (3000, 65535), 2, [2]), (65535, (3000, 65535), 2, [2])
+        ])
+        self.assertEqual([v["expected"] for v in vectors],
+                         ["allow", "allow", "allow", "block", "allow", "allow", "allow", "allow", "block", "block"])
+        self.assertEqual([planner.vector_for(rule) for rule in rules], [3, 1, 8])
+
+    def test_gap_probes_charge_neighbouring_rules(self):
+        """A single-port gap between two rules is probed once and charged to both."""
+        rules = [
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": "0-99", "action": "block"},
+            {"rule_id": 2, "direction": "incoming", "protocol": "tcp", "port": "101-65535", "action": "block"}
+        ]
+        _, vectors = self.plan(rules)
+        self.assertEqual([(v["port"], v["owner"], v["rules"]) for v in vectors], [
+            (0, 0, [0]), (99, 0, [0]), (100, NO_MATCH, [0, 1]), (101, 1, [1]), (65535, 1, [1])
+        ])
+
+    def test_duplicate_probes_collapse(self):
+        """Rules sharing a flow share one probe; directions and protocols stay apart."""
+        rules = [
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "allow",
+             "source": "10.0.0.0/8"},
+            {"rule_id": 2, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "block"},
+            {"rule_id": 3, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "allow"},
+            {"rule_id": 4, "direction": "outgoing", "protocol": "tcp", "port": 22, "action": "allow"},
+            {"rule_id": 5, "direction": "incoming", "protocol": "udp", "port": 22, "action": "allow"}
+        ]
+        planner, vectors = self.plan(rules)
+        self.assertEqual(len({planner.vector_for(rule) for rule in rules}), 3)
+        self.assertEqual(vectors[planner.vector_for(rules[2])]["owner"], 0)
+        # Port 22 plus the ports just outside it, per flow
+        self.assertEqual(sorted((v["direction"], v["protocol"], v["port"]) for v in vectors), [
+            ("incoming", "tcp", 21), ("incoming", "tcp", 22), ("incoming", "tcp", 23),
+            ("incoming", "udp", 21), ("incoming", "udp", 22), ("incoming", "udp", 23),
+            ("outgoing", "tcp", 21), ("outgoing", "tcp", 22), ("outgoing", "tcp", 23)
+        ])
+
+    def test_rule_matching_no_probe_still_planned(self):
+        """A rule the compiled policy never matches still gets a vector at its lowest port."""
+        rules = [
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 80, "action": "block",
+             "source": "10.0.0.0/8"}
+        ]
+        planner = ProbePlanner(rules, CompiledPolicy(rules, source="127.0.0.1", destination="127.0.0.1"))
+        vectors = planner.plan()
+        vector = vectors[planner.vector_for(rules[0])]
+        self.assertEqual((vector["port"], vector["owner"], vector["expected"]), (80, NO_MATCH, "allow"))
+
+    def test_empty(self):
+        """No rules, no probes."""
+        self.assertEqual(self.plan([])[1], [])
+
+if __name__ == "__main__":
+    unittest.main()
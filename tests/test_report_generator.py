@@ -0,0 +1,127 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import os
+import tempfile
+import unittest
+from src.report_generator import ReportGenerator
+
+def make_results(count: int):
+    """Yield validation results, failing every third rule."""
+    for rule_id in range(1, count + 1):
+        yield {
+            "rule_id": rule_id,
+            "protocol": "tcp",
+            "port": 1000 + rule_id,
+            "direction": "incoming",
+            "expected_action": "allow",
+            "observed_action": "allow" if rule_id % 3 else "block",
+            "status": "pass" if rule_id % 3 else "fail"
+        }
+
+class TestReportGenerator(unittest.TestCase):
+    def setUp(self):
+        """Create a temporary directory for reports."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.output_file = os.path.join(self.tmpdir.name, "report.html")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read(self, name: str) -> str:
+        with open(os.path.join(self.tmpdir.name, name)) as file:
+            return file.read()
+
+    def test_generate_html_report(self):
+        """
+        Test that every result and finding is rendered into a single report.
+        """
+        findings = [{"rule_id": 2, "type": "shadowed", "related_rule_ids": [1], "detail": "never matches"}]
+
+        ReportGenerator.generate_html_report(list(make_results(3)), self.output_file, findings)
+
+        html = self.read("report.html")
+        self.assertEqual(html.count("<td>incoming</td>"), 3)
+        self.assertIn("<td>shadowed</td>", html)
+
+    def test_generate_html_report_creates_directory(self):
+        """
+        Test that a missing output directory is created, as in a fresh clone.
+        """
+        ReportGenerator.generate_html_report(list(make_results(1)), os.path.join(self.tmpdir.name, "reports",
+                                                                                 "report.html"))
+        self.assertIn("<td>incoming</td>", self.read(os.path.join("reports", "report.html")))
+
+    def test_report_shows_matched_rule(self):
+        """
+        Test that the kernel rule a probe matched is shown with the result.
+        """
+        results = list(make_results(1))
+        results[0]["matched_rule"] = {"summary": "INPUT #3 (rule 5): 2 packets, 120 bytes for 2 probes",
+                                      "ambiguous": True}
+
+        ReportGenerator.generate_html_report(results, self.output_file)
+
+        html = self.read("report.html")
+        self.assertIn("matched INPUT #3 (rule 5): 2 packets, 120 bytes for 2 probes", html)
+        self.assertIn("unparsed rules ahead also counted packets", html)
+
+    def test_generate_paginated_report(self):
+        """
+        Test that results are split into linked pages with a summary index.
+        """
+        files = ReportGenerator.generate_paginated_report(make_results(25), self.output_file, page_size=10)
+
+        self.assertEqual([os.path.basename(f) for f in files],
+                         ["report.html", "report_page_1.html", "report_page_2.html", "report_page_3.html"])
+        index = self.read("report.html")
+        self.assertIn("Total: 25, Passed: 17, Failed: 8", index)
+        self.assertIn('<a href="report_page_3.html">3</a>', index)
+
+        first, last = self.read("report_page_1.html"), self.read("report_page_3.html")
+        self.assertEqual(first.count("<td>incoming</td>"), 10)
+        self.assertIn('<a href="report_page_2.html">Next</a>', first)
+        self.assertNotIn("Previous", first)
+        self.assertEqual(last.count("<td>incoming</td>"), 5)
+        self.assertNotIn("Next", last)
+
+    def test_paginated_report_rewrites_changed_pages_only(self):
+        """
+        Test that an update rewrites only pages whose results changed and removes pages past the end.
+        """
+        previous = list(make_results(25))
+        ReportGenerator.generate_paginated_report(previous, self.output_file, page_size=10)
+
+        current = [dict(result) for result in previous[:15]]
+        current[12]["status"] = "fail"
+        files = ReportGenerator.generate_paginated_report(current, self.output_file, page_size=10,
+                                                          previous_results=previous)
+
+        # Page 2 changed and lost its Next link; page 1 is untouched and page 3 is gone
+        self.assertEqual([os.path.basename(f) for f in files], ["report.html", "report_page_2.html"])
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir.name, "report_page_3.html")))
+        self.assertNotIn("Next", self.read("report_page_2.html"))
+        self.assertIn("Total: 15", self.read("report.html"))
+
+    def test_generate_paginated_report_empty(self):
+        """
+        Test that an empty result set still produces an index page.
+        """
+        files = ReportGenerator.generate_paginated_report(iter([]), self.output_file, page_size=10)
+
+        self.assertEqual(files, [self.output_file])
+        self.assertIn("Total: 0", self.read("report.html"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import importlib.util
+import json
+import os
+import tempfile
+import unittest
+import pandas as pd
+from src.results_store import ResultsStore
+
+RESULTS = [
+    {"rule_id": 1, "protocol": "tcp", "port": 22, "direction": "incoming",
+     "expected_action": "allow", "observed_action": "allow", "policy_action": "allow", "status": "pass"},
+    {"rule_id": 2, "protocol": "udp", "port": 53, "direction": "outgoing",
+     "expected_action": "block", "observed_action": "allow", "policy_action": "block", "status": "fail"},
+    {"rule_id": 3, "protocol": "tcp", "port": "50000-50100", "direction": "incoming",
+     "expected_action": "block", "observed_action": "block", "policy_action": "block", "status": "pass"}
+]
+
+class TestResultsStore(unittest.TestCase):
+    def setUp(self):
+        """Build a store from sample results."""
+        self.store = ResultsStore.from_results(iter(RESULTS))
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_typed_columns(self):
+        """
+        Test that results are stored with compact, typed columns.
+        """
+        dtypes = self.store.frame.dtypes
+        self.assertEqual(len(self.store), 3)
+        self.assertEqual(str(dtypes["protocol"]), "category")
+        self.assertEqual(str(dtypes["status"]), "category")
+        self.assertEqual(str(dtypes["port_low"]), "uint16")
+        self.assertEqual(self.store.frame["port_high"].tolist(), [22, 53, 50100])
+
+    def test_round_trip(self):
+        """
+        Test that the table converts back to the original result dicts.
+        """
+        self.assertEqual(self.store.to_results(), RESULTS)
+
+    def test_summary(self):
+        """
+        Test pass/fail aggregates by protocol and port band.
+        """
+        by_protocol = self.store.summary("protocol")
+        self.assertEqual(by_protocol.loc["tcp"].tolist(), [2, 0, 2])
+        self.assertEqual(by_protocol.loc["udp"].tolist(), [0, 1, 1])
+
+        by_band = self.store.summary("port_band")
+        self.assertEqual(by_band.loc["well-known", "total"], 2)
+        self.assertEqual(by_band.loc["dynamic", "pass"], 1)
+
+        with self.assertRaises(ValueError):
+            self.store.summary("action")
+
+    def test_export_csv_and_jsonl(self):
+        """
+        Test CSV and JSON Lines exports.
+        """
+        csv_path = os.path.join(self.tmpdir.name, "out", "results.csv")
+        jsonl_path = os.path.join(self.tmpdir.name, "results.jsonl")
+
+        self.store.export(csv_path)
+        self.store.export(jsonl_path)
+
+        self.assertEqual(pd.read_csv(csv_path)["status"].tolist(), ["pass", "fail", "pass"])
+        with open(jsonl_path) as file:
+            rows = [json.loads(line) for line in file]
+        self.assertEqual(rows[2]["port"], "50000-50100")
+
+        with self.assertRaises(ValueError):
+            self.store.export(os.path.join(self.tmpdir.name, "results.xlsx"))
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is not installed")
+    def test_export_parquet(self):
+        """
+        Test that Parquet export keeps the column types.
+        """
+        path = os.path.join(self.tmpdir.name, "results.parquet")
+
+        self.store.export(path)
+
+        frame = pd.read_parquet(path)
+        self.assertEqual(str(frame["protocol"].dtype), "category")
+        self.assertEqual(frame["rule_id"].tolist(), [1, 2, 3])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,235 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import ipaddress
+import random
+import unittest
+from src.rule_analyzer import RuleAnalyzer
+from src.rule_compiler import DIRECTIONS, PROTOCOLS, CompiledPolicy
+from src.rule_model import representative_addresses, rule_networks
+
+class TestRuleAnalyzer(unittest.TestCase):
+    def analyze(self, rules):
+        """Return findings keyed by rule_id."""
+        return {finding["rule_id"]: finding for finding in RuleAnalyzer(rules).analyze()}
+
+    def test_shadowed_rule(self):
+        """
+        Test that a rule fully covered by an earlier range with another action is shadowed.
+        """
+        findings = self.analyze([
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": "1-1024", "action": "block"},
+            {"rule_id": 2, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "allow"}
+        ])
+        self.assertEqual(findings[2]["type"], "shadowed")
+        self.assertEqual(findings[2]["related_rule_ids"], [1])
+        self.assertNotIn(1, findings)
+
+    def test_redundant_rule_covered_by_several_ranges(self):
+        """
+        Test that coverage is the union of several earlier rules.
+        """
+        findings = self.analyze([
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": "80-89", "action": "allow"},
+            {"rule_id": 2, "direction": "incoming", "protocol": "tcp", "port": "90:99", "action": "allow"},
+            {"rule_id": 3, "direction": "incoming", "protocol": "tcp", "port": "85-95", "action": "allow"}
+        ])
+        self.assertEqual(findings[3]["type"], "redundant")
+        self.assertEqual(findings[3]["related_rule_ids"], [1, 2])
+
+    def test_overlapping_rule(self):
+        """
+        Test that a partial conflict is reported as an overlap.
+        """
+        findings = self.analyze([
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": "1000-2000", "action": "allow"},
+            {"rule_id": 2, "direction": "incoming", "protocol": "tcp", "port": "1500-2500", "action": "block"}
+        ])
+        self.assertEqual(findings[2]["type"], "overlap")
+
+    def test_cidr_scope(self):
+        """
+        Test that only earlier rules with enclosing networks can shadow a rule, while
+        narrower ones with another action are reported as overlaps.
+        """
+        findings = self.analyze([
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "block",
+             "source": "10.0.0.0/8"},
+            {"rule_id": 2, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "allow",
+             "source": "10.1.0.0/16"},
+            {"rule_id": 3, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "allow",
+             "source": "192.168.0.0/16"},
+            {"rule_id": 4, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "allow"}
+        ])
+        self.assertEqual(findings[2]["type"], "shadowed")
+        self.assertNotIn(3, findings)
+        self.assertEqual(findings[4]["type"], "overlap")
+        self.assertEqual(findings[4]["related_rule_ids"], [1])
+
+    def test_narrower_rule_preceded_by_enclosing_rule(self):
+        """
+        Test that a narrower rule is ignored where an earlier rule covering all traffic already decides.
+        """
+        findings = self.analyze([
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": "20-30", "action": "allow"},
+            {"rule_id": 2, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "block",
+             "destination": "10.0.0.1"},
+            {"rule_id": 3, "direction": "incoming", "protocol": "tcp", "port": "1-100", "action": "allow"},
+            {"rule_id": 4, "direction": "incoming", "protocol": "tcp", "port": "1-100", "action": "allow",
+             "source": "10.0.0.0/8"}
+        ])
+        self.assertEqual(findings[2]["type"], "shadowed")
+        self.assertNotIn(3, findings)
+        self.assertEqual(findings[4]["type"], "redundant")
+
+    def test_random_partial_conflicts_are_found(self):
+        """
+        Test that every rule deciding some traffic while an earlier rule with another
+        action decides other traffic it matches is reported as an overlap.
+        """
+        generator = random.Random(5)
+        networks = [None, "10.0.0.0/8", "10.1.0.0/16", "10.1.2.0/24", "192.168.0.0/16"]
+        for _ in range(15):
+            rules = []
+            for rule_id in range(1, 25):
+                low = generator.randint(1, 30)
+                rule = {"rule_id": rule_id, "direction": "incoming", "protocol": "tcp",
+                        "port": f"{low}-{low + generator.randint(0, 8)}", "action": generator.choice(["allow", "block"])}
+                for field in ("source", "destination"):
+                    network = generator.choice(networks)
+                    if network:
+                        rule[field] = network
+                rules.append(rule)
+
+            findings = self.analyze(rules)
+            decides, conflicts = set(), set()
+            for source in representative_addresses(rules, "source"):
+                for destination in representative_addresses(rules, "destination"):
+                    matches = CompiledPolicy(rules, source=source, destination=destination).matches[
+                        DIRECTIONS.index("incoming"), PROTOCOLS.index("tcp")]
+                    for index, rule in enumerate(rules):
+                        rule_source, rule_destination = rule_networks(rule)
+                        if ((source and ipaddress.ip_address(source) not in rule_source)
+                                or (destination and ipaddress.ip_address(destination) not in rule_destination)):
+                            continue
+                        low, high = (int(port) for port in rule["port"].split("-"))
+                        for owner in set(matches[low:high + 1].tolist()):
+                            if owner == index:
+                                decides.add(index)
+                            elif rules[owner]["action"] != rule["action"]:
+                                conflicts.add(index)
+            for index in decides & conflicts:
+                self.assertEqual(findings[rules[index]["rule_id"]]["type"], "overlap")
+            for rule_id, finding in findings.items():
+                if finding["type"] != "overlap":
+                    self.assertNotIn(rule_id - 1, decides)
+
+    def test_overlap_ignores_narrower_rules_shadowed_inside_it(self):
+        """
+        Test that a narrower rule already decided by an earlier one is not reported as an overlap.
+        """
+        findings = self.analyze([
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": "3-6", "action": "allow",
+             "source": "10.0.0.1/32", "destination": "10.0.0.0/28"},
+            {"rule_id": 2, "direction": "incoming", "protocol": "tcp", "port": "3-6", "action": "block",
+             "source": "10.0.0.9/32"},
+            {"rule_id": 3, "direction": "incoming", "protocol": "tcp", "port": "4-5", "action": "block",
+             "source": "10.0.0.1/32", "destination": "10.0.0.0/29"},
+            {"rule_id": 4, "direction": "incoming", "protocol": "tcp", "port": "1-4", "action": "allow"}
+        ])
+        self.assertEqual(findings[3]["type"], "shadowed")
+        self.assertEqual(findings[4]["type"], "overlap")
+        self.assertEqual(findings[4]["related_rule_ids"], [2])
+
+    def test_rule_covered_by_narrower_rules_is_shadowed(self):
+        """
+        Test that a rule whose networks are covered by the union of narrower rules is shadowed.
+        """
+        findings = self.analyze([
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "block",
+             "source": "10.0.0.0/9"},
+            {"rule_id": 2, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "block",
+             "source": "10.128.0.0/9"},
+            {"rule_id": 3, "direction": "incoming", "protocol": "tcp", "port": "20-22", "action": "allow",
+             "source": "10.0.0.0/8"},
+            {"rule_id": 4, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "allow",
+             "source": "10.0.0.0/8"}
+        ])
+        self.assertEqual(findings[3]["type"], "overlap")
+        self.assertEqual(findings[3]["related_rule_ids"], [1, 2])
+        self.assertEqual(findings[4]["type"], "shadowed")
+        self.assertEqual(findings[4]["related_rule_ids"], [1, 2])
+
+    def test_random_cidr_rules_match_brute_force(self):
+        """
+        Test findings against the first matching rule of every port and address class.
+        """
+        generator = random.Random(11)
+        networks = [None, "10.0.0.0/8", "10.0.0.0/9", "10.128.0.0/9", "10.1.0.0/16", "10.1.2.3/32", "192.168.0.0/16"]
+        for _ in range(20):
+            rules = []
+            for rule_id in range(1, 21):
+                low = generator.randint(1, 20)
+                rule = {"rule_id": rule_id, "direction": "incoming", "protocol": "tcp",
+                        "port": f"{low}-{low + generator.randint(0, 6)}", "action": generator.choice(["allow", "block"])}
+                for field in ("source", "destination"):
+                    network = generator.choice(networks)
+                    if network:
+                        rule[field] = network
+                rules.append(rule)
+
+            owners = [set() for _ in rules]
+            uncovered = set()
+            for source in representative_addresses(rules, "source"):
+                for destination in representative_addresses(rules, "destination"):
+                    matches = CompiledPolicy(rules, source=source, destination=destination).matches[
+                        DIRECTIONS.index("incoming"), PROTOCOLS.index("tcp")]
+                    for index, rule in enumerate(rules):
+                        rule_source, rule_destination = rule_networks(rule)
+                        if ((source and ipaddress.ip_address(source) not in rule_source)
+                                or (destination and ipaddress.ip_address(destination) not in rule_destination)):
+                            continue
+                        low, high = (int(port) for port in rule["port"].split("-"))
+                        for owner in matches[low:high + 1].tolist():
+                            if owner == index:
+                                uncovered.add(index)
+                            else:
+                                owners[index].add(owner)
+
+            expected = {}
+            for index, rule in enumerate(rules):
+                conflicting = sorted(owner for owner in owners[index] if rules[owner]["action"] != rule["action"])
+                if index not in uncovered:
+                    kind, related = ("shadowed", conflicting) if conflicting else ("redundant", sorted(owners[index]))
+                elif conflicting:
+                    kind, related = "overlap", conflicting
+                else:
+                    continue
+                expected[rule["rule_id"]] = (kind, [rules[owner]["rule_id"] for owner in related])
+            self.assertEqual({rule_id: (finding["type"], finding["related_rule_ids"])
+                              for rule_id, finding in self.analyze(rules).items()}, expected)
+
+    def test_direction_and_protocol_are_separate(self):
+        """
+        Test that rules for other directions or protocols never interact.
+        """
+        findings = self.analyze([
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 53, "action": "block"},
+            {"rule_id": 2, "direction": "incoming", "protocol": "udp", "port": 53, "action": "allow"},
+            {"rule_id": 3, "direction": "outgoing", "protocol": "tcp", "port": 53, "action": "allow"}
+        ])
+        self.assertEqual(findings, {})
+
+if __name__ == "__main__":
+    unittest.main()
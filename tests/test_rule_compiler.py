@@ -0,0 +1,78 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import unittest
+import numpy as np
+from src.rule_compiler import CompiledPolicy, ALLOW, BLOCK, NO_MATCH
+
+class TestCompiledPolicy(unittest.TestCase):
+    def setUp(self):
+        """Compile a policy where rule 2 is shadowed by rule 1."""
+        self.rules = [
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "block"},
+            {"rule_id": 2, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "allow"},
+            {"rule_id": 3, "direction": "outgoing", "protocol": "udp", "port": 53, "action": "block"}
+        ]
+        self.policy = CompiledPolicy(self.rules)
+
+    def test_first_match_wins(self):
+        """
+        Test that the earliest matching rule decides the verdict.
+        """
+        self.assertEqual(self.policy.verdict("tcp", 22, "incoming"), "blocked")
+        self.assertEqual(self.policy.match("tcp", [22], "incoming")[0], 0)
+
+    def test_default_action(self):
+        """
+        Test that unmatched flows fall through to the default action.
+        """
+        self.assertEqual(self.policy.verdict("tcp", 80, "incoming"), "allowed")
+        self.assertEqual(self.policy.match(["tcp"], [80], ["incoming"])[0], NO_MATCH)
+        self.assertEqual(CompiledPolicy(self.rules, default_action="block").verdict("tcp", 80, "incoming"), "blocked")
+
+    def test_evaluate_batch(self):
+        """
+        Test the vectorized API with names and with pre-encoded indices.
+        """
+        verdicts = self.policy.evaluate(
+            np.array(["tcp", "udp", "udp", "icmp"]),
+            np.array([22, 53, 53, 0]),
+            np.array(["incoming", "outgoing", "incoming", "incoming"])
+        )
+        np.testing.assert_array_equal(verdicts, [BLOCK, BLOCK, ALLOW, ALLOW])
+
+        encoded = self.policy.evaluate(np.array([0, 1]), np.array([22, 53]), np.array([0, 1]))
+        np.testing.assert_array_equal(encoded, [BLOCK, BLOCK])
+
+    def test_port_range_and_source(self):
+        """
+        Test that ranges cover every port and source networks filter rules.
+        """
+        rules = [
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": "1000-2000", "action": "block",
+             "source": "10.0.0.0/8"}
+        ]
+        self.assertEqual(CompiledPolicy(rules).verdict("tcp", 2000, "incoming"), "blocked")
+        self.assertEqual(CompiledPolicy(rules).verdict("tcp", 2001, "incoming"), "allowed")
+        self.assertEqual(CompiledPolicy(rules, source="127.0.0.1").verdict("tcp", 1500, "incoming"), "allowed")
+
+    def test_unknown_protocol(self):
+        """
+        Test that an unknown protocol name is rejected.
+        """
+        with self.assertRaises(ValueError):
+            self.policy.evaluate(["sctp"], [1], ["incoming"])
+
+if __name__ == "__main__":
+    unittest.main()
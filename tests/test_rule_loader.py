@@ -0,0 +1,107 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import json
+import os
+import tempfile
+import unittest
+import unittest.mock
+from src.rule_loader import RuleLoader
+
+RULES = [
+    {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "allow"},
+    {"rule_id": 2, "direction": "outgoing", "protocol": "udp", "port": 70000, "action": "block"},
+    {"rule_id": 3, "direction": "incoming", "protocol": "tcp", "port": "1000-2000", "action": "block"}
+]
+
+class TestRuleLoader(unittest.TestCase):
+    def setUp(self):
+        """Create a temporary directory for rule files."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, name: str, content: str) -> str:
+        """Write a rule file and return its path."""
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, "w") as file:
+            file.write(content)
+        return path
+
+    def test_json_array_streamed_in_small_chunks(self):
+        """
+        Test that a JSON array is decoded across chunk boundaries and invalid
+        rules are skipped with their line numbers.
+        """
+        path = self.write("rules.json", json.dumps(RULES, indent=4))
+        loader = RuleLoader(path, chunk_size=8)
+
+        rules = loader.load()
+
+        self.assertEqual([rule["rule_id"] for rule in rules], [1, 3])
+        self.assertEqual(len(loader.errors), 1)
+        self.assertEqual(loader.errors[0]["rule_id"], 2)
+        self.assertEqual(loader.errors[0]["line"], 9)
+        self.assertIn("65535", loader.errors[0]["message"])
+
+    def test_known_valid_rules_skip_validation(self):
+        """
+        Test that rules validated by an earlier load are not validated again.
+        """
+        path = self.write("rules.json", json.dumps(RULES))
+        known_valid = set()
+        RuleLoader(path, known_valid=known_valid).load()
+        self.assertEqual(len(known_valid), 2)
+
+        with unittest.mock.patch.object(RuleLoader, "validate", wraps=RuleLoader.validate) as mock_validate:
+            rules = RuleLoader(path, known_valid=known_valid).load()
+
+        self.assertEqual([rule["rule_id"] for rule in rules], [1, 3])
+        # Only the invalid rule is checked again
+        self.assertEqual(mock_validate.call_count, 1)
+
+    def test_json_lines(self):
+        """
+        Test that JSON Lines files are read line by line and bad lines do not abort the load.
+        """
+        content = "\n".join(json.dumps(rule) for rule in RULES) + "\n{not json\n\n"
+        path = self.write("rules.jsonl", content)
+        loader = RuleLoader(path)
+
+        rules = list(loader)
+
+        self.assertEqual([rule["rule_id"] for rule in rules], [1, 3])
+        self.assertEqual([error["line"] for error in loader.errors], [2, 4])
+
+    def test_json_lines_detected_from_content(self):
+        """
+        Test that a .json file holding one object per line is read as JSON Lines.
+        """
+        path = self.write("rules.json", "\n".join(json.dumps(rule) for rule in RULES))
+
+        self.assertEqual(len(RuleLoader(path).load()), 2)
+
+    def test_malformed_array(self):
+        """
+        Test that a syntax error in a JSON array raises with the line number.
+        """
+        path = self.write("rules.json", '[\n{"rule_id": 1},\n{"rule_id": ]')
+
+        with self.assertRaises(json.JSONDecodeError) as context:
+            RuleLoader(path).load()
+        self.assertIn("line 3", str(context.exception))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+# This file is part of the Automated Firewall Rule Tester.
+# 
+# Automated Firewall Rule Tester is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Automated Firewall Rule Tester is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import random
+import time
+import unittest
+from src.rule_optimizer import RuleOptimizer, find_difference
+
+def tcp(rule_id, port, action="allow", **fields):
+    return dict({"rule_id": rule_id, "direction": "incoming", "protocol": "tcp", "port": port, "action": action}, **fields)
+
+class TestRuleOptimizer(unittest.TestCase):
+    def test_merges_contiguous_ports(self):
+        """
+        Test that adjacent and overlapping ports with the same action become one range.
+        """
+        rules = [tcp(1, 80), tcp(2, 81), tcp(3, "82-90"), tcp(4, "85-100"), tcp(5, 81)]
+        optimizer = RuleOptimizer(rules)
+        self.assertEqual(optimizer.optimize(), [tcp(1, "80-100")])
+        self.assertEqual(optimizer.stats["merged"], 3)
+        self.assertEqual(optimizer.stats["removed"], 1)
+        self.assertEqual(rules[0]["port"], 80)
+
+    def test_does_not_merge_across_conflicting_rule(self):
+        """
+        Test that a rule is not merged past an earlier rule with another verdict.
+        """
+        rules = [tcp(1, 80), tcp(2, 81, "block"), tcp(3, "81-82")]
+        optimized = RuleOptimizer(rules).optimize()
+        self.assertEqual([rule["port"] for rule in optimized], [80, 81, "81-82"])
+
+    def test_keeps_different_networks_apart(self):
+        """
+        Test that rules for different source networks are not merged.
+        """
+        rules = [tcp(1, 80, source="10.0.0.0/8"), tcp(2, 81, source="192.168.0.0/16")]
+        self.assertEqual(len(RuleOptimizer(rules).optimize()), 2)
+
+    def test_reorders_by_hits_without_passing_conflicts(self):
+        """
+        Test that hot rules move up, but never past a rule they conflict with.
+        """
+        rules = [tcp(1, 22, "block"), tcp(2, 80), tcp(3, "1-100", "block"), tcp(4, 443)]
+        optimizer = RuleOptimizer(rules, hits=[1, 5, 0, 50])
+        optimized = optimizer.optimize()
+        self.assertEqual([rule["rule_id"] for rule in optimized], [4, 2, 1, 3])
+        self.assertEqual(optimizer.stats["moved"], 2)
+
+    def test_find_difference(self):
+        """
+        Test that a changed verdict is reported with a concrete flow.
+        """
+        original = [tcp(1, 80, "block", source="10.0.0.0/8")]
+        self.assertIsNone(find_difference(original, [dict(original[0])]))
+        difference = find_difference(original, [tcp(1, 80, "block", source="10.0.0.0/9")])
+        self.assertEqual(difference["port"], 80)
+        self.assertEqual(difference["source"], "10.128.0.0")
+        self.assertEqual((difference["original"], difference["optimized"]), ("block", "allow"))
+
+    def test_random_policies_stay_equivalent(self):
+        """
+        Test that optimizing random policies, with and without hits, keeps every verdict.
+        """
+        generator = random.Random(7)
+        networks = [None, "10.0.0.0/8", "10.1.0.0/16", "192.168.1.0/24"]
+        for _ in range(50):
+            rules = []
+            for rule_id in range(1, 30):
+                low = generator.randint(1, 40)
+                rule = {"rule_id": rule_id, "direction": generator.choice(["incoming", "outgoing"]),
+                        "protocol": generator.choice(["tcp", "udp"]),
+                        "port": generator.choice([low, f"{low}-{low + generator.randint(0, 10)}"]),
+                        "action": generator.choice(["allow", "block"])}
+                source = generator.choice(networks)
+                if source:
+                    rule["source"] = source
+                rules.append(rule)
+            hits = [generator.randint(0, 100) for _ in rules]
+            for optimizer in (RuleOptimizer(rules), RuleOptimizer(rules, hits)):
+                optimized = optimizer.optimize()
+                self.assertIsNone(find_difference(rules, optimized))
+                self.assertLessEqual(len(optimized), len(rules))
+
+    def test_merges_large_rule_set_in_one_pass(self):
+        """
+        Test that tens of thousands of shuffled single-port rules merge quickly into their ranges.
+        """
+        generator = random.Random(3)
+        rules = [tcp(port, port) for port in range(1, 15001)] + [tcp(port, port, "block") for port in range(20001, 35001)]
+        generator.shuffle(rules)
+
+        started = time.perf_counter()
+        optimizer = RuleOptimizer(rules)
+        optimized = optimizer.optimize()
+
+        self.assertLess(time.perf_counter() - started, 30)
+        self.assertEqual(sorted((rule["port"], rule["action"]) for rule in optimized),
+                         [("1-15000", "allow"), ("20001-35000", "block")])
+        self.assertEqual(optimizer.stats["merged"], 29998)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -12,8 +12,12 @@
 # 
 # You should have received a copy of the GNU General Public License
 # along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
+import json
 import unittest
+import os
+import tempfile
 from unittest.mock import patch, MagicMock
+from src.probe_cache import ProbeCache
 from src.rule_validator import RuleValidator
 
 class TestRuleValidator(unittest.TestCase):
@@ -62,6 +66,389 @@ class TestRuleValidator(unittest.TestCase):
         self.assertEqual(results[0]["status"], "fail")
         self.assertEqual(results[1]["status"], "fail")
 
+    @patch("src.rule_validator.TrafficSimulator.simulate_traffic")
+    def test_validate_rules_concurrent_keeps_order(self, mock_simulate_traffic):
+        """
+        Test that concurrent validation returns results in rule order.
+        """
+        mock_simulate_traffic.side_effect = lambda protocol, port, direction: (
+            "allowed" if port % 2 == 0 else "blocked"
+        )
+        rules = [
+            {"rule_id": i, "direction": "incoming", "protocol": "tcp", "port": 1000 + i, "action": "allow"}
+            for i in range(50)
+        ]
+        validator = RuleValidator(self.rule_file, max_in_flight=8)
+
+        with patch.object(RuleValidator, "load_rules", return_value=rules):
+            results = validator.validate_rules()
+
+        self.assertEqual([r["rule_id"] for r in results], list(range(50)))
+        self.assertEqual(mock_simulate_traffic.call_count, 50)
+        for result in results:
+            expected = "pass" if result["port"] % 2 == 0 else "fail"
+            self.assertEqual(result["status"], expected)
+
+    @patch("src.rule_validator.TrafficSimulator.simulate_traffic")
+    @patch("src.rule_validator.TrafficSimulator.simulate_batch")
+    def test_validate_rules_raw_backend_batches(self, mock_simulate_batch, mock_simulate_traffic):
+        """
+        Test that the raw backend probes rules in batches of max_in_flight flows.
+        """
+        mock_simulate_batch.side_effect = lambda probes, evidence=None: [
+            "allowed" if port % 2 == 0 else "blocked" for _, port, _ in probes
+        ]
+        rules = [
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 1000, "action": "allow"},
+            {"rule_id": 2, "direction": "incoming", "protocol": "tcp", "port": 1001, "action": "block"},
+            {"rule_id": 3, "direction": "incoming", "protocol": "tcp", "port": 1000, "action": "allow"},
+            {"rule_id": 4, "direction": "outgoing", "protocol": "udp", "port": 53, "action": "block"},
+            {"rule_id": 5, "direction": "incoming", "protocol": "tcp", "port": 1002, "action": "allow"}
+        ]
+        validator = RuleValidator(self.rule_file, max_in_flight=3, probe_backend="raw")
+
+        with patch.object(RuleValidator, "load_rules", return_value=rules):
+            results = validator.validate_rules()
+
+        mock_simulate_traffic.assert_not_called()
+        batches = [call.args[0] for call in mock_simulate_batch.call_args_list]
+        self.assertEqual(batches, [
+            [("tcp", 1000, "incoming"), ("tcp", 1001, "incoming")],
+            [("udp", 53, "outgoing"), ("tcp", 1002, "incoming")]
+        ])
+        self.assertEqual([r["rule_id"] for r in results], [1, 2, 3, 4, 5])
+        self.assertEqual([r["status"] for r in results], ["pass"] * 5)
+
+    @patch("src.rule_validator.TrafficSimulator.simulate_traffic")
+    def test_validate_rules_dry_run(self, mock_simulate_traffic):
+        """
+        Test that dry-run mode uses the compiled policy and sends no traffic.
+        """
+        validator = RuleValidator(self.rule_file, dry_run=True)
+
+        with patch.object(RuleValidator, "load_rules", return_value=[
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "block"},
+            {"rule_id": 2, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "allow"}
+        ]):
+            results = validator.validate_rules()
+
+        mock_simulate_traffic.assert_not_called()
+        self.assertEqual(results[0]["status"], "pass")
+        # Rule 2 is shadowed by rule 1
+        self.assertEqual(results[1]["status"], "fail")
+        self.assertEqual(results[1]["policy_action"], "block")
+
+    @patch("src.rule_validator.FirewallManager.save_nft_table")
+    @patch("src.rule_validator.FirewallManager.save_live_ruleset")
+    @patch("src.rule_validator.TrafficSimulator.simulate_traffic")
+    def test_validate_rules_cache(self, mock_simulate_traffic, mock_save_live_ruleset, mock_save_nft_table):
+        """
+        Test that unchanged rules are not probed again while the ruleset is unchanged.
+        """
+        mock_simulate_traffic.return_value = "allowed"
+        mock_save_nft_table.return_value = ""
+        rules = [{"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "allow"}]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = ProbeCache(os.path.join(tmpdir, "probes.sqlite3"))
+            validator = RuleValidator(self.rule_file, cache=cache)
+            with patch.object(RuleValidator, "load_rules", return_value=rules):
+                mock_save_live_ruleset.return_value = "-A INPUT -p tcp -m tcp --dport 22 -j ACCEPT\n"
+                validator.validate_rules()
+                validator.validate_rules()
+                mock_save_live_ruleset.return_value = "-A INPUT -p tcp -m tcp --dport 22 -j DROP\n"
+                results = validator.validate_rules()
+                # An nftables rule change also invalidates the cache
+                mock_save_nft_table.return_value = "table inet firewall_tester {\n}\n"
+                validator.validate_rules()
+            cache.close()
+
+        self.assertEqual(mock_simulate_traffic.call_count, 3)
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+        self.assertEqual(results[0]["status"], "pass")
+
+    @patch("src.rule_validator.FirewallManager.save_nft_table", return_value="")
+    @patch("src.rule_validator.FirewallManager.save_live_ruleset", return_value="")
+    def test_firewall_state_depends_on_probe_backend_and_target(self, mock_save_live_ruleset,
+                                                                mock_save_nft_table):
+        """
+        Test that results probed with another backend or target are not reused.
+        """
+        state = RuleValidator._firewall_state("hping3", "127.0.0.1")
+        self.assertEqual(state, RuleValidator._firewall_state("hping3", "127.0.0.1"))
+        self.assertNotEqual(state, RuleValidator._firewall_state("raw", "127.0.0.1"))
+        self.assertNotEqual(state, RuleValidator._firewall_state("hping3", "10.200.0.1 10.200.0.2"))
+
+    @patch("src.rule_validator.NamespaceSandbox.destroy")
+    @patch("src.rule_validator.NamespaceSandbox.create")
+    def test_validate_rules_namespaces(self, mock_create, mock_destroy):
+        """
+        Test that rules are sharded across namespaces and merged back in rule order.
+        """
+        mock_create.return_value = [
+            {"firewall": f"ns-{i}", "client": f"ns-{i}-client",
+             "firewall_address": f"10.200.{i}.1", "client_address": f"10.200.{i}.2"}
+            for i in range(3)
+        ]
+        probed_from = {}
+
+        def simulate_traffic(simulator, protocol, port, direction):
+            probed_from[port] = simulator.routes[direction][0]
+            return "allowed"
+
+        rules = [
+            {"rule_id": i, "direction": "incoming", "protocol": "tcp", "port": 1000 + i, "action": "allow"}
+            for i in range(9)
+        ]
+        validator = RuleValidator(self.rule_file, max_in_flight=2, namespaces=3)
+
+        with patch.object(RuleValidator, "load_rules", return_value=rules), \
+                patch("src.rule_validator.TrafficSimulator.simulate_traffic", autospec=True,
+                      side_effect=simulate_traffic):
+            results = validator.validate_rules()
+
+        self.assertEqual([r["rule_id"] for r in results], list(range(9)))
+        self.assertTrue(all(r["status"] == "pass" for r in results))
+        self.assertEqual(probed_from, {1000 + i: f"ns-{i % 3}-client" for i in range(9)})
+        mock_create.assert_called_once_with(self.rule_file)
+        mock_destroy.assert_called_once()
+
+    @patch("src.rule_validator.NamespaceSandbox.destroy")
+    @patch("src.rule_validator.NamespaceSandbox.create")
+    def test_namespaces_policy_uses_sandbox_addresses(self, mock_create, mock_destroy):
+        """
+        Test that the policy is compiled for the sandbox's client and firewall addresses.
+        """
+        mock_create.return_value = [{"firewall": "ns-0", "client": "ns-0-client",
+                                     "firewall_address": "10.200.0.1", "client_address": "10.200.0.2"}]
+        rules = [
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "block",
+             "source": "192.168.0.0/16"},
+            {"rule_id": 2, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "allow"},
+            {"rule_id": 3, "direction": "incoming", "protocol": "tcp", "port": 80, "action": "block",
+             "source": "10.200.0.2", "destination": "10.200.0.1"},
+            {"rule_id": 4, "direction": "incoming", "protocol": "tcp", "port": 80, "action": "allow"},
+            {"rule_id": 5, "direction": "outgoing", "protocol": "udp", "port": 53, "action": "block",
+             "source": "10.200.0.1", "destination": "10.200.0.2"},
+            {"rule_id": 6, "direction": "outgoing", "protocol": "udp", "port": 53, "action": "allow"}
+        ]
+        validator = RuleValidator(self.rule_file, namespaces=1)
+
+        with patch.object(RuleValidator, "load_rules", return_value=rules), \
+                patch("src.rule_validator.TrafficSimulator.simulate_traffic", return_value="allowed"):
+            results = validator.validate_rules()
+
+        self.assertEqual([r["policy_action"] for r in results],
+                         ["allow", "allow", "block", "block", "block", "block"])
+
+        with patch.object(RuleValidator, "load_rules", return_value=rules + [
+            {"rule_id": 7, "direction": "incoming", "protocol": "tcp", "port": 443, "action": "block",
+             "source": "10.200.1.0/24"}
+        ]):
+            with self.assertRaises(ValueError):
+                RuleValidator(self.rule_file, namespaces=2).validate_rules()
+
+    @patch("src.rule_validator.TrafficSimulator.simulate_traffic")
+    def test_validate_rules_plan_probes(self, mock_simulate_traffic):
+        """
+        Test that planned probing dedupes probes and checks both edges of every port class a rule decides.
+        """
+        # The live firewall blocks 1400-1600 although rule 1 allows 1000-2000
+        mock_simulate_traffic.side_effect = lambda protocol, port, direction: (
+            "blocked" if 1400 <= port <= 1600 else "allowed"
+        )
+        rules = [
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": "1000-2000", "action": "allow"},
+            {"rule_id": 2, "direction": "incoming", "protocol": "tcp", "port": 1500, "action": "block"},
+            {"rule_id": 3, "direction": "incoming", "protocol": "tcp", "port": 1000, "action": "allow"},
+            {"rule_id": 4, "direction": "incoming", "protocol": "tcp", "port": 1000, "action": "allow",
+             "source": "10.0.0.0/8"}
+        ]
+        validator = RuleValidator(self.rule_file, plan_probes=True)
+
+        with patch.object(RuleValidator, "load_rules", return_value=rules):
+            results = validator.validate_rules()
+
+        probed = sorted(call.args[1] for call in mock_simulate_traffic.call_args_list)
+        self.assertEqual(probed, [999, 1000, 1001, 1499, 1500, 1501, 2000, 2001])
+        self.assertEqual([r["status"] for r in results], ["fail", "pass", "pass", "pass"])
+        self.assertEqual(results[0]["observed_action"], "allow")
+        self.assertEqual(results[0]["mismatched_ports"], ["1001-1499", "1500", "1501-2000"])
+        self.assertNotIn("mismatched_ports", results[1])
+
+    @patch("src.rule_validator.TrafficSimulator.simulate_traffic")
+    def test_validate_rules_plan_probes_cidr_rule(self, mock_simulate_traffic):
+        """
+        Test that planned probing reports a rule whose source excludes the probe address.
+        """
+        mock_simulate_traffic.return_value = "allowed"
+        rules = [
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 80, "action": "block",
+             "source": "10.0.0.0/8"},
+            {"rule_id": 2, "direction": "incoming", "protocol": "tcp", "port": 443, "action": "allow"}
+        ]
+        validator = RuleValidator(self.rule_file, plan_probes=True)
+
+        with patch.object(RuleValidator, "load_rules", return_value=rules):
+            results = validator.validate_rules()
+
+        self.assertIn(80, [call.args[1] for call in mock_simulate_traffic.call_args_list])
+        self.assertEqual([r["rule_id"] for r in results], [1, 2])
+        # Probes from 127.0.0.1 never meet rule 1, so the chain policy answers
+        self.assertEqual(results[0]["policy_action"], "allow")
+        self.assertEqual(results[0]["observed_action"], "allow")
+        self.assertEqual(results[1]["status"], "pass")
+
+    @patch("src.rule_validator.TrafficSimulator.simulate_traffic")
+    def test_validate_rules_plan_probes_wrong_upper_bound(self, mock_simulate_traffic):
+        """
+        Test that planned probing catches a live range whose upper bound differs from the rule.
+        """
+        # Live: tcp allowed on 1000-1500 instead of 1000-2000, udp blocked on 1000-2500 instead of 1000-2000
+        mock_simulate_traffic.side_effect = lambda protocol, port, direction: (
+            ("blocked" if 1501 <= port <= 2000 else "allowed") if protocol == "tcp"
+            else ("blocked" if 1000 <= port <= 2500 else "allowed")
+        )
+        rules = [
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": "1000-2000", "action": "allow"},
+            {"rule_id": 2, "direction": "incoming", "protocol": "udp", "port": "1000-2000", "action": "block"}
+        ]
+        validator = RuleValidator(self.rule_file, plan_probes=True)
+
+        with patch.object(RuleValidator, "load_rules", return_value=rules):
+            results = validator.validate_rules()
+
+        self.assertEqual([r["status"] for r in results], ["fail", "fail"])
+        self.assertEqual(results[0]["mismatched_ports"], ["1000-2000"])
+        self.assertEqual(results[1]["mismatched_ports"], ["2001"])
+
+    def test_validate_rules_capture_evidence(self):
+        """
+        Test that evidence captured for a probe is attached to the rule's result.
+        """
+        def simulate_traffic(protocol, port, direction, evidence=None):
+            evidence.update({"egress": True, "reply": None, "rtt_ms": None, "packets": 1,
+                             "summary": "probe sent, no reply captured"})
+            return "blocked"
+
+        validator = RuleValidator(self.rule_file, capture=MagicMock())
+        with patch.object(validator.simulator, "simulate_traffic", side_effect=simulate_traffic), \
+                patch.object(RuleValidator, "load_rules", return_value=[
+                    {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "block"}]):
+            results = validator.validate_rules()
+
+        self.assertEqual(results[0]["status"], "pass")
+        self.assertEqual(results[0]["evidence"]["summary"], "probe sent, no reply captured")
+        with self.assertRaises(ValueError):
+            RuleValidator(self.rule_file, namespaces=2, capture=MagicMock())
+
+    @patch("src.hit_attribution.FirewallManager.save_live_ruleset")
+    @patch("src.rule_validator.TrafficSimulator.simulate_traffic")
+    def test_validate_rules_attribute_hits(self, mock_simulate_traffic, mock_save_live_ruleset):
+        """
+        Test that counters are read once before and once after the batch and the matched rule is attached.
+        """
+        mock_simulate_traffic.return_value = "allowed"
+        mock_save_live_ruleset.side_effect = [
+            "*filter\n:INPUT ACCEPT [0:0]\n[4:240] -A INPUT -p tcp -m tcp --dport 22 -j DROP\nCOMMIT\n",
+            "*filter\n:INPUT ACCEPT [0:0]\n[5:300] -A INPUT -p tcp -m tcp --dport 22 -j DROP\nCOMMIT\n"
+        ]
+        validator = RuleValidator(self.rule_file, attribute_hits=True)
+        with patch.object(RuleValidator, "load_rules", return_value=[
+                {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "block"}]):
+            results = validator.validate_rules()
+
+        self.assertEqual(mock_save_live_ruleset.call_count, 2)
+        self.assertEqual(results[0]["status"], "fail")
+        self.assertEqual(results[0]["matched_rule"]["summary"], "INPUT #1 (rule 1): 1 packets, 60 bytes for 1 probes")
+        with self.assertRaises(ValueError):
+            RuleValidator(self.rule_file, dry_run=True, attribute_hits=True)
+
+    @patch("src.rule_validator.TrafficSimulator.simulate_traffic")
+    def test_policy_compiled_for_probe_address(self, mock_simulate_traffic):
+        """
+        Test that rules limited to other networks do not decide the expected action of host probes.
+        """
+        validator = RuleValidator(self.rule_file, dry_run=True)
+
+        with patch.object(RuleValidator, "load_rules", return_value=[
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "block",
+             "source": "10.0.0.0/8"},
+            {"rule_id": 2, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "allow"}
+        ]):
+            results = validator.validate_rules()
+
+        # Probes from 127.0.0.1 skip rule 1, live as well as in the compiled policy
+        self.assertEqual([result["policy_action"] for result in results], ["allow", "allow"])
+        self.assertEqual(results[1]["status"], "pass")
+
+    def test_namespaces_require_hping3(self):
+        """
+        Test that namespace sandboxes reject the raw probe backend.
+        """
+        with self.assertRaises(ValueError):
+            RuleValidator(self.rule_file, probe_backend="raw", namespaces=2)
+
+    def test_invalid_max_in_flight(self):
+        """
+        Test that a non-positive probe limit is rejected.
+        """
+        with self.assertRaises(ValueError):
+            RuleValidator(self.rule_file, max_in_flight=0)
+
+    def test_prepared_rules_reused_until_file_changes(self):
+        """
+        Test that a long-lived validator parses and compiles the rules again only after the file changes.
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            rule_file = os.path.join(tmpdir, "rules.json")
+            with open(rule_file, "w") as file:
+                file.write('[{"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "allow"}]')
+            validator = RuleValidator(rule_file, dry_run=True)
+
+            with patch.object(RuleValidator, "load_rules", wraps=validator.load_rules) as mock_load_rules:
+                validator.validate_rules()
+                validator.validate_rules()
+                self.assertEqual(mock_load_rules.call_count, 1)
+
+                with open(rule_file, "w") as file:
+                    file.write('[{"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "block"},'
+                               ' {"rule_id": 2, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "allow"}]')
+                results = validator.validate_rules()
+
+        self.assertEqual(mock_load_rules.call_count, 2)
+        self.assertEqual([result["status"] for result in results], ["pass", "fail"])
+
+    @patch("src.rule_validator.TrafficSimulator.simulate_traffic")
+    def test_revalidate_rules_probes_changed_rules_only(self, mock_simulate_traffic):
+        """
+        Test that revalidation probes only added or modified rules and recomputes policy actions for all.
+        """
+        mock_simulate_traffic.return_value = "allowed"
+        rules = [
+            {"rule_id": 1, "direction": "incoming", "protocol": "tcp", "port": 22, "action": "allow"},
+            {"rule_id": 2, "direction": "incoming", "protocol": "tcp", "port": 80, "action": "allow"}
+        ]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            rule_file = os.path.join(tmpdir, "rules.json")
+            with open(rule_file, "w") as file:
+                json.dump(rules, file)
+            validator = RuleValidator(rule_file)
+            _, probed = validator.revalidate_rules()
+            self.assertEqual((probed, mock_simulate_traffic.call_count), ([1, 2], 2))
+
+            # Rule 3 is new and shadows rule 2; rule 1 is unchanged
+            rules.insert(1, {"rule_id": 3, "direction": "incoming", "protocol": "tcp", "port": "80-90",
+                             "action": "block"})
+            with open(rule_file, "w") as file:
+                json.dump(rules, file, indent=2)
+            results, probed = validator.revalidate_rules()
+
+        self.assertEqual(probed, [3])
+        self.assertEqual(mock_simulate_traffic.call_count, 3)
+        self.assertEqual([result["policy_action"] for result in results], ["allow", "block", "block"])
+        self.assertEqual([result["observed_action"] for result in results], ["allow", "allow", "allow"])
+
     def test_load_rules(self):
         """
         Test load_rules to ensure it reads and parses the rules file correctly.
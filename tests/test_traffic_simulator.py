@@ -13,7 +13,11 @@
 # You should have received a copy of the GNU General Public License
 # along with Automated Firewall Rule Tester. If not, see <https://www.gnu.org/licenses/>.
 import unittest
+import subprocess
+import threading
+import time
 from unittest.mock import patch, MagicMock
+from src.adaptive_timeout import AdaptiveTimeout
 from src.traffic_simulator import TrafficSimulator
 
 class TestTrafficSimulator(unittest.TestCase):
@@ -51,6 +55,15 @@ class TestTrafficSimulator(unittest.TestCase):
             "sudo hping3 127.0.0.1 -S -p 22 -c 1", shell=True, capture_output=True, text=True
         )
 
+    @patch("src.traffic_simulator.subprocess.run")
+    def test_simulate_traffic_tcp_reset(self, mock_subprocess):
+        """
+        Test that a TCP reset counts as allowed, as in the raw backend.
+        """
+        for stdout in ("len=40 ip=127.0.0.1 flags=RA seq=0", "len=40 ip=127.0.0.1 flags=R seq=0"):
+            mock_subprocess.return_value = MagicMock(stdout=stdout, stderr="")
+            self.assertEqual(self.simulator.simulate_traffic("tcp", 23, "incoming"), "allowed")
+
     @patch("src.traffic_simulator.subprocess.run")
     def test_simulate_traffic_udp_allowed(self, mock_subprocess):
         """
@@ -81,5 +94,119 @@ class TestTrafficSimulator(unittest.TestCase):
             "sudo hping3 -c 1 -s 53 127.0.0.1 --udp", shell=True, capture_output=True, text=True
         )
 
+    @patch("src.traffic_simulator.RawProbeEngine")
+    def test_simulate_traffic_raw_backend(self, mock_engine_class):
+        """
+        Test that the raw backend reuses one engine and never spawns hping3.
+        """
+        mock_engine = mock_engine_class.return_value
+        mock_engine.probe.return_value = "allowed"
+        mock_engine.probe_batch.return_value = ["allowed", "blocked"]
+        simulator = TrafficSimulator(backend="raw")
+
+        with patch("src.traffic_simulator.subprocess.run") as mock_subprocess:
+            self.assertEqual(simulator.simulate_traffic("tcp", 22, "incoming"), "allowed")
+            results = simulator.simulate_batch([("tcp", 22, "incoming"), ("udp", 53, "outgoing")])
+            mock_subprocess.assert_not_called()
+
+        self.assertEqual(results, ["allowed", "blocked"])
+        mock_engine_class.assert_called_once()
+        mock_engine.start.assert_called_once()
+
+    @patch("src.traffic_simulator.RawProbeEngine")
+    def test_raw_engine_started_once_across_threads(self, mock_engine_class):
+        """
+        Test that threads probing at the same time share a single raw engine.
+        """
+        mock_engine_class.return_value.start.side_effect = lambda: time.sleep(0.05)
+        simulator = TrafficSimulator(backend="raw")
+
+        threads = [threading.Thread(target=simulator._get_engine) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        mock_engine_class.assert_called_once()
+        simulator.close()
+        mock_engine_class.return_value.close.assert_called_once()
+        self.assertIsNone(simulator.engine)
+
+    @patch("src.traffic_simulator.subprocess.run")
+    def test_simulate_traffic_routes(self, mock_subprocess):
+        """
+        Test that routed probes run hping3 inside the namespace for their direction.
+        """
+        mock_subprocess.return_value = MagicMock(stdout="flags=SA", stderr="")
+        simulator = TrafficSimulator(routes={"incoming": ("client", "10.200.0.1"),
+                                             "outgoing": ("firewall", "10.200.0.2")})
+
+        simulator.simulate_traffic("tcp", 22, "incoming")
+        simulator.simulate_traffic("udp", 53, "outgoing")
+
+        commands = [call.args[0] for call in mock_subprocess.call_args_list]
+        self.assertEqual(commands, [
+            "sudo ip netns exec client hping3 10.200.0.1 -S -p 22 -c 1",
+            "sudo ip netns exec firewall hping3 -c 1 -s 53 10.200.0.2 --udp"
+        ])
+
+    @patch("src.traffic_simulator.os.killpg")
+    @patch("src.traffic_simulator.subprocess.Popen")
+    def test_simulate_traffic_adaptive(self, mock_popen, mock_killpg):
+        """
+        Test that replies return at once and silence is retried under the learned deadline.
+        """
+        timing = AdaptiveTimeout(retries=1, min_samples=1)
+        timing.record(("sudo", "127.0.0.1"), 0.002)
+        simulator = TrafficSimulator(timing=timing)
+
+        reply = MagicMock(pid=100)
+        reply.communicate.return_value = ("len=46 ip=127.0.0.1 flags=RA seq=0", "")
+        silent = MagicMock(pid=101)
+        silent.communicate.side_effect = [subprocess.TimeoutExpired("hping3", 0.01), ("", "")] * 2
+        mock_popen.side_effect = [reply, silent, silent]
+
+        # A reset is a definitive answer: no retry
+        self.assertEqual(simulator.simulate_traffic("tcp", 23, "incoming"), "allowed")
+        self.assertEqual(mock_popen.call_count, 1)
+
+        # Silence is retried once with a doubled deadline, then counts as blocked
+        self.assertEqual(simulator.simulate_traffic("tcp", 24, "incoming"), "blocked")
+        self.assertEqual(mock_popen.call_count, 3)
+        deadlines = [c.kwargs["timeout"] for c in silent.communicate.call_args_list if "timeout" in c.kwargs]
+        self.assertEqual(len(deadlines), 2)
+        self.assertLess(deadlines[0], 1.0)
+        self.assertAlmostEqual(deadlines[1], 2 * deadlines[0])
+        self.assertEqual(mock_killpg.call_count, 2)
+
+    @patch("src.traffic_simulator.subprocess.run")
+    def test_simulate_traffic_capture(self, mock_subprocess):
+        """
+        Test that hping3 probes are matched to captured packets by the port under test.
+        """
+        mock_subprocess.return_value = MagicMock(stdout="flags=SA")
+        capture = MagicMock()
+        capture.finish.return_value = {"egress": True, "reply": "syn-ack", "rtt_ms": 0.1, "packets": 2,
+                                       "summary": "syn-ack reply captured after 0.1 ms"}
+        simulator = TrafficSimulator(capture=capture)
+
+        evidence = {}
+        self.assertEqual(simulator.simulate_traffic("tcp", 22, "incoming", evidence), "allowed")
+        simulator.simulate_traffic("udp", 53, "outgoing", {})
+
+        self.assertEqual(evidence["reply"], "syn-ack")
+        capture.watch.assert_any_call("tcp", dport=22)
+        capture.watch.assert_any_call("udp", sport=53)
+        capture.finish.assert_any_call(capture.watch.return_value, replied=True)
+        with self.assertRaises(ValueError):
+            TrafficSimulator(routes={"incoming": ("ns", "10.0.0.1")}, capture=capture)
+
+    def test_unsupported_backend(self):
+        """
+        Test that an unknown backend is rejected.
+        """
+        with self.assertRaises(ValueError):
+            TrafficSimulator(backend="scapy")
+
 if __name__ == "__main__":
     unittest.main()